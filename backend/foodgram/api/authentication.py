@@ -0,0 +1,85 @@
+"""Token authentication with a per-worker cache of token owners.
+
+The `Authorization: Token <key>` header is unchanged; only the lookup
+of the key is cached. Every entry is checked against the owner's 'auth'
+version stamp, which recipes.signals bumps when a token is deleted
+(djoser logout included) and when the user is saved, e.g. with a new
+password or `is_active=False`. Entries also expire after
+AUTH_TOKEN_CACHE_TIMEOUT seconds and the least recently used ones are
+evicted above AUTH_TOKEN_CACHE_SIZE. Stamps must be shared by all
+workers, so the settings keep the cache off with LocMemCache.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from rest_framework.authentication import TokenAuthentication
+
+from recipes.versions import AUTH, get_version
+
+
+class TokenCache:
+    """LRU map of token key to (user, token, owner's stamp, expiry)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+        user, token, stamp, expires = entry
+        if expires <= time.monotonic() or stamp != get_version(
+                AUTH.format(user.id)):
+            self.discard(key)
+            return None
+        return user, token
+
+    def set(self, key, user, token, stamp):
+        expires = time.monotonic() + settings.AUTH_TOKEN_CACHE_TIMEOUT
+        with self._lock:
+            self._entries[key] = (user, token, stamp, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > settings.AUTH_TOKEN_CACHE_SIZE:
+                self._entries.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+token_cache = TokenCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+
+    def authenticate_credentials(self, key):
+        if not settings.AUTH_TOKEN_CACHE_TIMEOUT:
+            return super(
+                CachedTokenAuthentication, self).authenticate_credentials(key)
+        cached = token_cache.get(key)
+        if cached is None:
+            started = time.time()
+            user, token = super(
+                CachedTokenAuthentication, self).authenticate_credentials(key)
+            stamp = get_version(AUTH.format(user.id))
+            # A change committed after the rows were read has a newer
+            # stamp; such rows are used for this request only.
+            if stamp < started:
+                token_cache.set(key, user, token, stamp)
+            return user, token
+        user, token = cached
+        # Requests may set attributes on their user.
+        return copy.copy(user), token
@@ -0,0 +1,67 @@
+import bisect
+import threading
+
+from recipes import replicas
+from recipes.models import Ingredient
+from recipes.versions import get_version
+
+
+class IngredientIndex:
+    """Per-worker in-memory index of the ingredient catalogue.
+
+    Names are case-folded once when the index is built. Lookups run
+    against the folded names and do not touch the database until the
+    'ingredients' version stamp changes.
+    """
+
+    version_name = 'ingredients'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._data = ((), (), ())
+
+    def _get_data(self):
+        version = get_version(self.version_name)
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    with replicas.primary():
+                        ingredients = list(
+                            Ingredient.objects.order_by('id'))
+                    by_name = sorted(
+                        ingredients,
+                        key=lambda item: (item.name.casefold(), item.id))
+                    self._data = (
+                        ingredients,
+                        by_name,
+                        [item.name.casefold() for item in by_name])
+                    self._version = version
+        return self._data
+
+    def all(self):
+        return list(self._get_data()[0])
+
+    def search(self, name, limit=None):
+        """Return ingredients whose name starts with `name`,
+        then those that contain it elsewhere.
+        """
+        _, items, keys = self._get_data()
+        name = name.casefold()
+        found = []
+        start = bisect.bisect_left(keys, name)
+        for idx in range(start, len(keys)):
+            if limit is not None and len(found) >= limit:
+                return found
+            if not keys[idx].startswith(name):
+                break
+            found.append(items[idx])
+        for key, item in zip(keys, items):
+            if limit is not None and len(found) >= limit:
+                break
+            if name in key and not key.startswith(name):
+                found.append(item)
+        return found
+
+
+ingredient_index = IngredientIndex()
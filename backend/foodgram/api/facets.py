@@ -0,0 +1,59 @@
+"""Per-tag recipe counts for the recipe list (`?facets=tags`).
+
+Counts are taken over the list's current filters except the tag
+filter itself, so each count is what selecting that tag would return,
+with one grouped query. Results may be kept for a few seconds in the
+cache (RECIPE_FACETS_CACHE_TIMEOUT).
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+
+from api.filters import RecipeFilterSet
+from recipes.models import RecipeTag
+
+KEY = 'facets:tags:{}'
+# Parameters that do not change the set of counted recipes.
+IGNORED_PARAMS = {
+    'tags', 'tags_mode', 'facets', 'page', 'limit', 'cursor', 'pagination'}
+# Filters whose result depends on the requesting user.
+PERSONAL_PARAMS = {'is_favorited', 'is_in_shopping_cart'}
+
+
+def cache_key(request):
+    params = sorted(
+        (key, value)
+        for key, values in request.query_params.lists()
+        if key not in IGNORED_PARAMS
+        for value in values)
+    user = ''
+    if PERSONAL_PARAMS & {key for key, _ in params}:
+        user = request.user.id or ''
+    digest = hashlib.sha1(repr((user, params)).encode()).hexdigest()
+    return KEY.format(digest)
+
+
+def count_tags(request, queryset):
+    data = request.query_params.copy()
+    for key in ('tags', 'tags_mode'):
+        data.pop(key, None)
+    recipes = RecipeFilterSet(
+        data=data, queryset=queryset, request=request).qs
+    return dict(RecipeTag.objects.filter(
+        recipe_id__in=recipes.order_by().values('id')).values_list(
+            'tag__slug').annotate(count=Count('id')).order_by('tag__slug'))
+
+
+def tag_facets(request, queryset):
+    """{tag slug: recipe count}; tags without recipes are left out."""
+    timeout = settings.RECIPE_FACETS_CACHE_TIMEOUT
+    if not timeout:
+        return count_tags(request, queryset)
+    key = cache_key(request)
+    counts = cache.get(key)
+    if counts is None:
+        counts = count_tags(request, queryset)
+        cache.set(key, counts, timeout)
+    return counts
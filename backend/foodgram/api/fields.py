@@ -0,0 +1,72 @@
+from collections import Counter
+
+from django.core.files.storage import default_storage
+from rest_framework import serializers
+
+from recipes import images
+
+
+def resolve_ids(queryset, ids, allow_duplicates=False):
+    """Resolve primary keys with one IN query, keeping their order.
+
+    Every missing and duplicate id is reported in a single
+    ValidationError.
+    """
+    errors = {}
+    if not allow_duplicates:
+        duplicates = sorted(
+            pk for pk, count in Counter(ids).items() if count > 1)
+        if duplicates:
+            errors['duplicates'] = duplicates
+    objects = queryset.in_bulk(set(ids)) if ids else {}
+    missing = sorted(set(ids) - set(objects))
+    if missing:
+        errors['missing'] = missing
+    if errors:
+        raise serializers.ValidationError(errors)
+    return [objects[pk] for pk in ids]
+
+
+class BulkPrimaryKeyRelatedField(serializers.ListField):
+    """List of primary keys resolved to objects with a single query.
+
+    Unlike PrimaryKeyRelatedField(many=True) it does not look every
+    item up separately.
+    """
+
+    def __init__(self, queryset, allow_duplicates=False, **kwargs):
+        kwargs.setdefault('child', serializers.IntegerField(min_value=1))
+        super(BulkPrimaryKeyRelatedField, self).__init__(**kwargs)
+        self.queryset = queryset
+        self.allow_duplicates = allow_duplicates
+
+    def to_internal_value(self, data):
+        ids = super(BulkPrimaryKeyRelatedField, self).to_internal_value(data)
+        return resolve_ids(self.queryset.all(), ids, self.allow_duplicates)
+
+    def to_representation(self, value):
+        return [obj.pk for obj in value]
+
+
+class ImageVariantsField(serializers.Field):
+    """Absolute URLs of the recipe's image variants by size and format.
+
+    Empty until the variants have been built.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super(ImageVariantsField, self).__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        request = self.context.get('request')
+        result = {}
+        for size, formats in images.variants_of(recipe).items():
+            result[size] = {}
+            for file_format, name in formats.items():
+                url = default_storage.url(name)
+                if request is not None:
+                    url = request.build_absolute_uri(url)
+                result[size][file_format] = url
+        return result
@@ -1,8 +1,19 @@
+from django.db.models import Exists, OuterRef
 from django_filters import rest_framework as filters
 
-from recipes.models import Recipe, Tag
+from recipes import membership
+from recipes.models import Recipe, RecipeTag, Tag
+from recipes.search import search_recipes
 
 BOOLEAN_CHOICES = (('0', 'False'), ('1', 'True'),)
+TAGS_MODE_CHOICES = (('any', 'any'), ('all', 'all'),)
+MEMBERSHIP = {
+    'favorite_recipe': 'favorites',
+    'shopping_recipe': 'cart',
+}
+# Sets larger than this are filtered with a subquery instead of a list of
+# query parameters.
+MEMBERSHIP_IN_LIMIT = 500
 
 
 class RecipeFilterSet(filters.FilterSet):
@@ -26,15 +37,52 @@ class RecipeFilterSet(filters.FilterSet):
         field_name='tags__slug',
         to_field_name='slug',
         label='tags',
-        queryset=Tag.objects.all())
+        queryset=Tag.objects.all(),
+        method='filter_tags')
+    tags_mode = filters.ChoiceFilter(
+        choices=TAGS_MODE_CHOICES,
+        method='filter_nothing')
+    search = filters.CharFilter(
+        method='filter_search')
+
+    def filter_tags(self, queryset, name, value):
+        """Recipes with any (default) or all of the tags.
+
+        Each tag is checked with an EXISTS semi-join, so a recipe is
+        never repeated and the page COUNT stays over recipes only.
+        """
+        tag_ids = {tag.id for tag in value}
+        if not tag_ids:
+            return queryset
+        if self.form.cleaned_data.get('tags_mode') == 'all':
+            groups = [[tag_id] for tag_id in sorted(tag_ids)]
+        else:
+            groups = [sorted(tag_ids)]
+        for idx, group in enumerate(groups):
+            name = f'has_tags_{idx}'
+            queryset = queryset.annotate(**{name: Exists(
+                RecipeTag.objects.filter(
+                    recipe=OuterRef('pk'), tag_id__in=group))}).filter(
+                        **{name: True})
+        return queryset
+
+    def filter_nothing(self, queryset, name, value):
+        return queryset
+
+    def filter_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
 
     def filter_add(self, queryset, name, value):
         if not self.request.user.is_anonymous:
-            user = self.request.user
+            ids = getattr(
+                membership.for_request(self.request), MEMBERSHIP[name])
+            if len(ids) > MEMBERSHIP_IN_LIMIT:
+                ids = membership.members(
+                    self.request.user.id, MEMBERSHIP[name])
             if value == '1':
-                return queryset.filter(**{f'{name}__user': user})
+                return queryset.filter(id__in=ids)
             else:
-                return queryset.exclude(**{f'{name}__user': user})
+                return queryset.exclude(id__in=ids)
         return queryset
 
     class Meta:
@@ -0,0 +1,240 @@
+"""Per-request performance instrumentation.
+
+api.middleware.RequestMetricsMiddleware measures a sample of requests
+(REQUEST_METRICS_SAMPLE_RATE): the number and total time of SQL
+queries on every database connection, the time spent in serializers'
+to_representation() and the time of the whole view. The numbers go to a
+Server-Timing header, to one JSON log line of the 'api.requests' logger
+and to per-route histograms. Requests slower than REQUEST_METRICS_SLOW_MS
+are logged with all of their SQL.
+
+Histograms are kept per worker and copied to the Django cache at most
+every REQUEST_METRICS_FLUSH_INTERVAL seconds; render_metrics() adds up
+the copies of all workers.
+"""
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+
+from api import response_cache
+
+logger = logging.getLogger('api.requests')
+
+HISTOGRAMS = {
+    'foodgram_request_duration_seconds': (
+        'Time of the whole request by route.',
+        (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)),
+    'foodgram_request_queries': (
+        'SQL queries per request by route.',
+        (0, 1, 2, 3, 5, 10, 20, 50, 100)),
+}
+WORKERS_KEY = 'metrics:workers'
+WORKER_KEY = 'metrics:worker:{}'
+# Copies of workers that stopped serving requests expire after a day.
+WORKER_TIMEOUT = 24 * 60 * 60
+
+_current = ContextVar('request_timings', default=None)
+
+
+class RequestTimings:
+    """What one request spent, in seconds."""
+
+    def __init__(self):
+        self.queries = []
+        self.sql_time = 0.0
+        self.serializer_time = 0.0
+        self.view_time = 0.0
+        self.serializing = False
+
+    def execute(self, execute, sql, params, many, context):
+        """connection.execute_wrapper() callback."""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.sql_time += duration
+            self.queries.append((sql, duration))
+
+    def server_timing(self):
+        return (
+            f'db;dur={self.sql_time * 1000:.1f};'
+            f'desc="{len(self.queries)} queries", '
+            f'serializer;dur={self.serializer_time * 1000:.1f}, '
+            f'view;dur={self.view_time * 1000:.1f}')
+
+
+def start(timings):
+    return _current.set(timings)
+
+
+def stop(token):
+    _current.reset(token)
+
+
+class TimedRepresentationMixin:
+    """Count to_representation() in the request's serializer time.
+
+    Only the outermost call is timed, so nested serializers are not
+    counted twice.
+    """
+
+    def to_representation(self, instance):
+        timings = _current.get()
+        if timings is None or timings.serializing:
+            return super(
+                TimedRepresentationMixin, self).to_representation(instance)
+        timings.serializing = True
+        started = time.perf_counter()
+        try:
+            return super(
+                TimedRepresentationMixin, self).to_representation(instance)
+        finally:
+            timings.serializer_time += time.perf_counter() - started
+            timings.serializing = False
+
+
+def route_of(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.route.lstrip('^').rstrip('$')
+
+
+class Registry:
+    """Histograms of this worker.
+
+    A series is [count per bucket..., count above the last bucket, sum]
+    keyed by (method, route).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {name: {} for name in HISTOGRAMS}
+        self._flushed = time.monotonic()
+
+    def observe(self, name, labels, value):
+        buckets = HISTOGRAMS[name][1]
+        with self._lock:
+            series = self._series[name].get(labels)
+            if series is None:
+                series = self._series[name][labels] = [0] * (
+                    len(buckets) + 2)
+            series[bisect.bisect_left(buckets, value)] += 1
+            series[-1] += value
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                name: {labels: list(series)
+                       for labels, series in items.items()}
+                for name, items in self._series.items()}
+
+    def flush(self):
+        """Copy the histograms of this worker to the cache."""
+        self._flushed = time.monotonic()
+        pid = os.getpid()
+        cache.set(WORKER_KEY.format(pid), self.snapshot(), WORKER_TIMEOUT)
+        workers = cache.get(WORKERS_KEY) or []
+        if pid not in workers:
+            cache.set(WORKERS_KEY, workers + [pid], None)
+
+    def maybe_flush(self):
+        if (time.monotonic() - self._flushed
+                >= settings.REQUEST_METRICS_FLUSH_INTERVAL):
+            self.flush()
+
+    def collect(self):
+        """Histograms of all workers added up."""
+        self.flush()
+        workers = cache.get(WORKERS_KEY) or []
+        snapshots = cache.get_many(
+            [WORKER_KEY.format(pid) for pid in workers])
+        alive = [pid for pid in workers
+                 if WORKER_KEY.format(pid) in snapshots]
+        if alive != workers:
+            cache.set(WORKERS_KEY, alive, None)
+        total = {name: {} for name in HISTOGRAMS}
+        for snapshot in snapshots.values():
+            for name, items in snapshot.items():
+                for labels, series in items.items():
+                    summed = total[name].setdefault(labels, [0] * len(series))
+                    for idx, value in enumerate(series):
+                        summed[idx] += value
+        return total
+
+
+registry = Registry()
+
+
+def finish(request, response, timings):
+    """Report the timings of a finished request."""
+    response['Server-Timing'] = timings.server_timing()
+    route = route_of(request)
+    line = {
+        'method': request.method,
+        'route': route,
+        'path': request.path,
+        'status': response.status_code,
+        'queries': len(timings.queries),
+        'sql_ms': round(timings.sql_time * 1000, 1),
+        'serializer_ms': round(timings.serializer_time * 1000, 1),
+        'view_ms': round(timings.view_time * 1000, 1),
+    }
+    if timings.view_time * 1000 >= settings.REQUEST_METRICS_SLOW_MS:
+        line['sql'] = [
+            {'sql': sql, 'ms': round(duration * 1000, 1)}
+            for sql, duration in timings.queries]
+        logger.warning(json.dumps(line, ensure_ascii=False))
+    else:
+        logger.info(json.dumps(line, ensure_ascii=False))
+    labels = (request.method, route)
+    registry.observe(
+        'foodgram_request_duration_seconds', labels, timings.view_time)
+    registry.observe(
+        'foodgram_request_queries', labels, len(timings.queries))
+    registry.maybe_flush()
+
+
+def escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace(
+        '\n', '\\n')
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_metrics():
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for name, items in sorted(registry.collect().items()):
+        description, buckets = HISTOGRAMS[name]
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} histogram')
+        for (method, route), series in sorted(items.items()):
+            labels = f'method="{escape(method)}",route="{escape(route)}"'
+            cumulative = 0
+            for bound, count in zip(
+                    [format_value(bound) for bound in buckets] + ['+Inf'],
+                    series[:-1]):
+                cumulative += count
+                lines.append(
+                    f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_sum{{{labels}}} {format_value(series[-1])}')
+            lines.append(f'{name}_count{{{labels}}} {cumulative}')
+    name = 'foodgram_anonymous_cache_requests_total'
+    lines.append(
+        f'# HELP {name} Anonymous recipe responses by cache result.')
+    lines.append(f'# TYPE {name} counter')
+    stats = response_cache.stats()
+    lines.append(f'{name}{{result="hit"}} {stats["hits"]}')
+    lines.append(f'{name}{{result="miss"}} {stats["misses"]}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,52 @@
+import random
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from rest_framework.permissions import SAFE_METHODS
+
+from api import instrumentation
+from recipes import replicas
+
+
+class RequestMetricsMiddleware:
+    """Measure a sample of requests, see api.instrumentation."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if random.random() >= settings.REQUEST_METRICS_SAMPLE_RATE:
+            return self.get_response(request)
+        timings = instrumentation.RequestTimings()
+        token = instrumentation.start(timings)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(timings.execute))
+                response = self.get_response(request)
+        finally:
+            instrumentation.stop(token)
+        timings.view_time = time.perf_counter() - started
+        instrumentation.finish(request, response, timings)
+        return response
+
+
+class PrimaryAfterWriteMiddleware:
+    """Pin users to the primary database after a successful write."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        # DRF sets the user it authenticated on the Django request.
+        user = getattr(request, 'user', None)
+        if (request.method not in SAFE_METHODS
+                and response.status_code < 400
+                and user is not None and not user.is_anonymous):
+            replicas.pin(user.id)
+        return response
@@ -0,0 +1,199 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import Http404, HttpResponse, HttpResponseNotModified
+from django.utils.http import http_date, parse_http_date_safe
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from api import response_cache
+from recipes import replicas
+from recipes.versions import get_version
+
+
+class ReferenceDataMixin:
+    """Conditional GET and a per-worker response cache for reference data.
+
+    ETag and Last-Modified are derived from the `version_name` stamp,
+    which changes only when the underlying rows change. Matching
+    If-None-Match / If-Modified-Since requests get a 304 before any
+    response is built; other requests are answered with the serialized
+    bytes kept in this worker since the last change. Without a shared
+    cache the stamp costs one query, see recipes.versions.
+    """
+
+    version_name = None
+    response_cache_size = 512
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._responses = OrderedDict()
+        cls._responses_lock = threading.Lock()
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            super(ReferenceDataMixin, self).list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            super(ReferenceDataMixin, self).retrieve,
+            request, *args, **kwargs)
+
+    def get_etag(self, request, version):
+        digest = hashlib.sha1(
+            f'{version!r}|{request.get_full_path()}'.encode()).hexdigest()
+        return f'"{self.version_name}-{digest[:20]}"'
+
+    def is_not_modified(self, request, etag, version):
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match is not None:
+            return (if_none_match.strip() == '*'
+                    or etag in [tag.strip()
+                                for tag in if_none_match.split(',')])
+        if_modified_since = parse_http_date_safe(
+            request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+        return (if_modified_since is not None
+                and int(version) <= if_modified_since)
+
+    def set_validators(self, response, etag, version):
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(version)
+        response['Cache-Control'] = (
+            f'public, max-age={settings.REFERENCE_DATA_MAX_AGE}')
+        return response
+
+    def conditional_response(self, handler, request, *args, **kwargs):
+        version = get_version(self.version_name)
+        etag = self.get_etag(request, version)
+        if self.is_not_modified(request, etag, version):
+            return self.set_validators(
+                HttpResponseNotModified(), etag, version)
+        key = request.get_full_path()
+        cached = self._responses.get(key)
+        if cached is not None and cached[0] == version:
+            content = cached[1]
+            with self._responses_lock:
+                if key in self._responses:
+                    self._responses.move_to_end(key)
+        else:
+            with replicas.primary():
+                response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            content = JSONRenderer().render(response.data)
+            with self._responses_lock:
+                self._responses[key] = (version, content)
+                self._responses.move_to_end(key)
+                while len(self._responses) > self.response_cache_size:
+                    self._responses.popitem(last=False)
+        return self.set_validators(
+            HttpResponse(content, content_type='application/json'),
+            etag, version)
+
+
+class AnonymousCacheMixin:
+    """Serve anonymous list and detail GETs from api.response_cache.
+
+    Responses carry an X-Cache header, HIT when nothing was read from
+    the database to build them.
+    """
+
+    def list(self, request, *args, **kwargs):
+        if not response_cache.is_cacheable(request):
+            return super(AnonymousCacheMixin, self).list(
+                request, *args, **kwargs)
+        version = response_cache.list_version()
+        key = response_cache.page_key(request)
+        page = cache.get(key)
+        missed = page is None or page['version'] != version
+        if missed:
+            with replicas.primary():
+                page = self.page_of_ids(request)
+            page['version'] = version
+            cache.set(key, page, settings.ANONYMOUS_CACHE_TIMEOUT)
+        # Recipes of a missed page are read through the per-recipe
+        # entries, so the page also primes their detail responses.
+        results, hit = self.cached_recipes(page['ids'])
+        return self.mark(Response(OrderedDict([
+            ('count', page['count']),
+            ('next', page['next']),
+            ('previous', page['previous']),
+            ('results', results),
+        ])), hit and not missed)
+
+    def page_of_ids(self, request):
+        """Count, links and recipe ids of the requested page."""
+        queryset = self.filter_queryset(self.get_queryset())
+        ids = list(self.paginator.paginate_queryset(
+            queryset.values_list('id', flat=True), request, view=self))
+        response = self.paginator.get_paginated_response([])
+        return {
+            'count': response.data['count'],
+            'next': response.data['next'],
+            'previous': response.data['previous'],
+            'ids': ids,
+        }
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup = kwargs.get(self.lookup_url_kwarg or self.lookup_field)
+        if not (response_cache.is_cacheable(request)
+                and str(lookup).isdigit()):
+            return super(AnonymousCacheMixin, self).retrieve(
+                request, *args, **kwargs)
+        results, hit = self.cached_recipes([int(lookup)])
+        if not results:
+            raise Http404
+        return self.mark(Response(results[0]), hit)
+
+    def cached_recipes(self, recipe_ids):
+        """Serialized recipes in the given order, and whether all hit."""
+        keys = response_cache.recipe_keys(self.request, recipe_ids)
+        found = cache.get_many(list(keys.values()))
+        missing = [
+            recipe_id for recipe_id in recipe_ids
+            if keys[recipe_id] not in found]
+        if missing:
+            with replicas.primary():
+                recipes = self.prepare_page(
+                    list(self.get_queryset().filter(id__in=missing)))
+                fresh = {
+                    keys[recipe['id']]: recipe
+                    for recipe in self.get_serializer(
+                        recipes, many=True).data}
+            cache.set_many(fresh, settings.ANONYMOUS_CACHE_TIMEOUT)
+            found.update(fresh)
+        return [
+            found[keys[recipe_id]] for recipe_id in recipe_ids
+            if keys[recipe_id] in found], not missing
+
+    def prepare_page(self, objects):
+        """Hook to load what serializing the objects needs in bulk."""
+        return objects
+
+    def mark(self, response, hit):
+        response_cache.record(hit)
+        response['X-Cache'] = 'HIT' if hit else 'MISS'
+        return response
+
+
+class ReplicaReadMixin:
+    """Serve safe requests from a read replica, see recipes.replicas."""
+
+    def initial(self, request, *args, **kwargs):
+        self._replica_token = None
+        super(ReplicaReadMixin, self).initial(request, *args, **kwargs)
+        if request.method in SAFE_METHODS:
+            alias = replicas.alias_for(request.user)
+            if alias is not None:
+                self._replica_token = replicas.start_reading(alias)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if getattr(self, '_replica_token', None) is not None:
+            replicas.stop_reading(self._replica_token)
+            self._replica_token = None
+        return super(ReplicaReadMixin, self).finalize_response(
+            request, response, *args, **kwargs)
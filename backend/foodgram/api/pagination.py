@@ -1,6 +1,79 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+from collections import OrderedDict
+
+from django.db import connections
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.response import Response
+
+
+def approximate_count(queryset):
+    """Row estimate of the PostgreSQL planner, exact count elsewhere."""
+    queryset = queryset.order_by()
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]['Plan']['Plan Rows']
+
+
+class ApiCursorPagination(CursorPagination):
+    """Keyset pagination over the view's `cursor_ordering`.
+
+    Keeps the page number response shape; `count` is only filled in
+    when `count=approximate` is requested.
+    """
+
+    page_size = 6
+    page_size_query_param = 'limit'
+    count_query_param = 'count'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.ordering = view.cursor_ordering
+        self.count = None
+        if request.query_params.get(self.count_query_param) == 'approximate':
+            self.count = approximate_count(queryset)
+        return super(ApiCursorPagination, self).paginate_queryset(
+            queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('count', self.count),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
 
 
 class ApiPagination(PageNumberPagination):
+    """Page number pagination with an opt-in cursor mode.
+
+    Views that define `cursor_ordering` switch to keyset pagination
+    when requested with `pagination=cursor`.
+    """
+
     page_size = 6
     page_size_query_param = 'limit'
+    mode_query_param = 'pagination'
+    cursor_class = ApiCursorPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor = None
+        if (getattr(view, 'cursor_ordering', None)
+                and (request.query_params.get(self.mode_query_param)
+                     == 'cursor'
+                     or self.cursor_class.cursor_query_param
+                     in request.query_params)):
+            self.cursor = self.cursor_class()
+            return self.cursor.paginate_queryset(queryset, request, view)
+        return super(ApiPagination, self).paginate_queryset(
+            queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor is not None:
+            return self.cursor.get_paginated_response(data)
+        return super(ApiPagination, self).get_paginated_response(data)
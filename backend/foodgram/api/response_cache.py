@@ -0,0 +1,87 @@
+"""Response cache of the recipe list and detail for anonymous users.
+
+Anonymous responses are the same for every guest, so they are cached
+in two layers under version stamps (recipes.versions):
+
+* a list page keeps only its recipe ids, count and links, valid while
+  the 'recipes' and 'tags' stamps are unchanged (a recipe was created,
+  deleted or retagged, or a tag changed);
+* every recipe is kept as its serialized dict, valid while its own
+  'recipe:<id>' stamp and the 'tags' and 'ingredients' stamps are
+  unchanged.
+
+Both hold absolute links and image URLs, so their keys include the
+scheme and host of the request.
+
+Stamps are always read before the database, so data read before a
+concurrent change is never stored under the stamp set after it.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+
+from recipes.versions import RECIPE, get_versions
+
+PAGE_KEY = 'anonymous:recipes:{}'
+RECIPE_KEY = 'anonymous:recipe:{}:{}:{}'
+STATS_KEY = 'anonymous:stats:{}'
+# Only these list parameters are cached, anything else bypasses the cache.
+CACHED_PARAMS = {'page', 'limit', 'tags', 'tags_mode', 'author'}
+
+
+def is_cacheable(request):
+    return (bool(settings.ANONYMOUS_CACHE_TIMEOUT)
+            and request.method == 'GET'
+            and request.user.is_anonymous
+            and set(request.query_params) <= CACHED_PARAMS)
+
+
+def origin(request):
+    return f'{request.scheme}://{request.get_host()}'
+
+
+def page_key(request):
+    params = sorted(
+        (key, sorted(request.query_params.getlist(key)))
+        for key in request.query_params)
+    digest = hashlib.sha1(
+        repr((origin(request), params)).encode()).hexdigest()
+    return PAGE_KEY.format(digest)
+
+
+def list_version():
+    versions = get_versions(['recipes', 'tags'])
+    return versions['recipes'], versions['tags']
+
+
+def recipe_keys(request, recipe_ids):
+    """{recipe id: cache key} for the current stamps of the recipes."""
+    digest = hashlib.sha1(origin(request).encode()).hexdigest()
+    versions = get_versions(
+        ['tags', 'ingredients']
+        + [RECIPE.format(recipe_id) for recipe_id in recipe_ids])
+    shared = f'{versions["tags"]}:{versions["ingredients"]}'
+    return {
+        recipe_id: RECIPE_KEY.format(
+            recipe_id,
+            digest,
+            f'{versions[RECIPE.format(recipe_id)]}:{shared}')
+        for recipe_id in recipe_ids}
+
+
+def record(hit):
+    key = STATS_KEY.format('hits' if hit else 'misses')
+    if not cache.add(key, 1, None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, 1, None)
+
+
+def stats():
+    counts = cache.get_many([STATS_KEY.format('hits'),
+                             STATS_KEY.format('misses')])
+    return {
+        'hits': counts.get(STATS_KEY.format('hits'), 0),
+        'misses': counts.get(STATS_KEY.format('misses'), 0)}
@@ -1,39 +1,56 @@
+import json
+import operator
+from collections import OrderedDict
+from functools import reduce
+
 from django.db import IntegrityError, transaction
-from django.db.models import Q
+from django.db.models import (Case, Prefetch, Q, TextField, Value, When,
+                              prefetch_related_objects)
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers, status
 
-from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                            RecipeTag, Shopping, Subscribe, Tag, User)
+from api import uploads
+from api.fields import (BulkPrimaryKeyRelatedField, ImageVariantsField,
+                        resolve_ids)
+from api.instrumentation import TimedRepresentationMixin
+from recipes import carts, documents, images, membership, replicas
+from recipes.models import (Ingredient, Recipe, RecipeIngredient, RecipeTag,
+                            ShoppingIngredient, Tag, User, UserCounter)
+from recipes.versions import RECIPE, bump_version, get_versions
 
 
-class RecipeSerializerReadSimple(serializers.ModelSerializer):
+class RecipeSerializerReadSimple(TimedRepresentationMixin,
+                                 serializers.ModelSerializer):
+    image_variants = ImageVariantsField()
 
     class Meta:
         fields = (
             'id',
             'name',
             'image',
+            'image_variants',
             'cooking_time')
         model = Recipe
         ordering = ['name']
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(TimedRepresentationMixin, serializers.ModelSerializer):
 
     class Meta:
         fields = ('id', 'name', 'color', 'slug')
         model = Tag
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(TimedRepresentationMixin,
+                           serializers.ModelSerializer):
 
     class Meta:
         fields = ('id', 'name', 'measurement_unit')
         model = Ingredient
 
 
-class RecipeIngredientSerializerRead(serializers.ModelSerializer):
+class RecipeIngredientSerializerRead(TimedRepresentationMixin,
+                                     serializers.ModelSerializer):
     id = serializers.SerializerMethodField()
     name = serializers.SerializerMethodField()
     measurement_unit = serializers.SerializerMethodField()
@@ -52,16 +69,24 @@ class RecipeIngredientSerializerRead(serializers.ModelSerializer):
         return obj.ingredient.measurement_unit
 
 
+class ShoppingIngredientSerializerRead(RecipeIngredientSerializerRead):
+
+    class Meta:
+        model = ShoppingIngredient
+        fields = ('id', 'name', 'measurement_unit', 'amount')
+
+
 class RecipeIngredientSerializer(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(
-        queryset=Ingredient.objects.all())
+    id = serializers.IntegerField(
+        min_value=1)
 
     class Meta:
         model = RecipeIngredient
         fields = ('id', 'amount')
 
 
-class UserSerializerRead(serializers.ModelSerializer):
+class UserSerializerRead(TimedRepresentationMixin,
+                         serializers.ModelSerializer):
     is_subscribed = serializers.SerializerMethodField()
 
     class Meta:
@@ -76,12 +101,8 @@ class UserSerializerRead(serializers.ModelSerializer):
         ordering = ['id']
 
     def get_is_subscribed(self, obj):
-        if not self.context['request'].user.is_anonymous:
-            return Subscribe.objects.filter(
-                author=obj,
-                subscriber=self.context['request'].user).exists()
-        else:
-            return False
+        return obj.id in membership.for_request(
+            self.context['request']).subscriptions
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -133,7 +154,8 @@ class UserSerializer(serializers.ModelSerializer):
         return user
 
 
-class FavoriteSerializerRead(serializers.ModelSerializer):
+class FavoriteSerializerRead(TimedRepresentationMixin,
+                             serializers.ModelSerializer):
 
     class Meta:
         fields = (
@@ -148,16 +170,28 @@ class ShoppingSerializerRead(FavoriteSerializerRead):
     pass
 
 
-class RecipeSerializerRead(serializers.ModelSerializer):
-    is_favorited = serializers.SerializerMethodField()
-    is_in_shopping_cart = serializers.SerializerMethodField()
+class AuthorSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        fields = (
+            'email',
+            'id',
+            'username',
+            'first_name',
+            'last_name')
+        model = User
+
+
+class RecipeDocumentSerializer(TimedRepresentationMixin,
+                               serializers.ModelSerializer):
+    """The part of a recipe's representation shared by all users."""
     tags = TagSerializer(
         many=True)
-    author = UserSerializerRead(many=False, read_only=True)
+    author = AuthorSerializer(many=False, read_only=True)
     ingredients = RecipeIngredientSerializerRead(
         many=True,
         source='recipe_ingredient_recipe',
-        read_only=False)
+        read_only=True)
 
     class Meta:
         fields = (
@@ -165,30 +199,121 @@ class RecipeSerializerRead(serializers.ModelSerializer):
             'tags',
             'author',
             'ingredients',
-            'is_favorited',
-            'is_in_shopping_cart',
             'name',
-            'image',
             'text',
             'cooking_time')
         model = Recipe
+
+
+def build_documents(recipes):
+    """Set the documents of the recipes with 3 queries."""
+    for recipe in recipes:
+        # Rows prefetched before a write would give an outdated document.
+        recipe._prefetched_objects_cache = {}
+    prefetch_related_objects(
+        recipes,
+        'author',
+        'tags',
+        Prefetch(
+            'recipe_ingredient_recipe',
+            queryset=RecipeIngredient.objects.select_related('ingredient')))
+    for recipe in recipes:
+        recipe.document = json.dumps(
+            RecipeDocumentSerializer(recipe).data, ensure_ascii=False)
+
+
+def refresh_documents(recipes):
+    """Build and store the documents of the recipes with 4 queries."""
+    if not recipes:
+        return
+    build_documents(recipes)
+    Recipe.objects.bulk_update(recipes, ['document'])
+
+
+def ensure_documents(recipes):
+    """Rebuild the stale documents among the recipes.
+
+    A read must not overwrite what a concurrent write stored: documents
+    are stored only while still empty, while the recipe's own columns
+    are those they were built from and when no stamp of the related
+    rows changed during the build.
+    """
+    stale = [recipe for recipe in recipes if not recipe.document]
+    if not stale:
+        return
+    names = ['tags', 'ingredients'] + [
+        RECIPE.format(recipe.id) for recipe in stale]
+    versions = get_versions(names)
+    with replicas.primary():
+        build_documents(stale)
+    if get_versions(names) != versions:
+        return
+    Recipe.objects.filter(
+        reduce(operator.or_, (
+            Q(id=recipe.id,
+              name=recipe.name,
+              text=recipe.text,
+              cooking_time=recipe.cooking_time,
+              author_id=recipe.author_id)
+            for recipe in stale)),
+        document='').update(document=Case(
+            *(When(id=recipe.id, then=Value(recipe.document))
+              for recipe in stale),
+            output_field=TextField()))
+
+
+class RecipeSerializerRead(TimedRepresentationMixin,
+                           serializers.ModelSerializer):
+    """The recipe's stored document with the per-user flags,
+    the favorites count and the image URLs spliced in.
+    """
+    is_favorited = serializers.SerializerMethodField()
+    is_in_shopping_cart = serializers.SerializerMethodField()
+    image_variants = ImageVariantsField()
+
+    representation_fields = (
+        'id',
+        'tags',
+        'author',
+        'ingredients',
+        'is_favorited',
+        'is_in_shopping_cart',
+        'favorites_count',
+        'name',
+        'image',
+        'image_variants',
+        'text',
+        'cooking_time')
+
+    class Meta:
+        fields = (
+            'id',
+            'is_favorited',
+            'is_in_shopping_cart',
+            'favorites_count',
+            'image',
+            'image_variants')
+        read_only_fields = ('favorites_count',)
+        model = Recipe
         ordering = ['id']
 
+    def to_representation(self, instance):
+        ensure_documents([instance])
+        data = json.loads(instance.document)
+        data['author']['is_subscribed'] = data['author']['id'] in (
+            membership.for_request(self.context['request']).subscriptions)
+        data.update(super(RecipeSerializerRead, self).to_representation(
+            instance))
+        return OrderedDict(
+            (name, data[name]) for name in self.representation_fields)
+
     def get_is_favorited(self, obj):
-        if not self.context['request'].user.is_anonymous:
-            return Favorite.objects.filter(
-                recipe=obj,
-                user=self.context['request'].user).exists()
-        else:
-            return False
+        return obj.id in membership.for_request(
+            self.context['request']).favorites
 
     def get_is_in_shopping_cart(self, obj):
-        if not self.context['request'].user.is_anonymous:
-            return Shopping.objects.filter(
-                recipe=obj,
-                user=self.context['request'].user).exists()
-        else:
-            return False
+        return obj.id in membership.for_request(
+            self.context['request']).cart
 
 
 class RecipeSerializerWrite(serializers.ModelSerializer):
@@ -201,11 +326,12 @@ class RecipeSerializerWrite(serializers.ModelSerializer):
     cooking_time = serializers.IntegerField(
         required=True)
     image = Base64ImageField(
-        required=True)
-    tags = serializers.PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(),
-        many=True,
-        read_only=False)
+        required=False)
+    image_token = serializers.UUIDField(
+        required=False,
+        write_only=True)
+    tags = BulkPrimaryKeyRelatedField(
+        queryset=Tag.objects.all())
     ingredients = RecipeIngredientSerializer(
         many=True,
         read_only=False)
@@ -215,26 +341,95 @@ class RecipeSerializerWrite(serializers.ModelSerializer):
             'ingredients',
             'tags',
             'image',
+            'image_token',
             'name',
             'text',
             'cooking_time')
         model = Recipe
 
+    def validate(self, data):
+        token = data.pop('image_token', None)
+        if token is not None:
+            if 'image' in data:
+                raise serializers.ValidationError(
+                    {'image_token': 'Передайте image или image_token'})
+            upload = uploads.get_upload(self.context['request'].user, token)
+            if upload is None:
+                raise serializers.ValidationError(
+                    {'image_token': 'Загрузка не найдена или устарела'})
+            data['image'] = upload.image.name
+            data['upload'] = upload
+        elif self.instance is None and not data.get('image'):
+            raise serializers.ValidationError(
+                {'image': 'Обязательное поле.'})
+        return data
+
+    def validate_ingredients(self, value):
+        ingredients = resolve_ids(
+            Ingredient.objects.all(),
+            [ingredient['id'] for ingredient in value])
+        for item, ingredient in zip(value, ingredients):
+            item['id'] = ingredient
+        return value
+
+    def set_tags(self, recipe, tags, created=False):
+        """Insert added and delete removed RecipeTag rows."""
+        new = {tag.id for tag in tags}
+        old = set() if created else set(RecipeTag.objects.filter(
+            recipe=recipe).values_list('tag_id', flat=True))
+        if old - new:
+            RecipeTag.objects.filter(
+                recipe=recipe, tag_id__in=old - new).delete()
+        RecipeTag.objects.bulk_create(
+            RecipeTag(recipe=recipe, tag_id=tag_id) for tag_id in new - old)
+        if new - old:
+            # bulk_create sends no signals; tags decide list membership.
+            bump_version('recipes')
+
+    def set_ingredients(self, recipe, ingredients, created=False):
+        """Apply the ingredient list as a diff of RecipeIngredient rows.
+
+        Returns the old and the new {ingredient_id: amount}.
+        """
+        new = {
+            ingredient['id'].id: ingredient['amount']
+            for ingredient in ingredients}
+        rows = {} if created else {
+            row.ingredient_id: row
+            for row in RecipeIngredient.objects.filter(recipe=recipe)}
+        old = {key: row.amount for key, row in rows.items()}
+        removed = [row.id for key, row in rows.items() if key not in new]
+        if removed:
+            RecipeIngredient.objects.filter(id__in=removed).delete()
+        changed = []
+        for key, amount in new.items():
+            if key in rows and rows[key].amount != amount:
+                rows[key].amount = amount
+                changed.append(rows[key])
+        if changed:
+            RecipeIngredient.objects.bulk_update(changed, ['amount'])
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=recipe, ingredient_id=key, amount=amount)
+            for key, amount in new.items() if key not in rows)
+        return old, new
+
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
+        upload = validated_data.pop('upload', None)
         try:
-            with transaction.atomic():
+            with transaction.atomic(), documents.deferred() as stale:
                 recipe = Recipe.objects.create(
                     **validated_data,
                     author=self.context['request'].user)
-                for tag in tags:
-                    RecipeTag.objects.create(recipe=recipe, tag=tag)
-                for ingredient in ingredients:
-                    RecipeIngredient.objects.create(
-                        recipe=recipe,
-                        ingredient=ingredient['id'],
-                        amount=ingredient['amount'])
+                self.set_tags(recipe, tags, created=True)
+                self.set_ingredients(recipe, ingredients, created=True)
+                if upload is not None:
+                    upload.delete()
+                images.schedule(recipe)
+                refresh_documents([recipe])
+                stale.discard(recipe.id)
         except IntegrityError:
             raise serializers.ValidationError(
                 validated_data,
@@ -242,36 +437,40 @@ class RecipeSerializerWrite(serializers.ModelSerializer):
         return recipe
 
     def update(self, instance, validated_data):
-        ingredients = validated_data.pop('ingredients')
-        tags = validated_data.pop('tags')
+        ingredients = validated_data.pop('ingredients', None)
+        tags = validated_data.pop('tags', None)
+        upload = validated_data.pop('upload', None)
         try:
-            with transaction.atomic():
-                recipe = Recipe.objects.get(id=instance.id)
+            with transaction.atomic(), documents.deferred() as stale:
+                carts.lock_recipe(instance)
                 for attr, value in validated_data.items():
                     setattr(instance, attr, value)
                 instance.save()
-                RecipeTag.objects.filter(recipe=recipe).delete()
-                for tag in tags:
-                    RecipeTag.objects.create(recipe=recipe, tag=tag)
-                RecipeIngredient.objects.filter(recipe=recipe).delete()
-                for ingredient in ingredients:
-                    RecipeIngredient.objects.create(
-                        recipe=recipe,
-                        ingredient=ingredient['id'],
-                        amount=ingredient['amount'])
-                recipe_new = Recipe.objects.get(id=instance.id)
+                if upload is not None:
+                    upload.delete()
+                if 'image' in validated_data:
+                    images.schedule(instance)
+                if tags is not None:
+                    self.set_tags(instance, tags)
+                if ingredients is not None:
+                    carts.recipe_changed(
+                        instance,
+                        *self.set_ingredients(instance, ingredients))
+                refresh_documents([instance])
+                stale.discard(instance.id)
         except IntegrityError:
             raise serializers.ValidationError(
                 validated_data,
                 status.HTTP_400_BAD_REQUEST)
-        return recipe_new
+        return instance
 
     def to_representation(self, value):
         serializer = RecipeSerializerRead(value, context=self.context)
         return serializer.data
 
 
-class SubscribeSerializerRead(serializers.ModelSerializer):
+class SubscribeSerializerRead(TimedRepresentationMixin,
+                              serializers.ModelSerializer):
     recipes_count = serializers.SerializerMethodField()
     recipes = serializers.SerializerMethodField()
     is_subscribed = serializers.SerializerMethodField()
@@ -289,24 +488,24 @@ class SubscribeSerializerRead(serializers.ModelSerializer):
             'recipes_count')
 
     def get_recipes(self, user):
-        try:
-            limit = int(self.context['recipes_limit'])
-            recipe = Recipe.objects.filter(author=user)[:limit]
-        except Exception:
-            recipe = Recipe.objects.filter(author=user)
+        recipes = getattr(user, 'recipes_preview', None)
+        if recipes is None:
+            recipes = Recipe.objects.filter(author=user).order_by('-id')
+            limit = self.context.get('recipes_limit')
+            if limit is not None:
+                recipes = recipes[:limit]
         serializer = RecipeSerializerReadSimple(
-            instance=recipe,
+            instance=recipes,
             many=True,
             context=self.context)
         return serializer.data
 
     def get_recipes_count(self, obj):
-        return Recipe.objects.filter(author=obj).count()
+        try:
+            return obj.counter.recipes_count
+        except UserCounter.DoesNotExist:
+            return 0
 
     def get_is_subscribed(self, obj):
-        if not self.context['request'].user.is_anonymous:
-            return Subscribe.objects.filter(
-                author=obj,
-                subscriber=self.context['request'].user).exists()
-        else:
-            return False
+        return obj.id in membership.for_request(
+            self.context['request']).subscriptions
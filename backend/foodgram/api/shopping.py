@@ -0,0 +1,171 @@
+"""Shopping list export.
+
+Rendered lists are kept on disk and named by a hash of the cart
+totals, so a repeated download of an unchanged cart is served from
+the file without rendering again.
+"""
+import csv
+import datetime
+import glob
+import hashlib
+import io
+import os
+import time
+
+from django.conf import settings
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+from recipes.models import ShoppingIngredient
+
+CONTENT_TYPES = {
+    'txt': 'text/plain; charset=utf8',
+    'csv': 'text/csv; charset=utf-8',
+    'pdf': 'application/pdf',
+}
+CHUNK_SIZE = 64 * 1024
+PDF_FONT_NAME = 'ShoppingList'
+# Seconds a replaced rendering is kept for downloads in progress.
+STALE_GRACE = 60
+
+
+def cart_contents(user):
+    """Ingredient totals of the user's cart, read from ShoppingIngredient.
+    """
+    if user.is_anonymous:
+        return []
+    totals = ShoppingIngredient.objects.filter(user=user).order_by(
+        'ingredient__name').values_list(
+            'ingredient__name', 'ingredient__measurement_unit', 'amount')
+    return [
+        (name.capitalize(), measurement_unit, amount)
+        for name, measurement_unit, amount in totals]
+
+
+def cart_signature(contents, header, file_format):
+    digest = hashlib.sha256(file_format.encode())
+    for line in header:
+        digest.update(f'|{line}'.encode())
+    for row in contents:
+        digest.update(('|%s:%s:%d' % row).encode())
+    return digest.hexdigest()
+
+
+def get_header(user):
+    header = ['Список покупок']
+    if user.username:
+        header.append(f'{datetime.date.today():%Y-%m-%d} {user.username}')
+    return header
+
+
+def render_txt(file, header, rows):
+    lines = list(header)
+    if len(header) > 1:
+        lines.append('# Наименование Ед.Измерения Количество')
+    for idx, (name, measurement_unit, amount) in enumerate(rows, 1):
+        lines.append(f'{idx} * {name} ({measurement_unit}) - {amount}')
+    file.write('\n'.join(lines).encode('utf8'))
+
+
+def render_csv(file, header, rows):
+    text = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+    writer = csv.writer(text)
+    writer.writerow(['#', 'Наименование', 'Ед.Измерения', 'Количество'])
+    for idx, row in enumerate(rows, 1):
+        writer.writerow((idx,) + row)
+    text.detach()
+
+
+def get_pdf_font():
+    path = settings.SHOPPING_LIST_PDF_FONT
+    if not path or not os.path.exists(path):
+        return 'Helvetica'
+    if PDF_FONT_NAME not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(TTFont(PDF_FONT_NAME, path))
+    return PDF_FONT_NAME
+
+
+def render_pdf(file, header, rows):
+    font = get_pdf_font()
+    width, height = A4
+    margin, step = 50, 18
+    pdf = canvas.Canvas(file, pagesize=A4)
+    lines = [(16, line) for line in header]
+    lines += [
+        (12, f'{idx}. {name} ({measurement_unit}) - {amount}')
+        for idx, (name, measurement_unit, amount) in enumerate(rows, 1)]
+    y = height - margin
+    for size, line in lines:
+        if y < margin:
+            pdf.showPage()
+            y = height - margin
+        pdf.setFont(font, size)
+        pdf.drawString(margin, y, line)
+        y -= step
+    pdf.save()
+
+
+RENDERERS = {
+    'txt': render_txt,
+    'csv': render_csv,
+    'pdf': render_pdf,
+}
+
+
+def render(user, file_format, header, contents, path):
+    """Write the list to `path` and remove older renderings.
+
+    Older renderings are kept for STALE_GRACE seconds, so downloads of
+    them that already started (X-Accel-Redirect included) still finish.
+    """
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'wb') as file:
+        RENDERERS[file_format](file, header, contents)
+    os.replace(temp_path, path)
+    expired = time.time() - STALE_GRACE
+    for stale in glob.glob(
+            os.path.join(directory, f'{user.id or 0}-*.{file_format}')):
+        try:
+            if stale != path and os.path.getmtime(stale) < expired:
+                os.remove(stale)
+        except FileNotFoundError:
+            pass
+
+
+def open_shopping_list(user, file_format):
+    """Return the file name and an open file of the user's list.
+
+    The list is rendered only when no file exists for the current cart
+    contents. Should the file vanish before it can be opened, the list
+    is rendered in memory and the name is None.
+    """
+    header = get_header(user)
+    contents = cart_contents(user)
+    signature = cart_signature(contents, header, file_format)
+    name = f'{user.id or 0}-{signature}.{file_format}'
+    path = os.path.join(settings.SHOPPING_LIST_CACHE_DIR, name)
+    try:
+        return name, open(path, 'rb')
+    except FileNotFoundError:
+        pass
+    render(user, file_format, header, contents, path)
+    try:
+        return name, open(path, 'rb')
+    except FileNotFoundError:
+        file = io.BytesIO()
+        RENDERERS[file_format](file, header, contents)
+        file.seek(0)
+        return None, file
+
+
+def read_chunks(file):
+    """Yield the open file in chunks and close it."""
+    with file:
+        chunk = file.read(CHUNK_SIZE)
+        while chunk:
+            yield chunk
+            chunk = file.read(CHUNK_SIZE)
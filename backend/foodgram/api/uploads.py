@@ -0,0 +1,100 @@
+"""Streaming multipart upload of recipe images.
+
+The body is written to a temporary file chunk by chunk, so a worker
+never holds a whole image in memory, and the upload stops as soon as
+it grows past IMAGE_UPLOAD_MAX_SIZE. Only the image header is read to
+check the format and the pixel count before the file is stored.
+"""
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.uploadhandler import (FileUploadHandler, StopUpload,
+                                             TemporaryFileUploadHandler)
+from django.utils import timezone
+from PIL import Image
+from rest_framework.exceptions import ValidationError
+
+from recipes.models import ImageUpload
+
+# Room for the multipart boundaries and part headers.
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class SizeLimitUploadHandler(FileUploadHandler):
+    """Stop the upload once a file is larger than `max_size` bytes."""
+
+    def __init__(self, request=None, max_size=None):
+        super(SizeLimitUploadHandler, self).__init__(request)
+        self.max_size = max_size
+        self.exceeded = False
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > self.max_size:
+            self.exceeded = True
+            raise StopUpload(connection_reset=False)
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
+
+
+def too_large(request):
+    length = request.META.get('CONTENT_LENGTH')
+    return bool(length) and length.isdigit() and (
+        int(length) > settings.IMAGE_UPLOAD_MAX_SIZE + MULTIPART_OVERHEAD)
+
+
+def stream_to_disk(request):
+    """Parse the multipart body into temporary files.
+
+    Returns the uploaded `image` file, or None when it was too large.
+    """
+    limit = SizeLimitUploadHandler(
+        request._request, settings.IMAGE_UPLOAD_MAX_SIZE)
+    request._request.upload_handlers = [
+        limit, TemporaryFileUploadHandler(request._request)]
+    file = request.FILES.get('image')
+    if limit.exceeded:
+        return None
+    if file is None:
+        raise ValidationError({'image': 'Ожидается файл'})
+    return file
+
+
+def inspect(file):
+    """Check the image header, return (width, height, format)."""
+    try:
+        image = Image.open(file)
+        width, height = image.size
+        file_format = image.format
+        if file_format in settings.IMAGE_UPLOAD_FORMATS and (
+                width * height <= settings.IMAGE_UPLOAD_MAX_PIXELS):
+            image.verify()
+    except (OSError, SyntaxError, Image.DecompressionBombError):
+        raise ValidationError({'image': 'Файл не является картинкой'})
+    if file_format not in settings.IMAGE_UPLOAD_FORMATS:
+        raise ValidationError({
+            'image': 'Ожидается ' + ', '.join(settings.IMAGE_UPLOAD_FORMATS)})
+    if width * height > settings.IMAGE_UPLOAD_MAX_PIXELS:
+        raise ValidationError({'image': 'Слишком большое разрешение'})
+    file.seek(0)
+    return width, height, file_format
+
+
+def save_upload(user, file):
+    width, height, file_format = inspect(file)
+    upload = ImageUpload(user=user, width=width, height=height)
+    upload.image.save(
+        f'{uuid.uuid4().hex}.{file_format.lower()}', file, save=False)
+    upload.save()
+    return upload
+
+
+def get_upload(user, token):
+    """The user's unexpired upload with this token, or None."""
+    return ImageUpload.objects.filter(
+        token=token,
+        user=user,
+        created__gte=timezone.now() - timedelta(
+            seconds=settings.IMAGE_UPLOAD_TTL)).first()
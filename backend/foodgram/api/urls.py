@@ -1,6 +1,6 @@
 from api.views import (IngredientViewSet, RecipeViewSet, SubscribeViewSet,
-                       TagViewSet, favorite_change, shopping_change,
-                       subscribe_change)
+                       TagViewSet, favorite_change, image_upload,
+                       shopping_change, subscribe_change)
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
@@ -17,6 +17,7 @@ urlpatterns = [
     path('users/subscriptions/', SubscribeViewSet.as_view({'get': 'list'})),
     path('', include('djoser.urls')),
     path('auth/', include('djoser.urls.authtoken')),
+    path('recipes/images/', image_upload),
     path('', include(router1.urls)),
     path('users/<int:author_id>/subscribe/', subscribe_change),
     path('recipes/<int:id>/favorite/', favorite_change),
@@ -1,68 +1,132 @@
-import datetime
+import hmac
 
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import permissions, status, viewsets
-from rest_framework.decorators import action, api_view
+from rest_framework.decorators import action, api_view, parser_classes
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
 
+from api import facets, instrumentation, shopping, uploads
+from api.autocomplete import ingredient_index
 from api.filters import RecipeFilterSet
+from api.mixins import (AnonymousCacheMixin, ReferenceDataMixin,
+                        ReplicaReadMixin)
 from api.pagination import ApiPagination
 from api.serializers import (FavoriteSerializerRead, IngredientSerializer,
                              RecipeSerializerRead, RecipeSerializerWrite,
+                             ShoppingIngredientSerializerRead,
                              ShoppingSerializerRead, SubscribeSerializerRead,
-                             TagSerializer)
-from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                            Shopping, Subscribe, Tag, User)
+                             TagSerializer, ensure_documents)
+from recipes import carts
+from recipes.models import (Favorite, Ingredient, Recipe, Shopping,
+                            ShoppingIngredient, Subscribe, Tag, User)
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(ReplicaReadMixin, ReferenceDataMixin,
+                 viewsets.ReadOnlyModelViewSet):
     serializer_class = TagSerializer
     permission_classes = (permissions.IsAuthenticatedOrReadOnly,)
     queryset = Tag.objects.all().order_by('slug')
     pagination_class = None
+    version_name = 'tags'
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(ReplicaReadMixin, ReferenceDataMixin,
+                        viewsets.ReadOnlyModelViewSet):
     serializer_class = IngredientSerializer
     permission_classes = (permissions.IsAuthenticatedOrReadOnly,)
     pagination_class = None
+    version_name = 'ingredients'
 
     def get_queryset(self):
-        queryset = Ingredient.objects.all()
+        if self.action != 'list':
+            return Ingredient.objects.all()
+        # Autocomplete is answered from the per-worker ingredient index.
         name = self.request.query_params.get('name')
-        if name is not None:
-            queryset1 = queryset.filter(name__istartswith=name)
-            queryset2 = queryset.filter(
-                name__icontains=name).difference(queryset1)
-            return queryset1.union(queryset2, all=True)
-        return queryset
+        limit = self.request.query_params.get('limit')
+        if limit is not None:
+            if not limit.isdigit() or int(limit) < 1:
+                raise ValidationError(
+                    {'limit': 'Ожидается целое положительное число'})
+            limit = int(limit)
+        if name is None:
+            return ingredient_index.all()[:limit]
+        return ingredient_index.search(name, limit)
 
 
-class SubscribeViewSet(viewsets.ReadOnlyModelViewSet):
+def get_recipes_limit(request):
+    recipes_limit = request.query_params.get('recipes_limit')
+    if recipes_limit is None:
+        return None
+    if not recipes_limit.isdigit() or int(recipes_limit) < 1:
+        raise ValidationError(
+            {'recipes_limit': 'Ожидается целое положительное число'})
+    return int(recipes_limit)
+
+
+def attach_recipes_preview(authors, limit=None):
+    """Set `recipes_preview` on every author with one query.
+
+    Recipes are ranked newest first inside each author by ROW_NUMBER()
+    and only the first `limit` of them are fetched.
+    """
+    recipes = Recipe.objects.filter(
+        author_id__in=[author.id for author in authors]).only(
+            'id', 'name', 'image', 'image_variants', 'cooking_time',
+            'author_id')
+    if limit is None:
+        recipes = recipes.order_by('author_id', '-id')
+    else:
+        sql, params = recipes.annotate(row_number=Window(
+            expression=RowNumber(),
+            partition_by=[F('author_id')],
+            order_by=F('id').desc())).query.sql_with_params()
+        recipes = Recipe.objects.raw(
+            f'SELECT * FROM ({sql}) ranked WHERE ranked.row_number <= %s '
+            'ORDER BY ranked.author_id, ranked.row_number',
+            params + (limit,))
+    previews = {author.id: [] for author in authors}
+    for recipe in recipes:
+        previews[recipe.author_id].append(recipe)
+    for author in authors:
+        author.recipes_preview = previews[author.id]
+
+
+class SubscribeViewSet(ReplicaReadMixin, viewsets.ReadOnlyModelViewSet):
     serializer_class = SubscribeSerializerRead
     permission_classes = (permissions.IsAuthenticatedOrReadOnly,)
+    pagination_class = ApiPagination
+    cursor_ordering = 'username'
 
     def get_queryset(self):
         if not self.request.user.is_anonymous:
             return User.objects.filter(
                 subscribe_author__subscriber_id=self.request.user.id).order_by(
-                    'username')
+                    'username').select_related('counter')
         else:
             return User.objects.none()
 
+    def paginate_queryset(self, queryset):
+        page = super(SubscribeViewSet, self).paginate_queryset(queryset)
+        if page is not None:
+            attach_recipes_preview(page, get_recipes_limit(self.request))
+        return page
+
     def get_serializer_context(self):
         context = super(SubscribeViewSet, self).get_serializer_context()
-        if not self.request.user.is_anonymous:
-            recipes_limit = self.request.query_params.get('recipes_limit')
-            if recipes_limit:
-                context.update({"recipes_limit": recipes_limit})
+        context.update({'recipes_limit': get_recipes_limit(self.request)})
         return context
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ReplicaReadMixin, AnonymousCacheMixin,
+                    viewsets.ModelViewSet):
     queryset = Recipe.objects.all().order_by('-id')
     pagination_class = ApiPagination
     permission_classes = (permissions.IsAuthenticatedOrReadOnly,)
@@ -70,6 +134,33 @@ class RecipeViewSet(viewsets.ModelViewSet):
     filterset_class = RecipeFilterSet
     lookup_field = 'id'
 
+    @property
+    def cursor_ordering(self):
+        # Search results are ordered by rank, so they are paged by number.
+        if self.request.query_params.get('search'):
+            return None
+        return '-id'
+
+    def prepare_page(self, recipes):
+        ensure_documents(recipes)
+        return recipes
+
+    def paginate_queryset(self, queryset):
+        page = super(RecipeViewSet, self).paginate_queryset(queryset)
+        if page is not None:
+            self.prepare_page(page)
+        return page
+
+    def list(self, request, *args, **kwargs):
+        requested = request.query_params.get('facets')
+        if requested not in (None, 'tags'):
+            raise ValidationError({'facets': 'Ожидается tags'})
+        response = super(RecipeViewSet, self).list(request, *args, **kwargs)
+        if requested:
+            response.data['facets'] = {'tags': facets.tag_facets(
+                request, self.get_queryset())}
+        return response
+
     def get_serializer_class(self):
         if self.request.method in ('POST', 'PATCH'):
             return RecipeSerializerWrite
@@ -83,35 +174,40 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, url_path='download_shopping_cart')
     def shopping_list(self, request):
-        # Create the HttpResponse object with the appropriate header.
-        response = HttpResponse(content_type='text/plain; charset=utf8')
-        response['Content-Disposition'] = 'attachment; filename="shopping.txt"'
-        report = []
-        report.append('Список покупок')
-        if request.user.username:
-            report.append(
-                f'{datetime.datetime.now():%Y-%m-%d} {request.user.username}')
-            report.append('# Наименование Ед.Измерения Количество')
-            queryset = RecipeIngredient.objects.filter(
-                recipe__shopping_recipe__user=request.user.id).values(
-                    'ingredient__name',
-                    'ingredient__measurement_unit').annotate(
-                        amount_sum=Sum('amount')).order_by('ingredient__name')
-            idx = 0
-            for rec in queryset:
-                name = rec['ingredient__name'].capitalize()
-                measurement_unit = rec['ingredient__measurement_unit']
-                measurement_unit = f'({measurement_unit})'
-                idx += 1
-                report.append(
-                    f'{idx} * {name} {measurement_unit} - {rec["amount_sum"]}')
-        response.write('\n'.join(report))
+        file_format = request.query_params.get('type', 'txt')
+        if file_format not in shopping.CONTENT_TYPES:
+            raise ValidationError({'type': 'Ожидается txt, csv или pdf'})
+        name, file = shopping.open_shopping_list(request.user, file_format)
+        content_type = shopping.CONTENT_TYPES[file_format]
+        if settings.SHOPPING_LIST_X_ACCEL_PREFIX and name is not None:
+            file.close()
+            response = HttpResponse(content_type=content_type)
+            response['X-Accel-Redirect'] = (
+                settings.SHOPPING_LIST_X_ACCEL_PREFIX + name)
+        else:
+            response = StreamingHttpResponse(
+                shopping.read_chunks(file),
+                content_type=content_type)
+        response['Content-Disposition'] = (
+            f'attachment; filename="shopping.{file_format}"')
         return response
 
+    @action(
+        detail=False,
+        url_path='shopping_cart_summary',
+        permission_classes=(permissions.IsAuthenticated,))
+    def shopping_cart_summary(self, request):
+        queryset = ShoppingIngredient.objects.filter(
+            user=request.user).select_related(
+                'ingredient').order_by('ingredient__name')
+        serializer = ShoppingIngredientSerializerRead(queryset, many=True)
+        return Response(serializer.data)
+
 
 @api_view(['POST', 'DELETE'])
 def subscribe_change(request, author_id):
     author = get_object_or_404(User, id=author_id)
+    recipes_limit = get_recipes_limit(request)
     try:
         if request.method == 'POST':
             Subscribe.objects.create(subscriber=request.user, author=author)
@@ -130,9 +226,10 @@ def subscribe_change(request, author_id):
                 {'detail': 'Нет подписки'},
                 status=status.HTTP_400_BAD_REQUEST)
     if request.method == 'POST':
+        attach_recipes_preview([author], recipes_limit)
         serializer = SubscribeSerializerRead(
             author,
-            context={'request': request})
+            context={'request': request, 'recipes_limit': recipes_limit})
         return Response(serializer.data)
     return Response(status=status.HTTP_204_NO_CONTENT)
 
@@ -170,15 +267,22 @@ def shopping_change(request, id):
     recipe = get_object_or_404(Recipe, id=id)
     try:
         if request.method == 'POST':
-            Shopping.objects.create(recipe=recipe, user=request.user)
+            with transaction.atomic(savepoint=False):
+                carts.lock_recipe(recipe)
+                Shopping.objects.create(recipe=recipe, user=request.user)
+                carts.add_recipe(request.user, recipe)
     except Exception:
         return Response(
             {'detail': 'Ошибка добавления в список покупок'},
             status=status.HTTP_400_BAD_REQUEST)
     if request.method == 'DELETE':
-        if Shopping.objects.filter(recipe=recipe, user=request.user).exists():
-            Shopping.objects.filter(recipe=recipe, user=request.user).delete()
-        else:
+        with transaction.atomic(savepoint=False):
+            carts.lock_recipe(recipe)
+            deleted, _ = Shopping.objects.filter(
+                recipe=recipe, user=request.user).delete()
+            if deleted:
+                carts.remove_recipe(request.user, recipe)
+        if not deleted:
             return Response(
                 {'detail': 'Ошибка удаления из списка покупок'},
                 status=status.HTTP_400_BAD_REQUEST)
@@ -188,3 +292,36 @@ def shopping_change(request, id):
             context={'request': request})
         return Response(serializer.data)
     return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+@api_view(['POST'])
+@parser_classes([MultiPartParser])
+def image_upload(request):
+    if uploads.too_large(request):
+        file = None
+    else:
+        file = uploads.stream_to_disk(request)
+    if file is None:
+        return Response(
+            {'image': f'Файл больше {settings.IMAGE_UPLOAD_MAX_SIZE} байт'},
+            status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+    upload = uploads.save_upload(request.user, file)
+    return Response(
+        {
+            'image_token': upload.token,
+            'width': upload.width,
+            'height': upload.height},
+        status=status.HTTP_201_CREATED)
+
+
+def metrics(request):
+    """Prometheus metrics for staff users or the METRICS_TOKEN bearer."""
+    token = settings.METRICS_TOKEN
+    authorization = request.META.get('HTTP_AUTHORIZATION', '')
+    if not (token and hmac.compare_digest(
+            authorization.encode(), f'Bearer {token}'.encode())
+            or request.user.is_staff):
+        return HttpResponse(status=status.HTTP_403_FORBIDDEN)
+    return HttpResponse(
+        instrumentation.render_metrics(),
+        content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -52,6 +52,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -59,6 +60,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.middleware.PrimaryAfterWriteMiddleware',
 ]
 
 ROOT_URLCONF = 'foodgram.urls'
@@ -98,6 +100,79 @@ DATABASES = {
     }
 }
 
+# Optional read replicas: DB_REPLICA_HOSTS is a comma separated list of
+# hosts with the primary's database and credentials. Browse reads of the
+# API go to a random replica (see recipes.replicas); a user who wrote
+# reads from the primary for REPLICA_PIN_TIMEOUT seconds.
+
+REPLICA_HOSTS = [
+    host.strip()
+    for host in os.getenv('DB_REPLICA_HOSTS', default='').split(',')
+    if host.strip()]
+
+REPLICA_DATABASES = [
+    f'replica{number}' for number in range(len(REPLICA_HOSTS))]
+
+DATABASES.update({
+    alias: dict(
+        DATABASES['default'],
+        HOST=host,
+        PORT=os.getenv(
+            'DB_REPLICA_PORT', default=DATABASES['default']['PORT']),
+        TEST={'MIRROR': 'default'})
+    for alias, host in zip(REPLICA_DATABASES, REPLICA_HOSTS)})
+
+DATABASE_ROUTERS = ['recipes.replicas.ReplicaRouter']
+
+REPLICA_PIN_TIMEOUT = int(os.getenv('REPLICA_PIN_TIMEOUT', default=10))
+
+
+# Cache
+# Local memory by default; point CACHE_BACKEND/CACHE_LOCATION at a shared
+# backend (e.g. memcached) so all workers see the same entries.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', default=''),
+    }
+}
+
+# LocMemCache is private to each worker process. Version stamps of the
+# reference data are then read from the database (recipes.versions).
+
+CACHE_SHARED = CACHES['default']['BACKEND'] != (
+    'django.core.cache.backends.locmem.LocMemCache')
+
+if not CACHE_SHARED:
+    # Per-user sets, per-recipe stamps and responses share the cache. A
+    # full LocMemCache drops the most recently stored third of its keys,
+    # so it must hold them all.
+    CACHES['default']['OPTIONS'] = {
+        'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', default=200000)),
+    }
+
+# Gunicorn workers, gunicorn reads the same variable.
+
+WEB_CONCURRENCY = int(os.getenv('WEB_CONCURRENCY', default=1))
+
+# Membership sets (recipes.membership) are invalidated through the cache,
+# so several workers with private caches load them once per request.
+
+MEMBERSHIP_CACHE_TIMEOUT = 60 * 60 * 24 if (
+    CACHE_SHARED or WEB_CONCURRENCY == 1) else 0
+
+# Per-worker cache of token owners (see api.authentication): entries live
+# at most this many seconds, 0 disables the cache. Revoked tokens reach
+# the other workers through stamps in the default cache, so the token
+# cache is off while that cache is the per-process LocMemCache.
+
+AUTH_TOKEN_CACHE_TIMEOUT = 300 if CACHE_SHARED else 0
+
+AUTH_TOKEN_CACHE_SIZE = 10000
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -129,7 +204,7 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PAGINATION_CLASS': 'api.pagination.ApiPagination',
 }
@@ -177,3 +252,95 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'backend_static')
 MEDIA_URL = '/media/'
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Media files are named by the hash of their content, see recipes.storage.
+
+DEFAULT_FILE_STORAGE = 'recipes.storage.ContentAddressedStorage'
+
+# Recipe image uploads
+# Multipart uploads are streamed to a temporary file and rejected once
+# they exceed IMAGE_UPLOAD_MAX_SIZE bytes or IMAGE_UPLOAD_MAX_PIXELS.
+# Unused upload tokens expire after IMAGE_UPLOAD_TTL seconds.
+
+IMAGE_UPLOAD_MAX_SIZE = 10 * 1024 * 1024
+
+IMAGE_UPLOAD_MAX_PIXELS = 40 * 1000 * 1000
+
+IMAGE_UPLOAD_FORMATS = ('JPEG', 'PNG', 'WEBP')
+
+IMAGE_UPLOAD_TTL = 24 * 60 * 60
+
+# Recipe image variants
+# Every uploaded image is resized to fit each box and saved in every
+# format the Pillow build can encode. Variants are built by a thread
+# pool after commit, or inline when IMAGE_VARIANTS_SYNC is set.
+
+IMAGE_VARIANTS_SIZES = {
+    'card': (400, 400),
+    'detail': (800, 800),
+    'retina': (1600, 1600),
+}
+
+IMAGE_VARIANTS_FORMATS = ('jpeg', 'webp', 'avif')
+
+IMAGE_VARIANTS_WORKERS = int(os.getenv('IMAGE_VARIANTS_WORKERS', default=2))
+
+IMAGE_VARIANTS_SYNC = os.getenv('IMAGE_VARIANTS_SYNC', default='False') == 'True'
+
+# Shopping list export
+# Rendered lists are cached in SHOPPING_LIST_CACHE_DIR. When
+# SHOPPING_LIST_X_ACCEL_PREFIX is set, downloads are handed to nginx
+# through an internal location mapped to that directory.
+
+SHOPPING_LIST_CACHE_DIR = os.path.join(BASE_DIR, 'shopping_lists')
+
+SHOPPING_LIST_X_ACCEL_PREFIX = os.getenv('SHOPPING_LIST_X_ACCEL_PREFIX')
+
+SHOPPING_LIST_PDF_FONT = '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+
+# Anonymous recipe list and detail responses are cached for this many
+# seconds (see api.response_cache), 0 disables the cache.
+
+ANONYMOUS_CACHE_TIMEOUT = 300
+
+# Tag facet counts of the recipe list are cached for this many seconds,
+# 0 disables the cache.
+
+RECIPE_FACETS_CACHE_TIMEOUT = 30
+
+# Reference data (tags, ingredients)
+# Max age of client caches; clients revalidate with ETag afterwards.
+
+REFERENCE_DATA_MAX_AGE = 600
+
+# Request instrumentation (see api.instrumentation): share of requests
+# measured, threshold for logging a request with all its SQL, and how
+# often a worker copies its histograms to the cache for /metrics.
+
+REQUEST_METRICS_SAMPLE_RATE = float(
+    os.getenv('REQUEST_METRICS_SAMPLE_RATE', default=1))
+
+REQUEST_METRICS_SLOW_MS = int(
+    os.getenv('REQUEST_METRICS_SLOW_MS', default=500))
+
+REQUEST_METRICS_FLUSH_INTERVAL = 10
+
+# Bearer token of the Prometheus scraper; staff users may read /metrics
+# without it.
+
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', default='')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'api.requests': {
+            'handlers': ['console'],
+            'level': os.getenv('REQUEST_LOG_LEVEL', default='INFO'),
+            'propagate': False,
+        },
+    },
+}
@@ -0,0 +1,29 @@
+"""
+Settings profile for the test and query-budget suite.
+
+Runs against an in-memory SQLite database and a throwaway media root.
+"""
+
+import tempfile
+
+from foodgram.settings import *  # noqa: F401,F403
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+    }
+}
+
+# A single process, so the local memory cache is seen by every request.
+CACHE_SHARED = True
+
+AUTH_TOKEN_CACHE_TIMEOUT = 300
+
+PASSWORD_HASHERS = [
+    'django.contrib.auth.hashers.MD5PasswordHasher',
+]
+
+MEDIA_ROOT = tempfile.mkdtemp(prefix='foodgram-media-')
+
+SHOPPING_LIST_CACHE_DIR = tempfile.mkdtemp(prefix='foodgram-shopping-')
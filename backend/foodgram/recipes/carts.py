@@ -0,0 +1,169 @@
+"""Incrementally maintained shopping cart totals.
+
+ShoppingIngredient keeps, for every user, the summed amount of each
+ingredient over all recipes in the user's cart. Every change of a cart
+or of a recipe that sits in carts is applied to it as a delta.
+
+Transactions that add or remove a cart row or change a recipe's
+ingredients first take the recipe's row lock (lock_recipe), so a cart
+change never reads amounts that a concurrent edit is replacing.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Sum
+
+from recipes.models import (Recipe, RecipeIngredient, Shopping,
+                            ShoppingIngredient)
+
+BATCH_SIZE = 500
+# Attempts to add to rows another transaction created concurrently.
+RETRIES = 3
+
+
+def lock_recipe(recipe):
+    """Hold the recipe's row lock until the transaction ends."""
+    list(Recipe.objects.select_for_update().filter(
+        id=recipe.id).values_list('id', flat=True))
+
+
+def recipe_amounts(recipe):
+    return dict(RecipeIngredient.objects.filter(
+        recipe=recipe).values_list('ingredient_id', 'amount'))
+
+
+def apply_delta(user_ids, delta, retries=RETRIES):
+    """Add `delta` ({ingredient_id: change}) to the totals of every user.
+
+    Users are handled BATCH_SIZE at a time, so a recipe in many carts
+    never loads all of their rows at once.
+    """
+    delta = {key: value for key, value in delta.items() if value}
+    if not delta:
+        return
+    user_ids = list(user_ids)
+    with transaction.atomic(savepoint=False):
+        for start in range(0, len(user_ids), BATCH_SIZE):
+            apply_batch(user_ids[start:start + BATCH_SIZE], delta, retries)
+
+
+def apply_batch(user_ids, delta, retries):
+    existing = {
+        (row.user_id, row.ingredient_id): row
+        for row in ShoppingIngredient.objects.select_for_update().filter(
+            user_id__in=user_ids,
+            ingredient_id__in=delta)}
+    changed, created, emptied = [], [], []
+    for user_id in user_ids:
+        for ingredient_id, change in delta.items():
+            row = existing.get((user_id, ingredient_id))
+            if row is None:
+                if change > 0:
+                    created.append(ShoppingIngredient(
+                        user_id=user_id,
+                        ingredient_id=ingredient_id,
+                        amount=change))
+                continue
+            row.amount += change
+            if row.amount > 0:
+                changed.append(row)
+            else:
+                emptied.append(row.id)
+    if changed:
+        ShoppingIngredient.objects.bulk_update(
+            changed, ['amount'], batch_size=BATCH_SIZE)
+    if emptied:
+        ShoppingIngredient.objects.filter(id__in=emptied).delete()
+    if created:
+        insert_rows(created, retries)
+
+
+def insert_rows(rows, retries):
+    try:
+        # A concurrent transaction may have inserted some of the rows.
+        with transaction.atomic():
+            ShoppingIngredient.objects.bulk_create(
+                rows, batch_size=BATCH_SIZE)
+    except IntegrityError:
+        if not retries:
+            raise
+        # The rows exist now, so the retry adds to them instead.
+        missing = {}
+        for row in rows:
+            missing.setdefault(row.user_id, {})[row.ingredient_id] = (
+                row.amount)
+        for user_id, user_delta in missing.items():
+            apply_batch([user_id], user_delta, retries - 1)
+
+
+def add_recipe(user, recipe):
+    apply_delta([user.id], recipe_amounts(recipe))
+
+
+def remove_recipe(user, recipe):
+    apply_delta([user.id], {
+        key: -value for key, value in recipe_amounts(recipe).items()})
+
+
+def recipe_changed(recipe, old_amounts, new_amounts):
+    """Apply an edit of the recipe's ingredients to the carts holding it.
+    """
+    delta = {
+        key: new_amounts.get(key, 0) - old_amounts.get(key, 0)
+        for key in set(old_amounts) | set(new_amounts)}
+    user_ids = list(Shopping.objects.filter(
+        recipe=recipe).values_list('user_id', flat=True))
+    apply_delta(user_ids, delta)
+
+
+def recipe_deleted(recipe):
+    lock_recipe(recipe)
+    recipe_changed(recipe, recipe_amounts(recipe), {})
+
+
+def expected_totals(user_ids=None):
+    # One filter() call, so both conditions share the cart join.
+    if user_ids is None:
+        queryset = RecipeIngredient.objects.filter(
+            recipe__shopping_recipe__isnull=False)
+    else:
+        queryset = RecipeIngredient.objects.filter(
+            recipe__shopping_recipe__user__in=user_ids)
+    return {
+        (row['recipe__shopping_recipe__user'], row['ingredient']):
+        row['total']
+        for row in queryset.values(
+            'recipe__shopping_recipe__user', 'ingredient').annotate(
+                total=Sum('amount')).iterator()}
+
+
+def stored_totals(user_ids=None):
+    queryset = ShoppingIngredient.objects.all()
+    if user_ids is not None:
+        queryset = queryset.filter(user_id__in=user_ids)
+    return {
+        (user_id, ingredient_id): amount
+        for user_id, ingredient_id, amount in queryset.values_list(
+            'user_id', 'ingredient_id', 'amount').iterator()}
+
+
+def verify(user_ids=None):
+    """Return {(user_id, ingredient_id): (stored, expected)} mismatches."""
+    expected = expected_totals(user_ids)
+    stored = stored_totals(user_ids)
+    return {
+        key: (stored.get(key), expected.get(key))
+        for key in set(expected) | set(stored)
+        if stored.get(key) != expected.get(key)}
+
+
+def rebuild(user_ids=None):
+    expected = expected_totals(user_ids)
+    with transaction.atomic():
+        queryset = ShoppingIngredient.objects.all()
+        if user_ids is not None:
+            queryset = queryset.filter(user_id__in=user_ids)
+        queryset.delete()
+        ShoppingIngredient.objects.bulk_create(
+            (ShoppingIngredient(
+                user_id=user_id, ingredient_id=ingredient_id, amount=amount)
+             for (user_id, ingredient_id), amount in expected.items()),
+            batch_size=1000)
@@ -0,0 +1,85 @@
+"""Denormalized popularity and authorship counters.
+
+Recipe.favorites_count, Recipe.in_carts_count and the UserCounter rows
+are changed in the same transaction as the rows they count (see
+recipes.signals). reconcile() finds and fixes any drift, for example
+after bulk inserts that bypass the signals.
+"""
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from recipes.models import (Favorite, Recipe, Shopping, Subscribe, User,
+                            UserCounter)
+
+
+def change_recipe(recipe_id, field, delta):
+    Recipe.objects.filter(id=recipe_id).update(
+        **{field: Greatest(F(field) + delta, 0)})
+
+
+def change_user(user_id, field, delta):
+    updated = UserCounter.objects.filter(user_id=user_id).update(
+        **{field: Greatest(F(field) + delta, 0)})
+    if not updated and delta > 0:
+        counter, created = UserCounter.objects.get_or_create(
+            user_id=user_id,
+            defaults={field: delta})
+        if not created:
+            change_user(user_id, field, delta)
+
+
+def count_of(model, field):
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')}).order_by().values(
+            field).annotate(total=Count('pk')).values('total')), 0)
+
+
+def recipe_drift():
+    return Recipe.objects.annotate(
+        actual_favorites=count_of(Favorite, 'recipe'),
+        actual_carts=count_of(Shopping, 'recipe')).filter(
+            ~Q(favorites_count=F('actual_favorites'))
+            | ~Q(in_carts_count=F('actual_carts'))).order_by('id')
+
+
+def user_drift():
+    return User.objects.annotate(
+        stored_recipes=Coalesce(F('counter__recipes_count'), 0),
+        stored_subscribers=Coalesce(F('counter__subscribers_count'), 0),
+        actual_recipes=count_of(Recipe, 'author'),
+        actual_subscribers=count_of(Subscribe, 'author')).filter(
+            ~Q(stored_recipes=F('actual_recipes'))
+            | ~Q(stored_subscribers=F('actual_subscribers'))).order_by('id')
+
+
+def reconcile(fix=True):
+    """Return the drifted recipes and users, fixing them when `fix`."""
+    with transaction.atomic():
+        recipes = list(recipe_drift())
+        users = list(user_drift())
+        if not fix:
+            return recipes, users
+        for recipe in recipes:
+            recipe.favorites_count = recipe.actual_favorites
+            recipe.in_carts_count = recipe.actual_carts
+        Recipe.objects.bulk_update(
+            recipes, ['favorites_count', 'in_carts_count'], batch_size=1000)
+        counters = [
+            UserCounter(
+                user_id=user.id,
+                recipes_count=user.actual_recipes,
+                subscribers_count=user.actual_subscribers)
+            for user in users]
+        existing = set(UserCounter.objects.filter(
+            user_id__in=[user.id for user in users]).values_list(
+                'user_id', flat=True))
+        UserCounter.objects.bulk_update(
+            [counter for counter in counters if counter.user_id in existing],
+            ['recipes_count', 'subscribers_count'],
+            batch_size=1000)
+        UserCounter.objects.bulk_create(
+            [counter for counter in counters
+             if counter.user_id not in existing],
+            batch_size=1000)
+    return recipes, users
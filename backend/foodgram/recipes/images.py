@@ -0,0 +1,113 @@
+"""Resized and re-encoded variants of recipe images.
+
+Variants are produced off the request: after the transaction that saved
+a new image commits, the recipe is handed to a small thread pool. The
+variant file names are stored on the recipe as JSON, so serializers can
+build their URLs without extra queries.
+"""
+import io
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from PIL import Image, ImageOps
+
+from recipes.models import Recipe
+from recipes.versions import RECIPE, bump_version
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {
+    'jpeg': ('JPEG', {'quality': 85, 'optimize': True, 'progressive': True}),
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'avif': ('AVIF', {'quality': 60}),
+}
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.IMAGE_VARIANTS_WORKERS,
+    thread_name_prefix='image-variants')
+
+
+def available_formats():
+    """Configured formats that this Pillow build can encode."""
+    Image.init()
+    return [
+        name for name in settings.IMAGE_VARIANTS_FORMATS
+        if FORMATS[name][0] in Image.SAVE]
+
+
+def variants_of(recipe):
+    """{size: {format: file name}} of the recipe, empty when not ready."""
+    if not recipe.image_variants:
+        return {}
+    return json.loads(recipe.image_variants)
+
+
+def encode(image, file_format):
+    encoder, options = FORMATS[file_format]
+    if encoder == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    buffer = io.BytesIO()
+    image.save(buffer, encoder, **options)
+    return buffer.getvalue()
+
+
+def render(recipe):
+    """Save every variant of the recipe's image, return their names."""
+    with recipe.image.open('rb') as file:
+        original = ImageOps.exif_transpose(Image.open(file))
+        original.load()
+    if original.mode not in ('RGB', 'RGBA'):
+        original = original.convert('RGBA' if 'A' in original.mode else 'RGB')
+    variants = {}
+    for size, box in settings.IMAGE_VARIANTS_SIZES.items():
+        image = original.copy()
+        image.thumbnail(box, Image.LANCZOS)
+        variants[size] = {}
+        for file_format in available_formats():
+            name = default_storage.save(
+                f'recipe/variants/{size}.{file_format}',
+                ContentFile(encode(image, file_format)))
+            variants[size][file_format] = name
+    return variants
+
+
+def process(recipe):
+    """Build the variants of the recipe's current image.
+
+    Nothing is stored when the image changed again while the variants
+    were being rendered. Files of replaced variants may be shared with
+    other recipes and are left to the sweep_media command.
+    """
+    image = recipe.image.name
+    variants = render(recipe) if image else {}
+    image_variants = json.dumps(variants) if variants else ''
+    if Recipe.objects.filter(id=recipe.id, image=image).update(
+            image_variants=image_variants):
+        recipe.image_variants = image_variants
+        # Cached responses carry the variant URLs.
+        bump_version(RECIPE.format(recipe.id))
+
+
+def process_by_id(recipe_id, image):
+    try:
+        process(Recipe.objects.get(id=recipe_id, image=image))
+    except Recipe.DoesNotExist:
+        pass
+    except Exception:
+        logger.exception('Image variants of recipe %s failed', recipe_id)
+    finally:
+        connection.close()
+
+
+def schedule(recipe):
+    """Build the variants once the current transaction commits."""
+    if settings.IMAGE_VARIANTS_SYNC:
+        process(recipe)
+        return
+    transaction.on_commit(lambda: executor.submit(
+        process_by_id, recipe.id, recipe.image.name))
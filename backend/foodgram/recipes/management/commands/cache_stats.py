@@ -0,0 +1,21 @@
+from django.core.management import BaseCommand, CommandError
+
+from api import response_cache
+from recipes.versions import is_shared_cache
+
+
+class Command(BaseCommand):
+    help = 'Show hit/miss counts of the anonymous recipe response cache.'
+
+    def handle(self, *args, **options):
+        if not is_shared_cache():
+            raise CommandError(
+                'Counts are kept in the per-process local memory cache, '
+                'set a shared CACHE_BACKEND or read '
+                'foodgram_anonymous_cache_requests_total from /metrics')
+        stats = response_cache.stats()
+        total = stats['hits'] + stats['misses']
+        ratio = stats['hits'] / total if total else 0
+        print(
+            f'hits {stats["hits"]}, misses {stats["misses"]}, '
+            f'hit ratio {ratio:.1%}')
@@ -1,32 +1,175 @@
+import csv
+import io
 import json
+import os
 
-from django.core.management import BaseCommand
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
 
+from recipes import documents
 from recipes.models import Ingredient
+from recipes.versions import bump_version
 
-ALREDY_LOADED_ERROR_MESSAGE = """
-If you need to reload the child data from the CSV file,
-first delete the db.sqlite3 file to destroy the database.
-Then, run `python manage.py migrate` for a new empty
-database with tables"""
+DEFAULT_FILE = './data/ingredients.json'
+READ_SIZE = 64 * 1024
+
+
+def normalize(name, measurement_unit):
+    return (' '.join(name.split()).casefold(),
+            ' '.join(measurement_unit.split()).casefold())
+
+
+def decode_rows(decoder, buffer):
+    """Decode the complete array items at the start of the buffer."""
+    rows = []
+    while True:
+        buffer = buffer.lstrip().lstrip(',').lstrip()
+        if not buffer or buffer.startswith(']'):
+            return rows, buffer
+        try:
+            row, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            return rows, buffer
+        rows.append(row)
+        buffer = buffer[end:]
+
+
+def iter_json(file):
+    """Yield the objects of a top-level JSON array without loading it."""
+    decoder = json.JSONDecoder()
+    buffer, started = '', False
+    for chunk in iter(lambda: file.read(READ_SIZE), ''):
+        buffer += chunk
+        if not started:
+            buffer = buffer.lstrip()
+            if not buffer:
+                continue
+            if not buffer.startswith('['):
+                raise CommandError('Expected a JSON array')
+            buffer, started = buffer[1:], True
+        rows, buffer = decode_rows(decoder, buffer)
+        yield from rows
+    if buffer.strip() != ']':
+        raise CommandError('Malformed JSON array')
+
+
+def iter_csv(file):
+    for row in csv.reader(file):
+        if row:
+            yield {'name': row[0], 'measurement_unit': row[1]}
+
+
+def batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
 
 
 class Command(BaseCommand):
+    help = (
+        'Load or sync the ingredient catalogue from a JSON or CSV file. '
+        'Rows are matched by (name, measurement_unit); rows that differ '
+        'from a stored one only in case or spacing update it.')
 
-    def handle(self, *args, **options):
-        # Show this if the data already exist in the database
-        if (Ingredient.objects.count() > 0):
-            print('data already loaded...exiting.')
-            print(ALREDY_LOADED_ERROR_MESSAGE)
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--file',
+            default=DEFAULT_FILE,
+            help='JSON array or CSV (name,measurement_unit) file.')
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000)
+        parser.add_argument(
+            '--copy',
+            action='store_true',
+            help='Insert new rows with COPY (PostgreSQL only).')
+
+    def insert(self, ingredients, use_copy):
+        if not use_copy:
+            Ingredient.objects.bulk_create(ingredients)
             return
-        # Show this before loading the data into the database
-        print("Loading all data...")
-        data = open('./data/ingredients.json', encoding='utf-8').read()
-        json_data = json.loads(data)
-        # Code to load the data into database
-        for row in json_data:
-            ingredient = Ingredient(
-                name=row['name'],
-                measurement_unit=row['measurement_unit'])
-            ingredient.save()
-        print('...done')
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for ingredient in ingredients:
+            writer.writerow((ingredient.name, ingredient.measurement_unit))
+        buffer.seek(0)
+        with connection.cursor() as cursor:
+            cursor.cursor.copy_expert(
+                f'COPY {Ingredient._meta.db_table} '
+                '(name, measurement_unit) FROM STDIN WITH CSV',
+                buffer)
+
+    def update(self, changed, stored_ids):
+        """Rename the stored rows, changed maps stored to new keys."""
+        missing = [key for key in changed if key not in stored_ids]
+        stored_rows = Ingredient.objects.filter(
+            name__in=[name for name, _ in missing]).values_list(
+                'id', 'name', 'measurement_unit')
+        for pk, name, unit in stored_rows:
+            stored_ids[(name, unit)] = pk
+        Ingredient.objects.bulk_update(
+            [Ingredient(
+                id=stored_ids[stored],
+                name=key[0],
+                measurement_unit=key[1])
+             for stored, key in changed.items()],
+            ['name', 'measurement_unit'])
+        # bulk_update sends no signals.
+        documents.mark_stale_where(
+            recipe_ingredient_recipe__ingredient_id__in=[
+                stored_ids[stored] for stored in changed])
+
+    def handle(self, *args, **options):
+        path = options['file']
+        use_copy = options['copy']
+        if use_copy and connection.vendor != 'postgresql':
+            raise CommandError('--copy needs a PostgreSQL database')
+        reader = iter_csv if path.endswith('.csv') else iter_json
+        if not os.path.exists(path):
+            raise CommandError(f'No such file: {path}')
+        exact = set(Ingredient.objects.values_list(
+            'name', 'measurement_unit'))
+        normalized = {
+            normalize(*key): key for key in exact}
+        stored_ids = {}
+        # Normalized keys of this run: the first of several variants in
+        # one file wins, so a second run finds nothing to change.
+        seen = set()
+        inserted = updated = unchanged = duplicates = 0
+        print(f'Loading ingredients from {path}...')
+        with open(path, encoding='utf-8') as file, transaction.atomic():
+            for batch in batches(reader(file), options['batch_size']):
+                new, changed = [], {}
+                for row in batch:
+                    key = (row['name'].strip(),
+                           row['measurement_unit'].strip())
+                    normal = normalize(*key)
+                    if normal in seen:
+                        duplicates += 1
+                        continue
+                    seen.add(normal)
+                    if key in exact:
+                        unchanged += 1
+                        continue
+                    stored = normalized.get(normal)
+                    if stored is None:
+                        new.append(Ingredient(
+                            name=key[0], measurement_unit=key[1]))
+                    else:
+                        changed[stored] = key
+                if changed:
+                    self.update(changed, stored_ids)
+                    updated += len(changed)
+                if new:
+                    self.insert(new, use_copy)
+                    inserted += len(new)
+            bump_version('ingredients')
+        print(
+            f'...done: {inserted} inserted, {updated} updated, '
+            f'{unchanged} unchanged, {duplicates} duplicates skipped')
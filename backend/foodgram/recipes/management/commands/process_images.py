@@ -0,0 +1,37 @@
+from django.core.management import BaseCommand
+
+from recipes import images
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Build the missing image variants of recipes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Rebuild the variants of every recipe.')
+        parser.add_argument(
+            '--recipe',
+            type=int,
+            action='append',
+            dest='recipes',
+            help='Limit to the recipe id, may be repeated.')
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='').order_by('id')
+        if not options['all']:
+            recipes = recipes.filter(image_variants='')
+        if options['recipes']:
+            recipes = recipes.filter(id__in=options['recipes'])
+        done = failed = 0
+        for recipe in recipes.iterator():
+            try:
+                images.process(recipe)
+            except (OSError, ValueError) as error:
+                print(f'recipe {recipe.id}: {error}')
+                failed += 1
+            else:
+                done += 1
+        print(f'{done} recipes processed, {failed} failed')
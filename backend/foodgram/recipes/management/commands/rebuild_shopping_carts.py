@@ -0,0 +1,33 @@
+from django.core.management import BaseCommand
+
+from recipes import carts
+
+
+class Command(BaseCommand):
+    help = 'Rebuild or verify the shopping cart totals (ShoppingIngredient).'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Only report totals that differ from the carts.')
+        parser.add_argument(
+            '--user',
+            type=int,
+            action='append',
+            dest='users',
+            help='Limit to the user id, may be repeated.')
+
+    def handle(self, *args, **options):
+        mismatches = carts.verify(options['users'])
+        for (user_id, ingredient_id), (stored, expected) in sorted(
+                mismatches.items()):
+            print(
+                f'user {user_id} ingredient {ingredient_id}: '
+                f'stored {stored}, expected {expected}')
+        print(f'{len(mismatches)} mismatched totals')
+        if options['verify'] or not mismatches:
+            return
+        print('Rebuilding shopping cart totals...')
+        carts.rebuild(options['users'])
+        print('...done')
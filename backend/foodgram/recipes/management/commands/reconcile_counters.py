@@ -0,0 +1,30 @@
+from django.core.management import BaseCommand
+
+from recipes import counters
+
+
+class Command(BaseCommand):
+    help = 'Find and fix drift of the recipe and user counters.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report drifted counters.')
+
+    def handle(self, *args, **options):
+        recipes, users = counters.reconcile(fix=not options['dry_run'])
+        for recipe in recipes:
+            print(
+                f'recipe {recipe.id}: '
+                f'favorites {recipe.favorites_count} -> '
+                f'{recipe.actual_favorites}, '
+                f'carts {recipe.in_carts_count} -> {recipe.actual_carts}')
+        for user in users:
+            print(
+                f'user {user.id}: '
+                f'recipes {user.stored_recipes} -> {user.actual_recipes}, '
+                f'subscribers {user.stored_subscribers} -> '
+                f'{user.actual_subscribers}')
+        action = 'found' if options['dry_run'] else 'fixed'
+        print(f'{len(recipes) + len(users)} drifted counters {action}')
@@ -0,0 +1,253 @@
+import itertools
+import multiprocessing
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import BaseCommand, CommandError
+from django.db import connections, transaction
+
+from recipes import carts, counters
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            RecipeTag, Shopping, Subscribe, Tag, User)
+
+DEFAULT_TAGS = (
+    ('Завтрак', 'breakfast', '#E26C2D'),
+    ('Обед', 'lunch', '#49B64E'),
+    ('Ужин', 'dinner', '#8775D2'),
+)
+PASSWORD = 'password'
+IMAGE = 'recipe/seed.png'
+INGREDIENTS_PER_RECIPE = (3, 12)
+ZIPF_EXPONENT = 1.1
+PARETO_SHAPE = 2.0
+
+# Filled by the parent process before the workers are forked.
+STATE = {}
+
+
+def zipf_weights(size, rnd):
+    """Cumulative power-law weights over a shuffled range of ranks."""
+    ranks = list(range(size))
+    rnd.shuffle(ranks)
+    return list(itertools.accumulate(
+        1 / (rank + 1) ** ZIPF_EXPONENT for rank in ranks))
+
+
+def pareto_count(rnd, mean, limit):
+    """Heavy-tailed number of items per user with the given mean."""
+    value = rnd.paretovariate(PARETO_SHAPE)
+    value *= mean * (PARETO_SHAPE - 1) / PARETO_SHAPE
+    return min(int(value), limit)
+
+
+def pick(rnd, population, cum_weights, count, exclude=None):
+    """Up to `count` distinct items drawn with power-law popularity."""
+    chosen = set()
+    for _ in range(4):
+        if len(chosen) >= count:
+            break
+        chosen.update(rnd.choices(
+            population, cum_weights=cum_weights, k=count - len(chosen)))
+        chosen.discard(exclude)
+    return chosen
+
+
+def chunk_random(part, chunk):
+    return random.Random(f'{STATE["seed"]}:{part}:{chunk}')
+
+
+def fill_recipes(chunk, recipe_ids):
+    rnd = chunk_random('recipes', chunk)
+    tags, ingredients = STATE['tags'], STATE['ingredients']
+    recipe_tags, recipe_ingredients = [], []
+    for recipe_id in recipe_ids:
+        for tag_id in pick(
+                rnd, tags, STATE['tag_weights'], rnd.randint(1, len(tags))):
+            recipe_tags.append(RecipeTag(recipe_id=recipe_id, tag_id=tag_id))
+        for ingredient_id in pick(
+                rnd, ingredients, STATE['ingredient_weights'],
+                rnd.randint(*INGREDIENTS_PER_RECIPE)):
+            recipe_ingredients.append(RecipeIngredient(
+                recipe_id=recipe_id,
+                ingredient_id=ingredient_id,
+                amount=rnd.randint(1, 500)))
+    with transaction.atomic():
+        RecipeTag.objects.bulk_create(
+            recipe_tags, batch_size=STATE['batch_size'])
+        RecipeIngredient.objects.bulk_create(
+            recipe_ingredients, batch_size=STATE['batch_size'])
+    return len(recipe_tags) + len(recipe_ingredients)
+
+
+def fill_users(chunk, user_ids):
+    rnd = chunk_random('users', chunk)
+    recipes, authors = STATE['recipes'], STATE['authors']
+    favorites, cart, subscriptions = [], [], []
+    for user_id in user_ids:
+        for recipe_id in pick(
+                rnd, recipes, STATE['recipe_weights'],
+                pareto_count(rnd, STATE['favorites'], len(recipes))):
+            favorites.append(Favorite(user_id=user_id, recipe_id=recipe_id))
+        for recipe_id in pick(
+                rnd, recipes, STATE['recipe_weights'],
+                pareto_count(rnd, STATE['carts'], len(recipes))):
+            cart.append(Shopping(user_id=user_id, recipe_id=recipe_id))
+        for author_id in pick(
+                rnd, authors, STATE['author_weights'],
+                pareto_count(rnd, STATE['subscriptions'], len(authors) - 1),
+                exclude=user_id):
+            subscriptions.append(Subscribe(
+                subscriber_id=user_id, author_id=author_id))
+    with transaction.atomic():
+        Favorite.objects.bulk_create(
+            favorites, batch_size=STATE['batch_size'])
+        Shopping.objects.bulk_create(cart, batch_size=STATE['batch_size'])
+        Subscribe.objects.bulk_create(
+            subscriptions, batch_size=STATE['batch_size'])
+    return len(favorites) + len(cart) + len(subscriptions)
+
+
+def run_task(task):
+    function, chunk, ids = task
+    return function(chunk, ids)
+
+
+def init_worker():
+    # Forked workers must not share the parent's database connection.
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate a reproducible synthetic data set for load tests: users, '
+        'recipes built from the ingredient catalogue and power-law '
+        'favorites, shopping carts and subscriptions.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument(
+            '--favorites', type=float, default=20,
+            help='Average favorites per user.')
+        parser.add_argument(
+            '--carts', type=float, default=3,
+            help='Average shopping cart recipes per user.')
+        parser.add_argument(
+            '--subscriptions', type=float, default=5,
+            help='Average subscriptions per user.')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--processes', type=int, default=1,
+            help='Worker processes for the relation tables.')
+
+    def create_users(self, count, seed):
+        prefix = f'seed{seed}_'
+        if User.objects.filter(username__startswith=prefix).exists():
+            raise CommandError(
+                f'Users of seed {seed} already exist, use another --seed')
+        password = make_password(PASSWORD)
+        self.created_users = True
+        User.objects.bulk_create(
+            (User(
+                username=f'{prefix}{idx}',
+                email=f'{prefix}{idx}@foodgram.ru',
+                first_name='Seed',
+                last_name=f'User {idx}',
+                password=password)
+             for idx in range(count)),
+            batch_size=STATE['batch_size'])
+        return list(User.objects.filter(
+            username__startswith=prefix).order_by('id').values_list(
+                'id', flat=True))
+
+    def create_recipes(self, count, users, author_weights, rnd):
+        first = Recipe.objects.order_by('-id').values_list(
+            'id', flat=True).first() or 0
+        Recipe.objects.bulk_create(
+            (Recipe(
+                author_id=author_id,
+                name=f'Рецепт {STATE["seed"]}-{idx}',
+                text='Описание рецепта',
+                cooking_time=rnd.randint(5, 180),
+                image=IMAGE)
+             for idx, author_id in enumerate(rnd.choices(
+                 users, cum_weights=author_weights, k=count))),
+            batch_size=STATE['batch_size'])
+        return list(Recipe.objects.filter(id__gt=first).order_by(
+            'id').values_list('id', flat=True))
+
+    def run(self, function, ids, processes):
+        size = STATE['batch_size']
+        tasks = [
+            (function, chunk, ids[start:start + size])
+            for chunk, start in enumerate(range(0, len(ids), size))]
+        if processes == 1:
+            return sum(map(run_task, tasks))
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        with context.Pool(processes, initializer=init_worker) as pool:
+            return sum(pool.imap_unordered(run_task, tasks))
+
+    def handle(self, *args, **options):
+        if options['processes'] == 1:
+            with transaction.atomic():
+                self.generate(options)
+            return
+        if connections['default'].vendor == 'sqlite':
+            raise CommandError('--processes needs a client-server database')
+        # Forked workers only see committed rows, so a failed run is
+        # rolled back by deleting its users along with their rows.
+        self.created_users = False
+        try:
+            self.generate(options)
+        except BaseException:
+            if self.created_users:
+                User.objects.filter(
+                    username__startswith=f'seed{options["seed"]}_').delete()
+            raise
+
+    def generate(self, options):
+        seed, processes = options['seed'], options['processes']
+        ingredients = list(Ingredient.objects.order_by('id').values_list(
+            'id', flat=True))
+        if not ingredients:
+            raise CommandError('No ingredients, run load_all_data first')
+        if not Tag.objects.exists():
+            Tag.objects.bulk_create(
+                Tag(name=name, slug=slug, color=color)
+                for name, slug, color in DEFAULT_TAGS)
+        tags = list(Tag.objects.order_by('id').values_list('id', flat=True))
+        rnd = random.Random(seed)
+        STATE.update(
+            seed=seed,
+            batch_size=options['batch_size'],
+            favorites=options['favorites'],
+            carts=options['carts'],
+            subscriptions=options['subscriptions'],
+            tags=tags,
+            tag_weights=zipf_weights(len(tags), rnd),
+            ingredients=ingredients,
+            ingredient_weights=zipf_weights(len(ingredients), rnd))
+        print(f'Creating {options["users"]} users...')
+        users = self.create_users(options['users'], seed)
+        print(f'Creating {options["recipes"]} recipes...')
+        # Prolific authors are also the most followed ones.
+        author_weights = zipf_weights(len(users), rnd)
+        recipes = self.create_recipes(
+            options['recipes'], users, author_weights, rnd)
+        STATE.update(
+            recipes=recipes,
+            recipe_weights=zipf_weights(len(recipes), rnd),
+            authors=users,
+            author_weights=author_weights)
+        rows = self.run(fill_recipes, recipes, processes)
+        print(f'{rows} recipe tags and ingredients created')
+        rows = self.run(fill_users, users, processes)
+        print(f'{rows} favorites, cart rows and subscriptions created')
+        print('Rebuilding shopping carts and counters...')
+        size = options['batch_size']
+        for start in range(0, len(users), size):
+            carts.rebuild(users[start:start + size])
+        counters.reconcile()
+        print('...done')
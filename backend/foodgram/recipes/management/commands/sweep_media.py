@@ -0,0 +1,75 @@
+import posixpath
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management import BaseCommand
+from django.utils import timezone
+
+from recipes import images
+from recipes.models import ImageUpload, Recipe
+
+ROOTS = ('recipe',)
+
+
+def walk(storage, directory):
+    directories, files = storage.listdir(directory)
+    for name in files:
+        yield posixpath.join(directory, name)
+    for name in directories:
+        yield from walk(storage, posixpath.join(directory, name))
+
+
+def referenced_names():
+    names = set()
+    for recipe in Recipe.objects.only(
+            'id', 'image', 'image_variants').iterator():
+        names.add(recipe.image.name)
+        for formats in images.variants_of(recipe).values():
+            names.update(formats.values())
+    names.update(ImageUpload.objects.values_list('image', flat=True))
+    return names
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete media files that no recipe, image variant or pending '
+        'upload refers to, and expired uploads.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report the orphaned files.')
+        parser.add_argument(
+            '--grace',
+            type=int,
+            default=60 * 60,
+            help='Keep files younger than this many seconds.')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        expired = ImageUpload.objects.filter(
+            created__lt=now - timedelta(seconds=settings.IMAGE_UPLOAD_TTL))
+        if options['dry_run']:
+            print(f'{expired.count()} expired uploads')
+        else:
+            deleted, _ = expired.delete()
+            print(f'{deleted} expired uploads deleted')
+        # Files written after this point are protected by the grace time.
+        referenced = referenced_names()
+        keep_after = now - timedelta(seconds=options['grace'])
+        orphans = freed = 0
+        for root in ROOTS:
+            if not default_storage.exists(root):
+                continue
+            for name in walk(default_storage, root):
+                if name in referenced or (
+                        default_storage.get_modified_time(name) > keep_after):
+                    continue
+                orphans += 1
+                freed += default_storage.size(name)
+                if not options['dry_run']:
+                    default_storage.delete(name)
+        action = 'found' if options['dry_run'] else 'deleted'
+        print(f'{orphans} orphaned files ({freed} bytes) {action}')
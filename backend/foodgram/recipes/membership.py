@@ -0,0 +1,116 @@
+"""Per-user membership sets kept in the Django cache.
+
+For every user the cache holds the ids of favorite recipes, of recipes
+in the shopping cart and of followed authors, each as a packed array of
+unsigned ints. Sets are loaded on first use and can be evicted at any
+time. Every set is stored under the version stamp of its user and kind,
+read before the database; a changed Favorite, Shopping or Subscribe row
+bumps the stamp once the transaction commits, so a set loaded before
+the change is never read again. A MEMBERSHIP_CACHE_TIMEOUT of 0 turns
+the cache off: other workers with private caches would miss the bumps.
+"""
+from array import array
+
+from django.conf import settings
+from django.core.cache import cache
+
+from recipes import replicas
+from recipes.models import Favorite, Shopping, Subscribe
+from recipes.versions import bump_version, get_version
+
+SOURCES = {
+    'favorites': (Favorite, 'user_id', 'recipe_id'),
+    'cart': (Shopping, 'user_id', 'recipe_id'),
+    'subscriptions': (Subscribe, 'subscriber_id', 'author_id'),
+}
+KINDS = {model: kind for kind, (model, _, _) in SOURCES.items()}
+KEY = 'membership:{}:{}:{}'
+# Version stamp of one set, see recipes.versions.
+STAMP = 'membership:{}:{}'
+TYPECODE = 'I'
+
+
+def pack(ids):
+    return array(TYPECODE, sorted(ids)).tobytes()
+
+
+def unpack(data):
+    ids = array(TYPECODE)
+    ids.frombytes(data)
+    return frozenset(ids)
+
+
+def members(user_id, kind):
+    """Queryset of the member ids, usable as a subquery."""
+    model, owner, member = SOURCES[kind]
+    return model.objects.filter(**{owner: user_id}).values(member)
+
+
+def load_ids(user_id, kind):
+    _, _, member = SOURCES[kind]
+    with replicas.primary():
+        return pack(
+            row[member] for row in members(user_id, kind).iterator())
+
+
+def get_ids(user_id, kind):
+    if not settings.MEMBERSHIP_CACHE_TIMEOUT:
+        return unpack(load_ids(user_id, kind))
+    stamp = get_version(STAMP.format(kind, user_id))
+    key = KEY.format(kind, user_id, stamp)
+    data = cache.get(key)
+    if data is None:
+        data = load_ids(user_id, kind)
+        cache.set(key, data, settings.MEMBERSHIP_CACHE_TIMEOUT)
+    return unpack(data)
+
+
+def row_changed(instance):
+    """Drop the cached set of an added or removed Favorite, Shopping
+    or Subscribe row once the transaction commits.
+    """
+    kind = KINDS[type(instance)]
+    _, owner, _ = SOURCES[kind]
+    bump_version(STAMP.format(kind, getattr(instance, owner)))
+
+
+def evict(user_id, kinds=tuple(SOURCES)):
+    for kind in kinds:
+        cache.delete(KEY.format(
+            kind, user_id, get_version(STAMP.format(kind, user_id))))
+
+
+class Membership:
+    """Membership sets of one user, loaded lazily once per request."""
+
+    def __init__(self, user):
+        self.user_id = None if user.is_anonymous else user.id
+        self._sets = {}
+
+    def _get(self, kind):
+        if self.user_id is None:
+            return frozenset()
+        if kind not in self._sets:
+            self._sets[kind] = get_ids(self.user_id, kind)
+        return self._sets[kind]
+
+    @property
+    def favorites(self):
+        return self._get('favorites')
+
+    @property
+    def cart(self):
+        return self._get('cart')
+
+    @property
+    def subscriptions(self):
+        return self._get('subscriptions')
+
+
+def for_request(request):
+    membership = getattr(request, '_membership', None)
+    if membership is None or membership.user_id != getattr(
+            request.user, 'id', None):
+        membership = Membership(request.user)
+        request._membership = membership
+    return membership
@@ -0,0 +1,46 @@
+# Generated by Django 2.2.19 on 2026-10-18 17:24
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_shopping_ingredients(apps, schema_editor):
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    ShoppingIngredient = apps.get_model('recipes', 'ShoppingIngredient')
+    totals = RecipeIngredient.objects.filter(
+        recipe__shopping_recipe__isnull=False).values(
+            'recipe__shopping_recipe__user', 'ingredient').annotate(
+                total=models.Sum('amount'))
+    ShoppingIngredient.objects.bulk_create(
+        ShoppingIngredient(
+            user_id=row['recipe__shopping_recipe__user'],
+            ingredient_id=row['ingredient'],
+            amount=row['total'])
+        for row in totals.iterator())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0015_recipe_ingredients'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingIngredient',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.PositiveIntegerField(default=0, verbose_name='Количество')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_ingredient_ingredient', to='recipes.Ingredient', verbose_name='Ингредиент')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_ingredient_user', to=settings.AUTH_USER_MODEL, verbose_name='Покупатель')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='shoppingingredient',
+            constraint=models.UniqueConstraint(fields=('user', 'ingredient'), name='unique_user_ingredient_shopping'),
+        ),
+        migrations.RunPython(
+            fill_shopping_ingredients, migrations.RunPython.noop),
+    ]
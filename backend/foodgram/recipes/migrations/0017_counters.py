@@ -0,0 +1,57 @@
+# Generated by Django 2.2.19 on 2026-10-18 17:26
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_counters(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    UserCounter = apps.get_model('recipes', 'UserCounter')
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    recipes = Recipe.objects.annotate(
+        favorites_total=models.Count('favorite_recipe', distinct=True),
+        carts_total=models.Count('shopping_recipe', distinct=True))
+    for recipe in recipes.iterator():
+        Recipe.objects.filter(id=recipe.id).update(
+            favorites_count=recipe.favorites_total,
+            in_carts_count=recipe.carts_total)
+    users = User.objects.annotate(
+        recipes_total=models.Count('recipe_author', distinct=True),
+        subscribers_total=models.Count('subscribe_author', distinct=True))
+    UserCounter.objects.bulk_create(
+        UserCounter(
+            user_id=user.id,
+            recipes_count=user.recipes_total,
+            subscribers_count=user.subscribers_total)
+        for user in users.iterator())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0011_update_proxy_permissions'),
+        ('recipes', '0016_shoppingingredient'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserCounter',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='counter', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+                ('recipes_count', models.PositiveIntegerField(default=0, verbose_name='Рецептов')),
+                ('subscribers_count', models.PositiveIntegerField(default=0, verbose_name='Подписчиков')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='В избранном'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='in_carts_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='В списках покупок'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,151 @@
+from django.db import migrations
+
+# PostgreSQL only: a trigger-maintained tsvector over the recipe name,
+# its ingredient names and its text, weighted in that order, with a
+# GIN index. Other databases use the fallback in recipes.search.
+# Ingredient rows recompute a recipe once per statement: transition
+# tables are allowed only on single-event triggers without a column
+# list, hence three triggers sharing one function; updates that only
+# change the amount are skipped.
+FORWARD = [
+    'ALTER TABLE recipes_recipe ADD COLUMN search_vector tsvector',
+    """
+    CREATE FUNCTION recipes_recipe_search_vector(
+        recipe_name text, recipe_text text, recipe_id integer)
+    RETURNS tsvector LANGUAGE sql STABLE AS $$
+        SELECT setweight(to_tsvector('russian', coalesce($1, '')), 'A')
+            || setweight(to_tsvector('russian', coalesce((
+                SELECT string_agg(ingredient.name, ' ')
+                FROM recipes_recipeingredient link
+                JOIN recipes_ingredient ingredient
+                    ON ingredient.id = link.ingredient_id
+                WHERE link.recipe_id = $3), '')), 'B')
+            || setweight(to_tsvector('russian', coalesce($2, '')), 'C')
+    $$
+    """,
+    """
+    CREATE FUNCTION recipes_recipe_search_trigger()
+    RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        NEW.search_vector := recipes_recipe_search_vector(
+            NEW.name, NEW.text, NEW.id);
+        RETURN NEW;
+    END
+    $$
+    """,
+    """
+    CREATE TRIGGER recipes_recipe_search
+    BEFORE INSERT OR UPDATE OF name, text ON recipes_recipe
+    FOR EACH ROW EXECUTE PROCEDURE recipes_recipe_search_trigger()
+    """,
+    """
+    CREATE FUNCTION recipes_recipeingredient_search_trigger()
+    RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            UPDATE recipes_recipe
+            SET search_vector = recipes_recipe_search_vector(name, text, id)
+            WHERE id IN (SELECT recipe_id FROM new_links);
+        ELSIF TG_OP = 'DELETE' THEN
+            UPDATE recipes_recipe
+            SET search_vector = recipes_recipe_search_vector(name, text, id)
+            WHERE id IN (SELECT recipe_id FROM old_links);
+        ELSE
+            UPDATE recipes_recipe
+            SET search_vector = recipes_recipe_search_vector(name, text, id)
+            WHERE id IN (
+                SELECT unnest(ARRAY[old_link.recipe_id, new_link.recipe_id])
+                FROM old_links old_link
+                JOIN new_links new_link ON new_link.id = old_link.id
+                WHERE old_link.recipe_id <> new_link.recipe_id
+                    OR old_link.ingredient_id <> new_link.ingredient_id);
+        END IF;
+        RETURN NULL;
+    END
+    $$
+    """,
+    """
+    CREATE TRIGGER recipes_recipeingredient_search_insert
+    AFTER INSERT ON recipes_recipeingredient
+    REFERENCING NEW TABLE AS new_links
+    FOR EACH STATEMENT
+    EXECUTE PROCEDURE recipes_recipeingredient_search_trigger()
+    """,
+    """
+    CREATE TRIGGER recipes_recipeingredient_search_delete
+    AFTER DELETE ON recipes_recipeingredient
+    REFERENCING OLD TABLE AS old_links
+    FOR EACH STATEMENT
+    EXECUTE PROCEDURE recipes_recipeingredient_search_trigger()
+    """,
+    """
+    CREATE TRIGGER recipes_recipeingredient_search_update
+    AFTER UPDATE ON recipes_recipeingredient
+    REFERENCING OLD TABLE AS old_links NEW TABLE AS new_links
+    FOR EACH STATEMENT
+    EXECUTE PROCEDURE recipes_recipeingredient_search_trigger()
+    """,
+    """
+    CREATE FUNCTION recipes_ingredient_search_trigger()
+    RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        UPDATE recipes_recipe
+        SET search_vector = recipes_recipe_search_vector(name, text, id)
+        WHERE id IN (
+            SELECT recipe_id FROM recipes_recipeingredient
+            WHERE ingredient_id = NEW.id);
+        RETURN NULL;
+    END
+    $$
+    """,
+    """
+    CREATE TRIGGER recipes_ingredient_search
+    AFTER UPDATE OF name ON recipes_ingredient
+    FOR EACH ROW WHEN (OLD.name IS DISTINCT FROM NEW.name)
+    EXECUTE PROCEDURE recipes_ingredient_search_trigger()
+    """,
+    """
+    UPDATE recipes_recipe
+    SET search_vector = recipes_recipe_search_vector(name, text, id)
+    """,
+    """
+    CREATE INDEX recipes_recipe_search_vector
+    ON recipes_recipe USING gin (search_vector)
+    """,
+]
+
+BACKWARD = [
+    'DROP TRIGGER recipes_ingredient_search ON recipes_ingredient',
+    'DROP TRIGGER recipes_recipeingredient_search_update '
+    'ON recipes_recipeingredient',
+    'DROP TRIGGER recipes_recipeingredient_search_delete '
+    'ON recipes_recipeingredient',
+    'DROP TRIGGER recipes_recipeingredient_search_insert '
+    'ON recipes_recipeingredient',
+    'DROP TRIGGER recipes_recipe_search ON recipes_recipe',
+    'DROP FUNCTION recipes_ingredient_search_trigger()',
+    'DROP FUNCTION recipes_recipeingredient_search_trigger()',
+    'DROP FUNCTION recipes_recipe_search_trigger()',
+    'DROP FUNCTION recipes_recipe_search_vector(text, text, integer)',
+    'ALTER TABLE recipes_recipe DROP COLUMN search_vector',
+]
+
+
+def run(statements):
+    def apply(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return apply
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0019_imageupload'),
+    ]
+
+    operations = [
+        migrations.RunPython(run(FORWARD), run(BACKWARD)),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.19 on 2026-10-18 17:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0021_recipetag_tag_recipe_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='document',
+            field=models.TextField(blank=True, default='', editable=False, verbose_name='Документ'),
+        ),
+    ]
@@ -1,3 +1,5 @@
+import uuid
+
 from django.contrib.auth import get_user_model
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
@@ -60,6 +62,11 @@ class Recipe(models.Model):
         verbose_name='Картинка',
         upload_to='recipe',
         blank=True)
+    image_variants = models.TextField(
+        blank=True,
+        default='',
+        editable=False,
+        verbose_name='Варианты картинки')
     text = models.CharField(
         max_length=8000,
         verbose_name='Описание')
@@ -92,10 +99,106 @@ class Recipe(models.Model):
         related_name='recipe_shoping_user',
         through='Shopping'
     )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='В избранном')
+    in_carts_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='В списках покупок')
+    document = models.TextField(
+        blank=True,
+        default='',
+        editable=False,
+        verbose_name='Документ')
+
+    # Columns kept up to date with UPDATE statements (counters, image
+    # variants, stored document). Saving a loaded recipe must not write
+    # back the values it was loaded with.
+    maintained_fields = (
+        'favorites_count', 'in_carts_count', 'image_variants', 'document')
 
     def __str__(self):
         return str(self.id)
 
+    def save(self, *args, **kwargs):
+        if not args and not self._state.adding and (
+                kwargs.get('update_fields') is None):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.maintained_fields]
+        super(Recipe, self).save(*args, **kwargs)
+
+
+class DataVersion(models.Model):
+    """Creation a data set's version stamp,
+    which is the time of its last change (see recipes.versions).
+    """
+
+    name = models.CharField(
+        max_length=200,
+        unique=True,
+        verbose_name='Набор данных')
+    stamp = models.FloatField(
+        verbose_name='Версия')
+
+    def __str__(self):
+        return self.name
+
+
+class ImageUpload(models.Model):
+    """Creation a uploaded recipe image,
+    which waits to be attached to a recipe by its token.
+    """
+
+    token = models.UUIDField(
+        default=uuid.uuid4,
+        unique=True,
+        editable=False,
+        verbose_name='Токен')
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='image_uploads',
+        verbose_name='Пользователь')
+    image = models.ImageField(
+        verbose_name='Картинка',
+        upload_to='recipe')
+    width = models.PositiveIntegerField(
+        verbose_name='Ширина')
+    height = models.PositiveIntegerField(
+        verbose_name='Высота')
+    created = models.DateTimeField(
+        auto_now_add=True,
+        db_index=True,
+        verbose_name='Загружено')
+
+    def __str__(self):
+        return str(self.token)
+
+
+class UserCounter(models.Model):
+    """Creation a User's counters,
+    which are kept in step with the User's recipes and subscribers.
+    """
+
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='counter',
+        verbose_name='Пользователь'
+    )
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Рецептов')
+    subscribers_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Подписчиков')
+
+    def __str__(self):
+        return str(self.user)
+
 
 class Favorite(models.Model):
     """Creation a favorite object,
@@ -192,6 +295,40 @@ class Shopping(models.Model):
         return f'{self.user} {self.recipe}'
 
 
+class ShoppingIngredient(models.Model):
+    """Creation a shopping cart total,
+    which is an amount of one Ingredient over all recipes
+    in the User's shopping cart.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_ingredient_user',
+        verbose_name='Покупатель'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_ingredient_ingredient',
+        verbose_name='Ингредиент'
+    )
+    amount = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Количество')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_user_ingredient_shopping'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.user} {self.ingredient} {self.amount}'
+
+
 class RecipeIngredient(models.Model):
     """Creation a recipe object,
     which is an inner bonded object to Recipe and Ingredient instances.
@@ -244,7 +381,8 @@ class RecipeTag(models.Model):
         Tag,
         on_delete=models.CASCADE,
         related_name='recipe_tag_tag',
-        verbose_name='Тег'
+        verbose_name='Тег',
+        db_index=False
     )
 
     class Meta:
@@ -254,6 +392,13 @@ class RecipeTag(models.Model):
                 name='unique_recipe_tag'
             )
         ]
+        # Tag-first semi-joins of the tag filter; also replaces the
+        # plain index of the tag foreign key.
+        indexes = [
+            models.Index(
+                fields=['tag', 'recipe'],
+                name='recipe_tag_tag_recipe_idx')
+        ]
 
     def __str__(self):
         return f'{self.recipe} {self.tag}'
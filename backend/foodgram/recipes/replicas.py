@@ -0,0 +1,80 @@
+"""Routing of browse reads to read replicas.
+
+Replicas are the REPLICA_DATABASES aliases. Reads go to one of them only
+between start_reading() and stop_reading(), which
+api.mixins.ReplicaReadMixin calls around safe requests; everything
+else, writes included, uses the primary. A user
+who has just written is pinned to the primary for REPLICA_PIN_TIMEOUT
+seconds, so replication lag never hides their own changes. Pins live in
+the Django cache, which must be shared by all workers for that.
+
+Data stored in caches under the current version stamps is read with
+primary(): a lagging replica would store outdated rows under them.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+
+PIN_KEY = 'primary:{}'
+
+_alias = ContextVar('replica_alias', default=None)
+
+
+def pin(user_id):
+    if settings.REPLICA_DATABASES:
+        cache.set(PIN_KEY.format(user_id), True, settings.REPLICA_PIN_TIMEOUT)
+
+
+def is_pinned(user_id):
+    return cache.get(PIN_KEY.format(user_id)) is not None
+
+
+def alias_for(user):
+    """Replica alias for the user's reads, None for the primary."""
+    if not settings.REPLICA_DATABASES:
+        return None
+    if not user.is_anonymous and is_pinned(user.id):
+        return None
+    return random.choice(settings.REPLICA_DATABASES)
+
+
+def start_reading(alias):
+    """Send reads to the alias; returns the token for stop_reading()."""
+    return _alias.set(alias)
+
+
+def stop_reading(token):
+    _alias.reset(token)
+
+
+@contextmanager
+def reading(alias):
+    token = start_reading(alias)
+    try:
+        yield
+    finally:
+        stop_reading(token)
+
+
+def primary():
+    """Read from the primary inside the block."""
+    return reading(None)
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        return _alias.get()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
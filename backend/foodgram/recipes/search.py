@@ -0,0 +1,54 @@
+"""Ranked full-text search over recipes.
+
+On PostgreSQL recipes carry a trigger-maintained `search_vector`
+(name, ingredient names and text, Russian stemming, GIN index; see
+migration 0020). Other databases fall back to case-insensitive
+substring matching of every word, ranking name matches first.
+"""
+from django.db import connections
+from django.db.models import (Case, Exists, IntegerField, OuterRef, Q, Value,
+                              When)
+from django.db.models.expressions import RawSQL
+
+from recipes.models import RecipeIngredient
+
+CONFIG = 'russian'
+
+
+def search_postgresql(queryset, query):
+    table = queryset.model._meta.db_table
+    tsquery = f"websearch_to_tsquery('{CONFIG}', %s)"
+    return queryset.annotate(search_rank=RawSQL(
+        f'ts_rank_cd({table}.search_vector, {tsquery})', (query,))).extra(
+            where=[f'{table}.search_vector @@ {tsquery}'],
+            params=[query])
+
+
+def search_fallback(queryset, query):
+    rank = Value(0, output_field=IntegerField())
+    for idx, word in enumerate(query.split()):
+        in_ingredients = f'search_ingredient_{idx}'
+        queryset = queryset.annotate(**{in_ingredients: Exists(
+            RecipeIngredient.objects.filter(
+                recipe=OuterRef('pk'),
+                ingredient__name__icontains=word))}).filter(
+            Q(name__icontains=word)
+            | Q(text__icontains=word)
+            | Q(**{in_ingredients: True}))
+        rank = rank + Case(
+            When(name__icontains=word, then=Value(1)),
+            default=Value(0),
+            output_field=IntegerField())
+    return queryset.annotate(search_rank=rank)
+
+
+def search_recipes(queryset, query):
+    """Recipes matching every word of the query, best ranked first."""
+    query = query.strip()
+    if not query:
+        return queryset
+    if connections[queryset.db].vendor == 'postgresql':
+        queryset = search_postgresql(queryset, query)
+    else:
+        queryset = search_fallback(queryset, query)
+    return queryset.order_by('-search_rank', '-id')
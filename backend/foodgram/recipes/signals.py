@@ -0,0 +1,127 @@
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from recipes import carts, counters, documents, membership
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            RecipeTag, Shopping, Subscribe, Tag, User)
+from recipes.versions import AUTH, RECIPE, bump_version, bump_versions
+
+RECIPE_COUNTERS = {
+    Favorite: 'favorites_count',
+    Shopping: 'in_carts_count',
+}
+# User fields shown as the author of a recipe.
+AUTHOR_FIELDS = {'email', 'username', 'first_name', 'last_name'}
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def ingredient_changed(sender, instance, created=False, **kwargs):
+    bump_version('ingredients')
+    if not created:
+        documents.mark_stale_where(
+            recipe_ingredient_recipe__ingredient_id=instance.id)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def tag_changed(sender, instance, created=False, **kwargs):
+    bump_version('tags')
+    if not created:
+        documents.mark_stale_where(recipe_tag_recipe__tag_id=instance.id)
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    carts.recipe_deleted(instance)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(sender, instance, created, **kwargs):
+    if created:
+        counters.change_user(instance.author_id, 'recipes_count', 1)
+        bump_versions(['recipes', RECIPE.format(instance.id)])
+    else:
+        bump_version(RECIPE.format(instance.id))
+        documents.mark_stale([instance.id])
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_removed(sender, instance, **kwargs):
+    counters.change_user(instance.author_id, 'recipes_count', -1)
+    bump_versions(['recipes', RECIPE.format(instance.id)])
+
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def recipe_ingredient_changed(sender, instance, **kwargs):
+    bump_version(RECIPE.format(instance.recipe_id))
+    documents.mark_stale([instance.recipe_id])
+
+
+@receiver(post_save, sender=RecipeTag)
+@receiver(post_delete, sender=RecipeTag)
+def recipe_tag_changed(sender, instance, **kwargs):
+    # Tags also decide which recipes a filtered list holds.
+    bump_versions(['recipes', RECIPE.format(instance.recipe_id)])
+    documents.mark_stale([instance.recipe_id])
+
+
+@receiver(post_save, sender=User)
+def author_saved(sender, instance, created, update_fields, **kwargs):
+    if created or (
+            update_fields is not None
+            and not AUTHOR_FIELDS & set(update_fields)):
+        return
+    bump_versions(
+        RECIPE.format(recipe_id)
+        for recipe_id in Recipe.objects.filter(
+            author_id=instance.id).values_list('id', flat=True))
+    documents.mark_stale_where(author_id=instance.id)
+
+
+@receiver(post_save, sender=User)
+def credentials_saved(sender, instance, created, update_fields, **kwargs):
+    # Logging in only updates last_login.
+    if created or update_fields == {'last_login'}:
+        return
+    bump_version(AUTH.format(instance.id))
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    bump_version(AUTH.format(instance.user_id))
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=Shopping)
+def recipe_marked(sender, instance, created, **kwargs):
+    if created:
+        counters.change_recipe(
+            instance.recipe_id, RECIPE_COUNTERS[sender], 1)
+        membership.row_changed(instance)
+        if sender is Favorite:
+            bump_version(RECIPE.format(instance.recipe_id))
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=Shopping)
+def recipe_unmarked(sender, instance, **kwargs):
+    counters.change_recipe(instance.recipe_id, RECIPE_COUNTERS[sender], -1)
+    membership.row_changed(instance)
+    if sender is Favorite:
+        bump_version(RECIPE.format(instance.recipe_id))
+
+
+@receiver(post_save, sender=Subscribe)
+def subscribed(sender, instance, created, **kwargs):
+    if created:
+        counters.change_user(instance.author_id, 'subscribers_count', 1)
+        membership.row_changed(instance)
+
+
+@receiver(post_delete, sender=Subscribe)
+def unsubscribed(sender, instance, **kwargs):
+    counters.change_user(instance.author_id, 'subscribers_count', -1)
+    membership.row_changed(instance)
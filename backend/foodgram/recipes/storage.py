@@ -0,0 +1,39 @@
+"""Content-addressed media storage.
+
+Files are named after the SHA-256 of their content and sharded into
+two levels of subdirectories, e.g. recipe/3f/a2/3fa2...e1.jpeg. An
+upload identical to a stored file reuses it instead of writing a copy,
+and a name never changes its content, so it can be cached forever.
+Because files are shared, they are never deleted with the objects that
+use them; the sweep_media command removes the unreferenced ones.
+"""
+import hashlib
+import os
+import posixpath
+
+from django.core.files.storage import FileSystemStorage
+
+
+def content_hash(content):
+    digest = hashlib.sha256()
+    for chunk in content.chunks():
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ContentAddressedStorage(FileSystemStorage):
+
+    def hashed_name(self, name, content):
+        directory, filename = posixpath.split(name)
+        digest = content_hash(content)
+        extension = os.path.splitext(filename)[1].lower()
+        return posixpath.join(
+            directory, digest[:2], digest[2:4], digest + extension)
+
+    def _save(self, name, content):
+        name = self.hashed_name(name, content)
+        if self.exists(name):
+            # A fresh mtime keeps the reused file out of the next sweep.
+            os.utime(self.path(name))
+            return name
+        return super(ContentAddressedStorage, self)._save(name, content)
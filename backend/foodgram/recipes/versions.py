@@ -0,0 +1,88 @@
+"""Version stamps of rarely changing reference data.
+
+A stamp is the time of the last committed change of a data set. It is
+kept in the Django cache so that every worker sharing the cache sees the
+same value; per-worker caches compare stamps to know when to rebuild.
+Stamps of the reference data (STORED) are also written to DataVersion
+rows and read from there when the cache is not shared (CACHE_SHARED):
+they are bumped by management commands and other workers.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from recipes import replicas
+from recipes.models import DataVersion
+
+KEY = 'version:{}'
+# Stamp of a single recipe's own data, see recipes.signals.
+RECIPE = 'recipe:{}'
+# Stamp of a user's credentials, see api.authentication.
+AUTH = 'auth:{}'
+STORED = ('tags', 'ingredients')
+
+
+def is_shared_cache():
+    """Whether other processes see the default cache."""
+    return settings.CACHE_SHARED
+
+
+def stored_versions(names):
+    """{name: stamp} of the data sets from their DataVersion rows."""
+    with replicas.primary():
+        found = dict(DataVersion.objects.filter(
+            name__in=names).values_list('name', 'stamp'))
+        for name in names:
+            if name not in found:
+                found[name] = DataVersion.objects.get_or_create(
+                    name=name, defaults={'stamp': time.time()})[0].stamp
+    return found
+
+
+def get_version(name):
+    if name in STORED and not is_shared_cache():
+        return stored_versions([name])[name]
+    version = cache.get(KEY.format(name))
+    if version is None:
+        cache.add(KEY.format(name), time.time(), None)
+        version = cache.get(KEY.format(name))
+    return version
+
+
+def get_versions(names):
+    """{name: stamp} of several data sets with one cache round trip."""
+    stored = {}
+    if not is_shared_cache():
+        stored = stored_versions(
+            [name for name in names if name in STORED])
+        names = [name for name in names if name not in stored]
+    keys = {KEY.format(name): name for name in names}
+    found = cache.get_many(list(keys))
+    missing = [key for key in keys if key not in found]
+    if missing:
+        now = time.time()
+        for key in missing:
+            cache.add(key, now, None)
+        found.update(cache.get_many(missing))
+    stored.update(
+        (keys[key], value) for key, value in found.items())
+    return stored
+
+
+def bump_version(name):
+    """Mark the data set as changed once the current transaction commits.
+    """
+    if name in STORED:
+        DataVersion.objects.update_or_create(
+            name=name, defaults={'stamp': time.time()})
+    transaction.on_commit(
+        lambda: cache.set(KEY.format(name), time.time(), None))
+
+
+def bump_versions(names):
+    names = list(names)
+    if names:
+        transaction.on_commit(lambda: cache.set_many(
+            {KEY.format(name): time.time() for name in names}, None))
@@ -0,0 +1,193 @@
+import base64
+import io
+import json
+import os
+import random
+import time
+
+import pytest
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.serializers import refresh_documents
+from recipes import carts, counters
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            RecipeTag, Shopping, Subscribe, Tag, User)
+
+AUTHORS = 12
+RECIPES_PER_AUTHOR = 8
+INGREDIENTS_PER_RECIPE = (4, 12)
+SEED = 73
+
+MEASUREMENTS = []
+
+
+def seed_dataset():
+    """Fill the test database with a small but realistic data set."""
+    rnd = random.Random(SEED)
+    path = os.path.join(settings.BASE_DIR, 'data', 'ingredients.json')
+    with open(path, encoding='utf-8') as file:
+        Ingredient.objects.bulk_create(
+            Ingredient(**row) for row in json.load(file))
+    ingredients = list(Ingredient.objects.values_list('id', flat=True))
+    Tag.objects.bulk_create(
+        Tag(name=name, slug=slug, color=color)
+        for name, slug, color in (
+            ('Завтрак', 'breakfast', '#E26C2D'),
+            ('Обед', 'lunch', '#49B64E'),
+            ('Ужин', 'dinner', '#8775D2')))
+    tags = list(Tag.objects.all())
+    reader = User.objects.create_user(
+        username='reader', email='reader@foodgram.ru', password='reader')
+    Token.objects.create(user=reader)
+    authors = [
+        User.objects.create_user(
+            username=f'author{idx}',
+            email=f'author{idx}@foodgram.ru',
+            password='author')
+        for idx in range(AUTHORS)]
+    Recipe.objects.bulk_create(
+        Recipe(
+            author=author,
+            name=f'{author.username} рецепт {idx}',
+            text='Описание рецепта',
+            cooking_time=rnd.randint(5, 120),
+            image='recipe/bench.png')
+        for author in authors for idx in range(RECIPES_PER_AUTHOR))
+    recipes = list(Recipe.objects.all())
+    RecipeTag.objects.bulk_create(
+        RecipeTag(recipe=recipe, tag=tag)
+        for recipe in recipes
+        for tag in rnd.sample(tags, rnd.randint(1, len(tags))))
+    RecipeIngredient.objects.bulk_create(
+        RecipeIngredient(
+            recipe=recipe,
+            ingredient_id=ingredient,
+            amount=rnd.randint(1, 500))
+        for recipe in recipes
+        for ingredient in rnd.sample(
+            ingredients, rnd.randint(*INGREDIENTS_PER_RECIPE)))
+    Favorite.objects.bulk_create(
+        Favorite(user=reader, recipe=recipe)
+        for recipe in rnd.sample(recipes, len(recipes) // 3))
+    Shopping.objects.bulk_create(
+        Shopping(user=reader, recipe=recipe)
+        for recipe in rnd.sample(recipes, 10))
+    Subscribe.objects.bulk_create(
+        Subscribe(subscriber=reader, author=author)
+        for author in authors[:AUTHORS - 2])
+    carts.rebuild()
+    counters.reconcile()
+    refresh_documents(list(Recipe.objects.all()))
+
+
+@pytest.fixture(scope='session')
+def django_db_setup(django_db_setup, django_db_blocker):
+    with django_db_blocker.unblock():
+        seed_dataset()
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+
+
+@pytest.fixture
+def reader():
+    return User.objects.get(username='reader')
+
+
+@pytest.fixture
+def user_client(reader):
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Token {reader.auth_token.key}')
+    return client
+
+
+@pytest.fixture
+def guest_client():
+    return APIClient()
+
+
+def image_base64(size, color, file_format):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, file_format)
+    return f'data:image/{file_format.lower()};base64,' + base64.b64encode(
+        buffer.getvalue()).decode()
+
+
+@pytest.fixture
+def jpeg_base64():
+    """Build a base64 data URL of a plain JPEG image."""
+    def build(size=(1200, 900), color='#49B64E'):
+        return image_base64(size, color, 'JPEG')
+    return build
+
+
+@pytest.fixture
+def recipe_payload():
+    """Build the JSON of a new recipe with the first ingredients."""
+    def build(ingredients=3, name='Новый рецепт'):
+        return {
+            'name': name,
+            'text': 'Описание',
+            'cooking_time': 10,
+            'image': image_base64((8, 8), '#E26C2D', 'PNG'),
+            'tags': list(Tag.objects.values_list('id', flat=True)[:2]),
+            'ingredients': [
+                {'id': pk, 'amount': 10}
+                for pk in Ingredient.objects.values_list(
+                    'id', flat=True)[:ingredients]],
+        }
+    return build
+
+
+@pytest.fixture
+def run_on_commit():
+    """Run the on_commit hooks; tests never commit their transaction."""
+    def run():
+        callbacks = [func for _, func in connection.run_on_commit]
+        connection.run_on_commit = []
+        for func in callbacks:
+            func()
+    return run
+
+
+@pytest.fixture
+def measure():
+    """Run one API call, returning the response and its SQL query count.
+
+    GET calls are measured with warm caches: the request is sent once
+    before the measured run unless `warm` is False. Every measurement
+    is kept for the summary table printed at the end of the session.
+    """
+    def run(label, client, method, url, data=None, warm=None,
+            format='json'):
+        if warm is None:
+            warm = method == 'get'
+        if warm:
+            getattr(client, method)(url, data, format=format)
+        with CaptureQueriesContext(connection) as context:
+            started = time.perf_counter()
+            response = getattr(client, method)(url, data, format=format)
+            elapsed = time.perf_counter() - started
+        MEASUREMENTS.append((label, len(context), elapsed * 1000))
+        return response, len(context)
+    return run
+
+
+def pytest_terminal_summary(terminalreporter):
+    if not MEASUREMENTS:
+        return
+    terminalreporter.section('API query budget')
+    width = max(len(label) for label, _, _ in MEASUREMENTS)
+    terminalreporter.write_line(
+        f'{"endpoint":<{width}}  {"queries":>7}  {"time, ms":>9}')
+    for label, queries, elapsed in MEASUREMENTS:
+        terminalreporter.write_line(
+            f'{label:<{width}}  {queries:>7}  {elapsed:>9.1f}')
@@ -0,0 +1,123 @@
+import pytest
+from django.test import override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.authentication import token_cache
+from recipes.models import Recipe, User
+
+pytestmark = pytest.mark.django_db
+
+ME_URL = '/api/users/me/'
+
+
+@pytest.fixture
+def member():
+    user = User.objects.create_user(
+        username='member', email='member@foodgram.ru', password='member')
+    return user, Token.objects.create(user=user)
+
+
+def client_for(token):
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+    return client
+
+
+def warm(client):
+    # The first request creates the user's stamp and is not cached.
+    for _ in range(2):
+        assert client.get(ME_URL).status_code == 200
+
+
+def test_token_lookup_cached(measure, member):
+    _, token = member
+    client = client_for(token)
+    warm(client)
+    response, queries = measure(
+        'GET /users/me/ (cached token)', client, 'get', ME_URL, warm=False)
+    assert response.status_code == 200
+    assert response.json()['username'] == 'member'
+    assert queries == 0
+
+
+@override_settings(AUTH_TOKEN_CACHE_TIMEOUT=0)
+def test_token_cache_disabled(member, django_assert_num_queries):
+    _, token = member
+    client = client_for(token)
+    warm(client)
+    with django_assert_num_queries(1):
+        assert client.get(ME_URL).status_code == 200
+
+
+def test_other_header_types_rejected(member):
+    _, token = member
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {token.key}')
+    recipe = Recipe.objects.first()
+    assert client.post(
+        f'/api/recipes/{recipe.id}/favorite/').status_code == 401
+
+
+def test_logout_invalidates(member, run_on_commit):
+    _, token = member
+    client = client_for(token)
+    warm(client)
+    assert client.post('/api/auth/token/logout/').status_code == 204
+    run_on_commit()
+    assert client.get(ME_URL).status_code == 401
+
+
+def test_token_deletion_invalidates(member, run_on_commit):
+    _, token = member
+    client = client_for(token)
+    warm(client)
+    token.delete()
+    run_on_commit()
+    assert client.get(ME_URL).status_code == 401
+
+
+def test_deactivation_invalidates(member, run_on_commit):
+    user, token = member
+    client = client_for(token)
+    warm(client)
+    user.is_active = False
+    user.save()
+    run_on_commit()
+    assert client.get(ME_URL).status_code == 401
+
+
+def test_password_change_reloads_user(member, run_on_commit):
+    _, token = member
+    client = client_for(token)
+    warm(client)
+    response = client.post(
+        '/api/users/set_password/',
+        {'current_password': 'member', 'new_password': 'N3w-passw0rd'})
+    assert response.status_code == 204, response.data
+    run_on_commit()
+    assert token_cache.get(token.key) is None
+    warm(client)
+    assert token_cache.get(token.key)[0].check_password('N3w-passw0rd')
+
+
+def test_login_keeps_cached_tokens(member, run_on_commit):
+    _, token = member
+    client = client_for(token)
+    warm(client)
+    response = APIClient().post(
+        '/api/auth/token/login/',
+        {'email': 'member@foodgram.ru', 'password': 'member'})
+    assert response.status_code == 200, response.data
+    run_on_commit()
+    assert token_cache.get(token.key) is not None
+
+
+@override_settings(AUTH_TOKEN_CACHE_SIZE=1)
+def test_least_recently_used_evicted(member, reader, user_client):
+    _, token = member
+    warm(client_for(token))
+    warm(user_client)
+    assert token_cache.get(token.key) is None
+    assert token_cache.get(reader.auth_token.key) is not None
+    assert len(token_cache) == 1
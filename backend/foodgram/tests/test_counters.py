@@ -0,0 +1,50 @@
+import pytest
+from django.core.management import call_command
+
+from recipes import counters
+from recipes.models import Favorite, Recipe, UserCounter
+
+pytestmark = pytest.mark.django_db
+
+
+def test_favorite_toggle_keeps_counter(user_client, reader):
+    recipe = Recipe.objects.exclude(favorite_recipe__user=reader).first()
+    before = recipe.favorites_count
+    user_client.post(f'/api/recipes/{recipe.id}/favorite/')
+    response = user_client.get(f'/api/recipes/{recipe.id}/')
+    assert response.data['favorites_count'] == before + 1
+    user_client.delete(f'/api/recipes/{recipe.id}/favorite/')
+    recipe.refresh_from_db()
+    assert recipe.favorites_count == before
+
+
+def test_subscriptions_read_stored_recipes_count(user_client, reader):
+    response = user_client.get('/api/users/subscriptions/')
+    for author in response.data['results']:
+        assert author['recipes_count'] == Recipe.objects.filter(
+            author_id=author['id']).count()
+
+
+def test_reconcile_fixes_drift(reader):
+    assert counters.reconcile(fix=False) == ([], [])
+    Recipe.objects.filter(author=reader).delete()
+    recipe = Recipe.objects.first()
+    Recipe.objects.filter(id=recipe.id).update(favorites_count=1000)
+    UserCounter.objects.filter(user=recipe.author).delete()
+    recipes, users = counters.reconcile(fix=False)
+    assert [item.id for item in recipes] == [recipe.id]
+    assert [item.id for item in users] == [recipe.author_id]
+    call_command('reconcile_counters')
+    assert counters.reconcile(fix=False) == ([], [])
+
+
+def test_recipe_save_keeps_concurrent_counters(reader):
+    recipe = Recipe.objects.exclude(favorite_recipe__user=reader).first()
+    before = recipe.favorites_count
+    # Another request adds a favorite while this copy is being edited.
+    Favorite.objects.create(user=reader, recipe=recipe)
+    recipe.name = 'Отредактированный рецепт'
+    recipe.save()
+    recipe.refresh_from_db()
+    assert recipe.name == 'Отредактированный рецепт'
+    assert recipe.favorites_count == before + 1
@@ -0,0 +1,124 @@
+import json
+
+import pytest
+
+from api.serializers import ensure_documents, refresh_documents
+from recipes.models import Recipe, RecipeIngredient, Tag, User
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def recipe():
+    return Recipe.objects.order_by('id').first()
+
+
+def stored(recipe):
+    return Recipe.objects.get(id=recipe.id).document
+
+
+def test_document_stored_on_write(user_client, recipe_payload):
+    response = user_client.post(
+        '/api/recipes/', recipe_payload(name='С документом'), format='json')
+    assert response.status_code == 201, response.data
+    document = json.loads(stored(Recipe.objects.get(id=response.data['id'])))
+    assert document['name'] == 'С документом'
+    assert len(document['ingredients']) == 3
+    response = user_client.patch(
+        f'/api/recipes/{response.data["id"]}/',
+        recipe_payload(1, name='С документом'), format='json')
+    assert response.status_code == 200, response.data
+    assert len(json.loads(stored(Recipe.objects.get(
+        id=response.data['id'])))['ingredients']) == 1
+    assert len(response.data['ingredients']) == 1
+
+
+def test_flags_spliced_per_user(user_client, guest_client, reader):
+    recipe = Recipe.objects.filter(favorite_recipe__user=reader).exclude(
+        shopping_recipe__user=reader).first()
+    url = f'/api/recipes/{recipe.id}/'
+    own = user_client.get(url).json()
+    guest = guest_client.get(url).json()
+    assert (own['is_favorited'], own['is_in_shopping_cart']) == (True, False)
+    assert (guest['is_favorited'], guest['is_in_shopping_cart']) == (
+        False, False)
+    assert own['author']['is_subscribed'] is (
+        reader.subscribe_subscriber.filter(
+            author_id=recipe.author_id).exists())
+    assert guest['author']['is_subscribed'] is False
+    assert list(own) == [
+        'id', 'tags', 'author', 'ingredients', 'is_favorited',
+        'is_in_shopping_cart', 'favorites_count', 'name', 'image',
+        'image_variants', 'text', 'cooking_time']
+
+
+def test_document_rebuilt_after_tag_rename(guest_client, recipe):
+    tag = recipe.tags.first()
+    tag.name = 'Переименован'
+    tag.save()
+    assert stored(recipe) == ''
+    tags = guest_client.get(f'/api/recipes/{recipe.id}/').json()['tags']
+    assert 'Переименован' in [item['name'] for item in tags]
+    assert stored(recipe) != ''
+
+
+def test_document_rebuilt_after_ingredient_rename(guest_client, recipe):
+    ingredient = RecipeIngredient.objects.filter(
+        recipe=recipe).first().ingredient
+    ingredient.name = 'переименованный продукт'
+    ingredient.save()
+    assert stored(recipe) == ''
+    ingredients = guest_client.get(
+        f'/api/recipes/{recipe.id}/').json()['ingredients']
+    assert 'переименованный продукт' in [
+        item['name'] for item in ingredients]
+
+
+def test_document_rebuilt_after_author_change(guest_client, recipe):
+    author = User.objects.get(id=recipe.author_id)
+    author.first_name = 'Новое имя'
+    author.save()
+    assert not Recipe.objects.filter(author=author).exclude(document='')
+    assert guest_client.get(
+        f'/api/recipes/{recipe.id}/').json()['author']['first_name'] == (
+            'Новое имя')
+
+
+def test_unrelated_change_keeps_documents(recipe):
+    Tag.objects.create(name='Перекус', slug='snack', color='#000000')
+    refresh_documents([recipe])
+    User.objects.filter(id=recipe.author_id).get().save(
+        update_fields=['last_login'])
+    assert stored(recipe) != ''
+
+
+def test_stale_page_rebuilt_in_bulk(measure, guest_client):
+    Recipe.objects.update(document='')
+    response, queries = measure(
+        'GET /recipes/ (stale documents)', guest_client, 'get',
+        '/api/recipes/?limit=6', warm=False)
+    assert response.status_code == 200
+    assert len(response.json()['results']) == 6
+    # Page count, page ids, recipes, 3 prefetches of the documents and
+    # their UPDATE.
+    assert queries <= 7
+
+
+def test_read_keeps_concurrent_document(recipe):
+    Recipe.objects.filter(id=recipe.id).update(document='')
+    loaded = Recipe.objects.get(id=recipe.id)
+    recipe.name = 'Новое название'
+    recipe.save()
+    refresh_documents([recipe])
+    ensure_documents([loaded])
+    assert json.loads(stored(recipe))['name'] == 'Новое название'
+
+
+def test_read_does_not_store_outdated_document(recipe):
+    Recipe.objects.filter(id=recipe.id).update(document='')
+    loaded = Recipe.objects.get(id=recipe.id)
+    Recipe.objects.filter(id=recipe.id).update(name='Новое название')
+    ensure_documents([loaded])
+    assert stored(recipe) == ''
+    ensure_documents([Recipe.objects.get(id=recipe.id)])
+    assert json.loads(stored(recipe))['name'] == 'Новое название'
@@ -0,0 +1,53 @@
+import pytest
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+
+from recipes.models import Favorite, Recipe, RecipeTag
+
+pytestmark = pytest.mark.django_db
+
+
+def expected_counts(recipes):
+    counts = {}
+    for slug in RecipeTag.objects.filter(recipe__in=recipes).values_list(
+            'tag__slug', flat=True):
+        counts[slug] = counts.get(slug, 0) + 1
+    return counts
+
+
+def test_tag_facets_ignore_the_tag_filter(guest_client, measure):
+    author = Recipe.objects.first().author
+    response, queries = measure(
+        'GET /recipes/?facets=tags', guest_client, 'get',
+        f'/api/recipes/?author={author.id}&tags=breakfast&facets=tags',
+        warm=False)
+    assert response.status_code == 200
+    assert response.json()['facets']['tags'] == expected_counts(
+        Recipe.objects.filter(author=author))
+    # The page itself stays filtered by the tag.
+    assert response.json()['count'] == Recipe.objects.filter(
+        author=author, tags__slug='breakfast').count()
+    # Page count, page, prefetches and one grouped facet query.
+    assert queries <= 6
+
+
+@override_settings(RECIPE_FACETS_CACHE_TIMEOUT=0)
+def test_tag_facets_of_personal_filters(user_client, reader):
+    response = user_client.get('/api/recipes/?is_favorited=1&facets=tags')
+    assert response.json()['facets']['tags'] == expected_counts(
+        Favorite.objects.filter(user=reader).values('recipe'))
+
+
+def test_tag_facets_are_cached(guest_client):
+    url = '/api/recipes/?facets=tags&limit=1'
+    first = guest_client.get(url).json()['facets']
+    with CaptureQueriesContext(connection) as context:
+        response = guest_client.get(url + '&page=2')
+    assert response.json()['facets'] == first
+    assert not any('GROUP BY' in query['sql'] for query in context)
+
+
+def test_facets_are_opt_in(guest_client):
+    assert 'facets' not in guest_client.get('/api/recipes/').json()
+    assert guest_client.get('/api/recipes/?facets=author').status_code == 400
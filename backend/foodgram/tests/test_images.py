@@ -0,0 +1,76 @@
+import pytest
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import override_settings
+from PIL import Image
+
+from recipes import images
+from recipes.models import Recipe
+
+pytestmark = pytest.mark.django_db
+
+
+def variant_size(url):
+    name = url.split('/media/', 1)[1]
+    with default_storage.open(name) as file:
+        return Image.open(file).size
+
+
+@override_settings(IMAGE_VARIANTS_SYNC=True)
+def test_variants_built_on_upload(user_client, recipe_payload, jpeg_base64):
+    payload = dict(recipe_payload(name='Рецепт с фото'), image=jpeg_base64())
+    response = user_client.post('/api/recipes/', payload, format='json')
+    assert response.status_code == 201, response.data
+    variants = response.json()['image_variants']
+    assert set(variants) == {'card', 'detail', 'retina'}
+    assert set(variants['card']) == set(images.available_formats())
+    assert {'jpeg', 'webp'} <= set(variants['card'])
+    assert variant_size(variants['card']['webp']) == (400, 300)
+    assert variant_size(variants['detail']['jpeg']) == (800, 600)
+    # Images are never upscaled.
+    assert variant_size(variants['retina']['jpeg']) == (1200, 900)
+
+
+@override_settings(IMAGE_VARIANTS_SYNC=True)
+def test_replaced_image_replaces_variants(
+        user_client, recipe_payload, jpeg_base64):
+    payload = dict(recipe_payload(name='Рецепт с фото'), image=jpeg_base64())
+    recipe_id = user_client.post(
+        '/api/recipes/', payload, format='json').json()['id']
+    response = user_client.patch(
+        f'/api/recipes/{recipe_id}/',
+        dict(payload, image=jpeg_base64((300, 300), '#8775D2')),
+        format='json')
+    assert response.status_code == 200, response.data
+    assert variant_size(response.json()['image_variants']['card']['jpeg']) == (
+        300, 300)
+
+
+def test_variants_built_off_request(
+        user_client, capsys, recipe_payload, jpeg_base64):
+    payload = dict(recipe_payload(name='Рецепт с фото'), image=jpeg_base64())
+    response = user_client.post('/api/recipes/', payload, format='json')
+    assert response.json()['image_variants'] == {}
+    recipe = Recipe.objects.get(id=response.json()['id'])
+    call_command('process_images', recipes=[recipe.id])
+    assert '1 recipes processed, 0 failed' in capsys.readouterr().out
+    recipe.refresh_from_db()
+    assert set(images.variants_of(recipe)) == {'card', 'detail', 'retina'}
+
+
+def test_variants_refresh_cached_responses(
+        user_client, guest_client, monkeypatch,
+        run_on_commit, recipe_payload, jpeg_base64):
+    monkeypatch.setattr(images, 'schedule', lambda recipe: None)
+    payload = dict(recipe_payload(name='Рецепт с фото'), image=jpeg_base64())
+    recipe_id = user_client.post(
+        '/api/recipes/', payload, format='json').json()['id']
+    run_on_commit()
+    url = f'/api/recipes/{recipe_id}/'
+    assert guest_client.get(url).json()['image_variants'] == {}
+    images.process(Recipe.objects.get(id=recipe_id))
+    run_on_commit()
+    response = guest_client.get(url)
+    assert response['X-Cache'] == 'MISS'
+    assert set(response.json()['image_variants']) == {
+        'card', 'detail', 'retina'}
@@ -0,0 +1,47 @@
+import pytest
+from django.test import override_settings
+
+from recipes.models import Ingredient
+from recipes.versions import bump_version
+
+pytestmark = pytest.mark.django_db
+
+
+def test_autocomplete_keeps_prefix_matches_first(guest_client):
+    response = guest_client.get('/api/ingredients/?name=СОЛ')
+    assert response.status_code == 200
+    names = [item['name'] for item in response.json()]
+    expected = set(Ingredient.objects.filter(
+        name__icontains='сол').values_list('name', flat=True))
+    assert set(names) == expected
+    prefix = [name.startswith('сол') for name in names]
+    assert prefix == sorted(prefix, reverse=True)
+    assert any(prefix) and not all(prefix)
+
+
+def test_autocomplete_limit(guest_client):
+    response = guest_client.get('/api/ingredients/?name=сол&limit=3')
+    assert len(response.json()) == 3
+    response = guest_client.get('/api/ingredients/?name=сол&limit=x')
+    assert response.status_code == 400
+
+
+def test_autocomplete_without_database(
+        guest_client, django_assert_num_queries):
+    guest_client.get('/api/ingredients/?name=мука')
+    with django_assert_num_queries(0):
+        response = guest_client.get('/api/ingredients/?name=мука')
+    assert response.status_code == 200
+
+
+@override_settings(CACHE_SHARED=False)
+def test_autocomplete_sees_other_processes(guest_client):
+    url = '/api/ingredients/?name=мука'
+    names = [item['name'] for item in guest_client.get(url).json()]
+    assert 'мука овсяная' not in names
+    # Another process loads an ingredient: its cache is not this one.
+    Ingredient.objects.bulk_create(
+        [Ingredient(name='мука овсяная', measurement_unit='г')])
+    bump_version('ingredients')
+    names = [item['name'] for item in guest_client.get(url).json()]
+    assert 'мука овсяная' in names
@@ -0,0 +1,118 @@
+import json
+import logging
+import re
+
+import pytest
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from recipes.models import User
+
+pytestmark = pytest.mark.django_db
+
+URL = '/api/recipes/?limit=6'
+
+
+@pytest.fixture
+def log_lines():
+    lines = []
+
+    class Handler(logging.Handler):
+        def emit(self, record):
+            lines.append((record.levelno, json.loads(record.getMessage())))
+
+    handler = Handler()
+    logger = logging.getLogger('api.requests')
+    logger.addHandler(handler)
+    yield lines
+    logger.removeHandler(handler)
+
+
+def timing(response):
+    return {
+        name: float(duration) for name, duration in re.findall(
+            r'(\w+);dur=([\d.]+)', response['Server-Timing'])}
+
+
+def test_server_timing_header(user_client):
+    user_client.get(URL)
+    with CaptureQueriesContext(connection) as context:
+        response = user_client.get(URL)
+    assert response.status_code == 200
+    assert f'desc="{len(context)} queries"' in response['Server-Timing']
+    durations = timing(response)
+    assert set(durations) == {'db', 'serializer', 'view'}
+    assert 0 < durations['serializer'] <= durations['view']
+
+
+def test_structured_log_line(user_client, log_lines):
+    user_client.get(URL)
+    [(level, line)] = log_lines
+    assert level == logging.INFO
+    assert line['method'] == 'GET'
+    assert line['route'] == 'api/recipes/'
+    assert line['path'] == '/api/recipes/'
+    assert line['status'] == 200
+    assert line['queries'] > 0
+    assert 'sql' not in line
+
+
+@override_settings(REQUEST_METRICS_SLOW_MS=0)
+def test_slow_request_logged_with_sql(user_client, log_lines):
+    user_client.get(URL)
+    [(level, line)] = log_lines
+    assert level == logging.WARNING
+    assert len(line['sql']) == line['queries']
+    assert any('recipes_recipe' in query['sql'] for query in line['sql'])
+
+
+@override_settings(REQUEST_METRICS_SAMPLE_RATE=0)
+def test_unsampled_request_not_measured(user_client, log_lines):
+    response = user_client.get(URL)
+    assert response.status_code == 200
+    assert 'Server-Timing' not in response
+    assert log_lines == []
+
+
+def test_metrics_protected(user_client, guest_client):
+    assert guest_client.get('/metrics').status_code == 403
+    assert user_client.get('/metrics').status_code == 403
+    with override_settings(METRICS_TOKEN='secret'):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Bearer wrong')
+        assert client.get('/metrics').status_code == 403
+        client.credentials(HTTP_AUTHORIZATION='Bearer secret')
+        assert client.get('/metrics').status_code == 200
+
+
+def test_metrics_for_staff():
+    staff = User.objects.create_user(
+        username='staff', email='staff@foodgram.ru', password='staff',
+        is_staff=True)
+    client = APIClient()
+    client.force_login(staff)
+    assert client.get('/metrics').status_code == 200
+
+
+@override_settings(METRICS_TOKEN='secret')
+def test_metrics_histograms(user_client, guest_client):
+    for _ in range(3):
+        user_client.get(URL)
+    guest_client.get('/api/recipes/')
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION='Bearer secret')
+    response = client.get('/metrics')
+    assert response['Content-Type'].startswith('text/plain; version=0.0.4')
+    text = response.content.decode()
+    labels = 'method="GET",route="api/recipes/"'
+    assert '# TYPE foodgram_request_duration_seconds histogram' in text
+    count = int(re.search(
+        rf'foodgram_request_queries_count{{{re.escape(labels)}}} (\d+)',
+        text).group(1))
+    assert count >= 4
+    assert (
+        f'foodgram_request_duration_seconds_bucket{{{labels},le="+Inf"}} '
+        f'{count}') in text
+    assert 'foodgram_anonymous_cache_requests_total{result="miss"}' in text
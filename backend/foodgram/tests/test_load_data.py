@@ -0,0 +1,52 @@
+import os
+
+import pytest
+from django.conf import settings
+from django.core.management import CommandError, call_command
+
+from recipes.management.commands import load_all_data
+from recipes.models import Ingredient
+
+pytestmark = pytest.mark.django_db
+
+CATALOGUE = os.path.join(settings.BASE_DIR, 'data', 'ingredients.json')
+
+
+def test_reload_is_unchanged(capsys, monkeypatch):
+    monkeypatch.setattr(load_all_data, 'READ_SIZE', 7)
+    total = Ingredient.objects.count()
+    call_command('load_all_data', file=CATALOGUE, batch_size=100)
+    assert Ingredient.objects.count() == total
+    assert f'0 inserted, 0 updated, {total} unchanged' in (
+        capsys.readouterr().out)
+
+
+def test_csv_upsert(tmp_path, capsys):
+    ingredient = Ingredient.objects.order_by('id').first()
+    path = tmp_path / 'ingredients.csv'
+    path.write_text(
+        f'{ingredient.name.upper()},{ingredient.measurement_unit}\n'
+        f'{ingredient.name},{ingredient.measurement_unit}\n'
+        'новый ингредиент,г\n'
+        ' Новый  ингредиент,г\n',
+        encoding='utf-8')
+    call_command('load_all_data', file=str(path), batch_size=2)
+    assert '1 inserted, 1 updated, 0 unchanged, 2 duplicates skipped' in (
+        capsys.readouterr().out)
+    ingredient.refresh_from_db()
+    assert ingredient.name == ingredient.name.upper()
+    assert Ingredient.objects.filter(
+        name__icontains='ингредиент').count() == 1
+    # A second run of the same file changes nothing.
+    call_command('load_all_data', file=str(path), batch_size=2)
+    assert '0 inserted, 0 updated, 2 unchanged, 2 duplicates skipped' in (
+        capsys.readouterr().out)
+    ingredient.refresh_from_db()
+    assert ingredient.name == ingredient.name.upper()
+
+
+def test_malformed_json(tmp_path):
+    path = tmp_path / 'ingredients.json'
+    path.write_text('[{"name": "соль", "measurement_unit": "г"}', 'utf-8')
+    with pytest.raises(CommandError):
+        call_command('load_all_data', file=str(path))
@@ -0,0 +1,72 @@
+import io
+import os
+import re
+
+import pytest
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import override_settings
+from PIL import Image
+
+from recipes import images
+from recipes.models import Recipe
+
+pytestmark = pytest.mark.django_db
+
+HASHED = re.compile(r'^recipe/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.png$')
+
+
+def png_bytes(color):
+    buffer = io.BytesIO()
+    Image.new('RGB', (4, 4), color).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def test_identical_files_are_stored_once():
+    first = default_storage.save('recipe/a.png', ContentFile(png_bytes('red')))
+    second = default_storage.save(
+        'recipe/b.PNG', ContentFile(png_bytes('red')))
+    third = default_storage.save(
+        'recipe/c.png', ContentFile(png_bytes('blue')))
+    assert HASHED.match(first)
+    assert first == second != third
+
+
+@override_settings(IMAGE_VARIANTS_SYNC=True)
+def test_sweep_deletes_only_orphans(
+        user_client, capsys, recipe_payload, jpeg_base64):
+    payload = dict(recipe_payload(name='Рецепт с фото'), image=jpeg_base64())
+    recipe_id = user_client.post(
+        '/api/recipes/', payload, format='json').json()['id']
+    old = Recipe.objects.get(id=recipe_id)
+    user_client.patch(
+        f'/api/recipes/{recipe_id}/',
+        dict(payload, image=jpeg_base64((300, 300), '#8775D2')),
+        format='json')
+    recipe = Recipe.objects.get(id=recipe_id)
+    old_names = [old.image.name] + [
+        name for formats in images.variants_of(old).values()
+        for name in formats.values()]
+    new_names = [recipe.image.name] + [
+        name for formats in images.variants_of(recipe).values()
+        for name in formats.values()]
+
+    call_command('sweep_media', dry_run=True)
+    assert all(default_storage.exists(name) for name in old_names)
+    call_command('sweep_media')
+    assert all(default_storage.exists(name) for name in old_names)
+    assert 'orphaned files' in capsys.readouterr().out
+
+    call_command('sweep_media', grace=0)
+    assert not any(default_storage.exists(name) for name in old_names)
+    assert all(default_storage.exists(name) for name in new_names)
+
+
+def test_reused_file_survives_sweep():
+    name = default_storage.save(
+        'recipe/a.png', ContentFile(png_bytes('green')))
+    os.utime(default_storage.path(name), (0, 0))
+    default_storage.save('recipe/b.png', ContentFile(png_bytes('green')))
+    call_command('sweep_media')
+    assert default_storage.exists(name)
@@ -0,0 +1,63 @@
+import pytest
+from django.test import override_settings
+
+from api import filters
+from recipes import membership
+from recipes.models import Favorite, Recipe
+
+pytestmark = pytest.mark.django_db
+
+
+def test_flags_match_tables(user_client, reader):
+    response = user_client.get('/api/recipes/?limit=100')
+    favorites = set(Favorite.objects.filter(
+        user=reader).values_list('recipe_id', flat=True))
+    for recipe in response.data['results']:
+        assert recipe['is_favorited'] == (recipe['id'] in favorites)
+        assert recipe['author']['is_subscribed'] == (
+            reader.subscribe_subscriber.filter(
+                author_id=recipe['author']['id']).exists())
+
+
+def test_sets_follow_changes_and_eviction(
+        reader, django_assert_num_queries, run_on_commit):
+    favorites = membership.get_ids(reader.id, 'favorites')
+    recipe = Recipe.objects.exclude(id__in=favorites).first()
+    favorite = Favorite.objects.create(user=reader, recipe=recipe)
+    # Not visible before the commit, reloaded once after it.
+    assert recipe.id not in membership.get_ids(reader.id, 'favorites')
+    run_on_commit()
+    with django_assert_num_queries(1):
+        assert recipe.id in membership.get_ids(reader.id, 'favorites')
+    with django_assert_num_queries(0):
+        assert recipe.id in membership.get_ids(reader.id, 'favorites')
+    favorite.delete()
+    run_on_commit()
+    assert membership.get_ids(reader.id, 'favorites') == favorites
+    membership.evict(reader.id)
+    with django_assert_num_queries(1):
+        assert membership.get_ids(reader.id, 'favorites') == favorites
+
+
+@pytest.mark.parametrize('limit', (0, 500))
+def test_filter_by_large_set(user_client, reader, monkeypatch, limit):
+    monkeypatch.setattr(filters, 'MEMBERSHIP_IN_LIMIT', limit)
+    favorites = set(Favorite.objects.filter(
+        user=reader).values_list('recipe_id', flat=True))
+    assert favorites
+    response = user_client.get('/api/recipes/?is_favorited=1&limit=100')
+    assert {recipe['id'] for recipe in response.data['results']} == (
+        favorites)
+    response = user_client.get('/api/recipes/?is_favorited=0&limit=100')
+    assert not {recipe['id'] for recipe in response.data['results']} & (
+        favorites)
+
+
+@override_settings(MEMBERSHIP_CACHE_TIMEOUT=0)
+def test_sets_without_cache(reader, django_assert_num_queries):
+    favorites = membership.get_ids(reader.id, 'favorites')
+    recipe = Recipe.objects.exclude(id__in=favorites).first()
+    # No commit hook runs: other workers never see the stamp bumps.
+    Favorite.objects.create(user=reader, recipe=recipe)
+    with django_assert_num_queries(1):
+        assert recipe.id in membership.get_ids(reader.id, 'favorites')
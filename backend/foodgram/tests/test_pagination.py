@@ -0,0 +1,52 @@
+import pytest
+
+from recipes.models import Recipe
+
+pytestmark = pytest.mark.django_db
+
+
+def walk(client, url):
+    pages = []
+    while url:
+        response = client.get(url)
+        assert response.status_code == 200
+        assert list(response.data) == ['count', 'next', 'previous', 'results']
+        pages.append(response.data)
+        url = response.data['next']
+    return pages
+
+
+def test_cursor_mode_walks_all_recipes(guest_client):
+    pages = walk(guest_client, '/api/recipes/?pagination=cursor&limit=10')
+    ids = [recipe['id'] for page in pages for recipe in page['results']]
+    assert ids == list(
+        Recipe.objects.order_by('-id').values_list('id', flat=True))
+    assert pages[0]['count'] is None
+
+
+def test_cursor_mode_approximate_count(guest_client):
+    response = guest_client.get(
+        '/api/recipes/?pagination=cursor&count=approximate')
+    assert response.data['count'] == Recipe.objects.count()
+
+
+def test_cursor_mode_deep_page_costs_the_same(guest_client, measure):
+    first = guest_client.get('/api/recipes/?pagination=cursor&limit=5')
+    _, first_queries = measure(
+        'GET /recipes/?pagination=cursor', guest_client, 'get',
+        '/api/recipes/?pagination=cursor&limit=5')
+    url = first.data['next']
+    for _ in range(5):
+        url = guest_client.get(url).data['next']
+    _, deep_queries = measure(
+        'GET /recipes/?cursor= (deep)', guest_client, 'get', url)
+    assert deep_queries == first_queries
+
+
+def test_subscriptions_cursor_mode(user_client):
+    pages = walk(
+        user_client, '/api/users/subscriptions/?pagination=cursor&limit=3')
+    usernames = [
+        author['username'] for page in pages for author in page['results']]
+    assert usernames == sorted(usernames)
+    assert len(pages) > 1
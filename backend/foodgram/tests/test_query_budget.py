@@ -0,0 +1,206 @@
+"""Maximum SQL query counts for every route in api/urls.py.
+
+Budgets are absolute upper bounds for the seeded data set, measured
+with warm per-worker caches for GET requests. List endpoints are
+additionally requested at two page sizes: their query count must not
+depend on the number of objects on the page.
+"""
+import io
+
+import pytest
+from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image
+
+from recipes.models import Recipe, User
+
+pytestmark = pytest.mark.django_db
+
+
+def foreign_recipe(reader):
+    return Recipe.objects.exclude(author=reader).exclude(
+        favorite_recipe__user=reader).exclude(
+            shopping_recipe__user=reader).first()
+
+
+def test_recipe_list(measure, user_client, guest_client):
+    response, queries = measure(
+        'GET /recipes/', user_client, 'get', '/api/recipes/?limit=6')
+    assert response.status_code == 200
+    assert queries <= 5
+    response, queries = measure(
+        'GET /recipes/ (guest)', guest_client, 'get',
+        '/api/recipes/?limit=6')
+    assert response.status_code == 200
+    assert queries <= 4
+
+
+def test_recipe_list_filtered(measure, user_client):
+    response, queries = measure(
+        'GET /recipes/?is_favorited=1&tags=...', user_client, 'get',
+        '/api/recipes/?is_favorited=1&tags=breakfast&tags=lunch')
+    assert response.status_code == 200
+    assert queries <= 6
+
+
+def test_recipe_detail(measure, user_client):
+    recipe = Recipe.objects.first()
+    response, queries = measure(
+        'GET /recipes/{id}/', user_client, 'get',
+        f'/api/recipes/{recipe.id}/')
+    assert response.status_code == 200
+    assert queries <= 4
+
+
+def test_recipe_create(measure, user_client, recipe_payload):
+    response, queries = measure(
+        'POST /recipes/', user_client, 'post', '/api/recipes/',
+        recipe_payload())
+    assert response.status_code == 201, response.data
+    # The recipe's document is built while writing it.
+    assert queries <= 19
+
+
+def test_recipe_update(measure, user_client, reader, recipe_payload):
+    recipe = Recipe.objects.create(
+        author=reader, name='Мой рецепт', text='x', cooking_time=5)
+    response, queries = measure(
+        'PATCH /recipes/{id}/', user_client, 'patch',
+        f'/api/recipes/{recipe.id}/', recipe_payload(name='Мой рецепт'))
+    assert response.status_code == 200, response.data
+    # Includes the recipe's row lock taken for the carts holding it.
+    assert queries <= 20
+
+
+def test_ingredient_search(measure, user_client):
+    response, queries = measure(
+        'GET /ingredients/?name=', user_client, 'get',
+        '/api/ingredients/?name=мол')
+    assert response.status_code == 200
+    assert response.json()
+    assert queries <= 1
+
+
+def test_tags(measure, user_client):
+    response, queries = measure(
+        'GET /tags/', user_client, 'get', '/api/tags/')
+    assert response.status_code == 200
+    assert queries <= 1
+
+
+@pytest.mark.parametrize('url', (
+    '/api/users/subscriptions/?limit=6&recipes_limit=3',
+    '/api/subscriptions/?limit=6&recipes_limit=3'))
+def test_subscriptions(measure, user_client, url):
+    response, queries = measure(
+        f'GET {url.split("?")[0][4:]}', user_client, 'get', url)
+    assert response.status_code == 200
+    assert queries <= 4
+
+
+def test_favorite_toggle(measure, user_client, reader):
+    recipe = foreign_recipe(reader)
+    url = f'/api/recipes/{recipe.id}/favorite/'
+    response, queries = measure(
+        'POST /recipes/{id}/favorite/', user_client, 'post', url)
+    assert response.status_code == 200
+    assert queries <= 4
+    response, queries = measure(
+        'DELETE /recipes/{id}/favorite/', user_client, 'delete', url)
+    assert response.status_code == 204
+    assert queries <= 6
+
+
+def test_shopping_cart_summary(measure, user_client):
+    response, queries = measure(
+        'GET /recipes/shopping_cart_summary/', user_client, 'get',
+        '/api/recipes/shopping_cart_summary/')
+    assert response.status_code == 200
+    assert response.json()
+    assert queries <= 1
+
+
+def test_image_upload(measure, user_client):
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 48), '#E26C2D').save(buffer, 'JPEG')
+    response, queries = measure(
+        'POST /recipes/images/', user_client, 'post', '/api/recipes/images/',
+        {'image': SimpleUploadedFile(
+            'photo.jpeg', buffer.getvalue(), content_type='image/jpeg')},
+        format='multipart')
+    assert response.status_code == 201, response.data
+    # The token lookup and the upload row; the file never touches SQL.
+    assert queries <= 2
+
+
+def test_shopping_cart_toggle(measure, user_client, reader):
+    recipe = foreign_recipe(reader)
+    url = f'/api/recipes/{recipe.id}/shopping_cart/'
+    response, queries = measure(
+        'POST /recipes/{id}/shopping_cart/', user_client, 'post', url)
+    assert response.status_code == 200
+    # The recipe's row lock, and new cart rows are inserted inside a
+    # savepoint to retry lost races.
+    assert queries <= 11
+    response, queries = measure(
+        'DELETE /recipes/{id}/shopping_cart/', user_client, 'delete', url)
+    assert response.status_code == 204
+    assert queries <= 9
+
+
+def test_subscribe_toggle(measure, user_client, reader):
+    author = User.objects.exclude(id=reader.id).exclude(
+        subscribe_author__subscriber=reader).first()
+    url = f'/api/users/{author.id}/subscribe/'
+    response, queries = measure(
+        'POST /users/{id}/subscribe/', user_client, 'post', url)
+    assert response.status_code == 200
+    assert queries <= 7
+    response, queries = measure(
+        'DELETE /users/{id}/subscribe/', user_client, 'delete', url)
+    assert response.status_code == 204
+    assert queries <= 6
+
+
+def test_download_shopping_cart(measure, user_client):
+    for label, budget in (('', 2), (' (cached)', 2)):
+        response, queries = measure(
+            f'GET /recipes/download_shopping_cart/{label}', user_client,
+            'get', '/api/recipes/download_shopping_cart/', warm=False)
+        assert response.status_code == 200
+        assert queries <= budget
+
+
+def test_user_list(measure, user_client):
+    response, queries = measure(
+        'GET /users/', user_client, 'get', '/api/users/?limit=6')
+    assert response.status_code == 200
+    assert queries <= 3
+
+
+@pytest.mark.parametrize('url', (
+    '/api/recipes/?limit={}',
+    '/api/recipes/?is_in_shopping_cart=1&limit={}',
+    '/api/users/subscriptions/?limit={}&recipes_limit=3',
+    '/api/users/subscriptions/?limit={}',
+    '/api/users/?limit={}',
+))
+def test_list_queries_do_not_grow_with_page_size(
+        measure, user_client, url):
+    _, small = measure(
+        f'GET {url.format(1)}', user_client, 'get', url.format(1))
+    _, large = measure(
+        f'GET {url.format(8)}', user_client, 'get', url.format(8))
+    assert small == large
+
+
+def test_recipe_write_queries_do_not_grow_with_ingredients(
+        measure, user_client, recipe_payload):
+    user_client.post(
+        '/api/recipes/', recipe_payload(1, name='Один'), format='json')
+    _, small = measure(
+        'POST /recipes/ (2 ingredients)', user_client, 'post',
+        '/api/recipes/', recipe_payload(2, name='Два'))
+    _, large = measure(
+        'POST /recipes/ (20 ingredients)', user_client, 'post',
+        '/api/recipes/', recipe_payload(20, name='Двадцать'))
+    assert small == large
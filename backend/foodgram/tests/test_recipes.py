@@ -0,0 +1,52 @@
+import pytest
+
+from recipes import carts
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Shopping, Tag
+
+pytestmark = pytest.mark.django_db
+
+
+def test_update_applies_ingredient_and_tag_diff(
+        user_client, reader, recipe_payload):
+    response = user_client.post(
+        '/api/recipes/', recipe_payload(4, name='Диф'), format='json')
+    assert response.status_code == 201, response.data
+    recipe = Recipe.objects.get(id=response.data['id'])
+    Shopping.objects.create(user=reader, recipe=recipe)
+    carts.add_recipe(reader, recipe)
+    kept, changed, _, _ = response.data['ingredients']
+    added = Ingredient.objects.exclude(
+        id__in=[item['id'] for item in response.data['ingredients']]).first()
+    kept_row = RecipeIngredient.objects.get(
+        recipe=recipe, ingredient_id=kept['id'])
+    tag = Tag.objects.last()
+    payload = recipe_payload(0, name='Диф')
+    payload['tags'] = [tag.id]
+    payload['ingredients'] = [
+        {'id': kept['id'], 'amount': kept['amount']},
+        {'id': changed['id'], 'amount': 99},
+        {'id': added.id, 'amount': 5},
+    ]
+    response = user_client.patch(
+        f'/api/recipes/{recipe.id}/', payload, format='json')
+    assert response.status_code == 200, response.data
+    assert [item['id'] for item in response.data['tags']] == [tag.id]
+    assert {
+        item['id']: item['amount'] for item in response.data['ingredients']
+    } == {kept['id']: kept['amount'], changed['id']: 99, added.id: 5}
+    assert RecipeIngredient.objects.filter(id=kept_row.id).exists()
+    assert not carts.verify()
+
+
+def test_missing_and_duplicate_ids_reported_at_once(
+        user_client, recipe_payload):
+    payload = recipe_payload(2, name='Ошибки')
+    first = payload['ingredients'][0]['id']
+    payload['ingredients'] += [
+        {'id': first, 'amount': 1}, {'id': 999999, 'amount': 1}]
+    payload['tags'] += [888888, 777777]
+    response = user_client.post('/api/recipes/', payload, format='json')
+    assert response.status_code == 400
+    assert response.json()['ingredients'] == {
+        'duplicates': [str(first)], 'missing': ['999999']}
+    assert response.json()['tags'] == {'missing': ['777777', '888888']}
@@ -0,0 +1,52 @@
+import pytest
+from django.core.cache import cache
+from django.test import override_settings
+
+from recipes.models import Tag
+from recipes.versions import KEY
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.mark.parametrize('url', ('/api/tags/', '/api/ingredients/?name=со'))
+def test_not_modified(guest_client, url, django_assert_num_queries):
+    response = guest_client.get(url)
+    assert response.status_code == 200
+    etag = response['ETag']
+    with django_assert_num_queries(0):
+        response = guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 304
+    assert response['ETag'] == etag
+    response = guest_client.get(
+        url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+    assert response.status_code == 304
+
+
+def test_cached_bytes_until_version_changes(
+        guest_client, django_assert_num_queries):
+    first = guest_client.get('/api/tags/')
+    with django_assert_num_queries(0):
+        assert guest_client.get('/api/tags/').content == first.content
+    Tag.objects.create(name='Десерт', slug='dessert', color='#ffffff')
+    # Tests never commit, so bump the stamp as the commit hook would.
+    cache.set(KEY.format('tags'), cache.get(KEY.format('tags')) + 1, None)
+    response = guest_client.get('/api/tags/')
+    assert response['ETag'] != first['ETag']
+    assert 'dessert' in [tag['slug'] for tag in response.json()]
+
+
+@override_settings(CACHE_SHARED=False)
+def test_changes_of_other_processes(guest_client, django_assert_num_queries):
+    first = guest_client.get('/api/tags/')
+    with django_assert_num_queries(1):
+        response = guest_client.get(
+            '/api/tags/', HTTP_IF_NONE_MATCH=first['ETag'])
+    assert response.status_code == 304
+    # As in another worker: tests never commit, so only the database
+    # sees the bump.
+    Tag.objects.create(name='Десерт', slug='dessert', color='#ffffff')
+    response = guest_client.get(
+        '/api/tags/', HTTP_IF_NONE_MATCH=first['ETag'])
+    assert response.status_code == 200
+    assert response['ETag'] != first['ETag']
+    assert 'dessert' in [tag['slug'] for tag in response.json()]
@@ -0,0 +1,125 @@
+import pytest
+from django.test import override_settings
+
+from recipes import replicas
+from recipes.models import Favorite, Recipe
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def reads(monkeypatch):
+    """Aliases that requests started reading from."""
+    aliases = []
+    start_reading = replicas.start_reading
+
+    def spy(alias):
+        # Reads from the primary are not counted.
+        if alias is not None:
+            aliases.append(alias)
+        return start_reading(alias)
+
+    monkeypatch.setattr(replicas, 'start_reading', spy)
+    # The test database plays the replica.
+    with override_settings(REPLICA_DATABASES=['default']):
+        yield aliases
+
+
+def test_router():
+    router = replicas.ReplicaRouter()
+    assert router.db_for_read(Recipe) is None
+    with replicas.reading('replica0'):
+        assert router.db_for_read(Recipe) == 'replica0'
+        assert router.db_for_write(Recipe) == 'default'
+    assert router.db_for_read(Recipe) is None
+    assert router.allow_migrate('default', 'recipes')
+    assert not router.allow_migrate('replica0', 'recipes')
+
+
+@pytest.mark.parametrize('url', (
+    '/api/recipes/?limit=6',
+    '/api/tags/',
+    '/api/ingredients/?name=мол',
+    '/api/users/subscriptions/'))
+def test_browse_reads_use_replica(reads, user_client, url):
+    assert user_client.get(url).status_code == 200
+    assert reads == ['default']
+    assert replicas.ReplicaRouter().db_for_read(Recipe) is None
+
+
+def test_writes_use_primary(reads, user_client, recipe_payload):
+    recipe = Recipe.objects.first()
+    assert user_client.get(f'/api/recipes/{recipe.id}/').status_code == 200
+    response = user_client.post(
+        '/api/recipes/', recipe_payload(), format='json')
+    assert response.status_code == 201, response.data
+    assert reads == ['default']
+
+
+def test_user_pinned_after_write(reads, user_client, guest_client, reader):
+    recipe = Recipe.objects.exclude(favorite_recipe__user=reader).first()
+    response = user_client.post(f'/api/recipes/{recipe.id}/favorite/')
+    assert response.status_code == 200
+    assert replicas.is_pinned(reader.id)
+    assert user_client.get('/api/recipes/?is_favorited=1').status_code == 200
+    assert guest_client.get('/api/recipes/').status_code == 200
+    # Only the guest read from the replica.
+    assert reads == ['default']
+
+
+def test_failed_write_does_not_pin(reads, user_client, reader):
+    recipe = Favorite.objects.filter(user=reader).first().recipe
+    response = user_client.post(f'/api/recipes/{recipe.id}/favorite/')
+    assert response.status_code == 400
+    assert not replicas.is_pinned(reader.id)
+
+
+def test_no_pin_without_replicas(user_client, reader):
+    recipe = Recipe.objects.exclude(favorite_recipe__user=reader).first()
+    response = user_client.post(f'/api/recipes/{recipe.id}/favorite/')
+    assert response.status_code == 200
+    assert not replicas.is_pinned(reader.id)
+
+
+@pytest.fixture
+def routed(monkeypatch):
+    """(model name, alias) of the reads that reached the router."""
+    routes = []
+    db_for_read = replicas.ReplicaRouter.db_for_read
+
+    def spy(self, model, **hints):
+        alias = db_for_read(self, model, **hints)
+        routes.append((model._meta.model_name, alias))
+        return alias
+
+    monkeypatch.setattr(replicas.ReplicaRouter, 'db_for_read', spy)
+    return routes
+
+
+@pytest.mark.parametrize('url', (
+    '/api/recipes/?limit=6',
+    '/api/recipes/?limit=6&page=2',
+    '/api/tags/',
+    '/api/ingredients/?name=мол'))
+def test_cache_fills_read_primary(reads, routed, guest_client, url):
+    assert guest_client.get(url).status_code == 200
+    assert reads == ['default']
+    assert routed
+    assert all(alias is None for _, alias in routed)
+
+
+def test_membership_read_from_primary(reads, routed, user_client):
+    assert user_client.get('/api/recipes/?limit=6').status_code == 200
+    assert ('favorite', None) in routed
+    assert ('recipe', 'default') in routed
+    assert ('favorite', 'default') not in routed
+
+
+def test_stale_documents_rebuilt_from_primary(reads, routed, user_client):
+    Recipe.objects.update(document='')
+    assert user_client.get('/api/recipes/?limit=6').status_code == 200
+    assert ('recipeingredient', None) in routed
+    assert ('recipeingredient', 'default') not in routed
+    assert not Recipe.objects.filter(
+        id__in=Recipe.objects.order_by('-id').values('id')[:6],
+        document='').exists()
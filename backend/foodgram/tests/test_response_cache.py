@@ -0,0 +1,133 @@
+import pytest
+from django.core.management import CommandError, call_command
+from django.test import override_settings
+
+from api import response_cache
+from recipes.models import Favorite, Ingredient, Recipe, RecipeIngredient, User
+
+pytestmark = pytest.mark.django_db
+
+LIST_URL = '/api/recipes/?limit=6&tags=lunch&tags=breakfast'
+
+
+@pytest.fixture
+def recipe():
+    return Recipe.objects.order_by('-id').first()
+
+
+def get(client, url):
+    response = client.get(url)
+    assert response.status_code == 200
+    return response
+
+
+def test_list_served_from_cache(guest_client, measure):
+    assert get(guest_client, LIST_URL)['X-Cache'] == 'MISS'
+    assert get(guest_client, LIST_URL)['X-Cache'] == 'HIT'
+    response, queries = measure(
+        'GET /recipes/ (anonymous, cached)', guest_client, 'get',
+        '/api/recipes/?tags=breakfast&tags=lunch&limit=6', warm=False)
+    assert response['X-Cache'] == 'HIT'
+    assert queries == 0
+    assert response.json() == get(guest_client, LIST_URL).json()
+    assert response_cache.stats() == {'hits': 3, 'misses': 1}
+
+
+def test_list_primes_details(guest_client):
+    results = get(guest_client, LIST_URL).json()['results']
+    for recipe in results:
+        response = get(guest_client, f'/api/recipes/{recipe["id"]}/')
+        assert response['X-Cache'] == 'HIT'
+        assert response.json() == recipe
+
+
+def test_detail_invalidated_by_recipe_change(
+        guest_client, recipe, run_on_commit):
+    url = f'/api/recipes/{recipe.id}/'
+    get(guest_client, url)
+    assert get(guest_client, url)['X-Cache'] == 'HIT'
+    recipe.name = 'Новое название'
+    recipe.save()
+    run_on_commit()
+    response = get(guest_client, url)
+    assert response['X-Cache'] == 'MISS'
+    assert response.json()['name'] == 'Новое название'
+
+
+def test_detail_invalidated_by_related_rows(
+        guest_client, recipe, reader, run_on_commit):
+    url = f'/api/recipes/{recipe.id}/'
+    get(guest_client, url)
+    Favorite.objects.create(user=reader, recipe=recipe)
+    run_on_commit()
+    assert get(guest_client, url).json()['favorites_count'] == (
+        recipe.favorites_count + 1)
+    row = RecipeIngredient.objects.filter(recipe=recipe).first()
+    row.amount = 999
+    row.save()
+    run_on_commit()
+    amounts = {
+        item['id']: item['amount']
+        for item in get(guest_client, url).json()['ingredients']}
+    assert amounts[row.ingredient_id] == 999
+    ingredient = Ingredient.objects.get(id=row.ingredient_id)
+    ingredient.name = 'переименованный'
+    ingredient.save()
+    run_on_commit()
+    names = {
+        item['id']: item['name']
+        for item in get(guest_client, url).json()['ingredients']}
+    assert names[row.ingredient_id] == 'переименованный'
+
+
+def test_detail_invalidated_by_author_change(
+        guest_client, recipe, run_on_commit):
+    url = f'/api/recipes/{recipe.id}/'
+    get(guest_client, url)
+    author = User.objects.get(id=recipe.author_id)
+    author.first_name = 'Переименован'
+    author.save(update_fields=['first_name'])
+    run_on_commit()
+    assert get(guest_client, url).json()['author']['first_name'] == (
+        'Переименован')
+
+
+def test_list_invalidated_by_new_recipe(guest_client, reader, run_on_commit):
+    url = '/api/recipes/?limit=1'
+    get(guest_client, url)
+    recipe = Recipe.objects.create(
+        author=reader, name='Свежий рецепт', text='x', cooking_time=5)
+    run_on_commit()
+    response = get(guest_client, url)
+    assert response.json()['results'][0]['id'] == recipe.id
+
+
+def test_only_anonymous_requests_are_cached(user_client, guest_client):
+    assert 'X-Cache' not in get(user_client, LIST_URL)
+    assert 'X-Cache' not in get(guest_client, '/api/recipes/?search=x')
+
+
+def test_cache_stats_command(guest_client, capsys):
+    get(guest_client, '/api/recipes/?limit=1')
+    with override_settings(CACHE_SHARED=False):
+        with pytest.raises(CommandError):
+            call_command('cache_stats')
+    call_command('cache_stats')
+    assert 'hits 0, misses 1' in capsys.readouterr().out
+
+
+def test_entries_kept_per_host(guest_client, recipe):
+    url = f'/api/recipes/{recipe.id}/'
+    response = guest_client.get(url, HTTP_HOST='internal:8000')
+    assert response.json()['image'].startswith('http://internal:8000/')
+    response = guest_client.get(url, HTTP_HOST='foodgram.example')
+    assert response['X-Cache'] == 'MISS'
+    assert response.json()['image'].startswith('http://foodgram.example/')
+    guest_client.get('/api/recipes/?limit=6', HTTP_HOST='internal:8000')
+    response = guest_client.get(
+        '/api/recipes/?limit=6', HTTP_HOST='foodgram.example')
+    for result in response.json()['results']:
+        assert result['image'].startswith('http://foodgram.example/')
+    response = guest_client.get(url, HTTP_HOST='foodgram.example')
+    assert response['X-Cache'] == 'HIT'
+    assert response.json()['image'].startswith('http://foodgram.example/')
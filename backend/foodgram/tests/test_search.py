@@ -0,0 +1,101 @@
+import pytest
+from django.db import connection
+
+from recipes.models import Ingredient, Recipe, RecipeIngredient
+from recipes.search import search_recipes
+
+pytestmark = pytest.mark.django_db
+
+postgresql = pytest.mark.skipif(
+    connection.vendor != 'postgresql',
+    reason='Full-text search needs PostgreSQL')
+
+
+@pytest.fixture
+def pies(reader):
+    ingredient = Ingredient.objects.create(
+        name='антоновка', measurement_unit='г')
+    in_name = Recipe.objects.create(
+        author=reader, name='шарлотка с корицей', text='Пирог',
+        cooking_time=50)
+    in_text = Recipe.objects.create(
+        author=reader, name='Пирог', text='почти шарлотка', cooking_time=40)
+    RecipeIngredient.objects.bulk_create(
+        RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=300)
+        for recipe in (in_name, in_text))
+    return in_name, in_text
+
+
+def found(client, query):
+    response = client.get(f'/api/recipes/?search={query}&limit=50')
+    assert response.status_code == 200
+    return [recipe['id'] for recipe in response.json()['results']]
+
+
+def test_name_matches_rank_first(guest_client, pies):
+    in_name, in_text = pies
+    assert found(guest_client, 'шарлотка') == [in_name.id, in_text.id]
+
+
+def test_ingredient_names_are_searched(guest_client, pies):
+    assert sorted(found(guest_client, 'антоновка')) == sorted(
+        recipe.id for recipe in pies)
+
+
+def test_every_word_must_match(guest_client, pies):
+    in_name, _ = pies
+    assert found(guest_client, 'шарлотка корицей') == [in_name.id]
+    assert found(guest_client, 'шарлотка ваниль') == []
+
+
+def test_search_is_paged_by_number(guest_client, pies):
+    response = guest_client.get(
+        '/api/recipes/?search=шарлотка&pagination=cursor&limit=1')
+    data = response.json()
+    assert data['count'] == 2
+    assert 'page=2' in data['next']
+
+
+def matching(query):
+    return list(search_recipes(
+        Recipe.objects.all(), query).values_list('id', flat=True))
+
+
+@postgresql
+def test_ranked_by_weight(guest_client, pies, reader):
+    in_name, in_text = pies
+    ingredient = Ingredient.objects.create(
+        name='шарлотка', measurement_unit='г')
+    in_ingredients = Recipe.objects.create(
+        author=reader, name='Пирог с яблоками', text='Пирог',
+        cooking_time=30)
+    RecipeIngredient.objects.create(
+        recipe=in_ingredients, ingredient=ingredient, amount=1)
+    # Name, then ingredient names, then text; words are stemmed.
+    assert found(guest_client, 'шарлотки') == [
+        in_name.id, in_ingredients.id, in_text.id]
+
+
+@postgresql
+def test_websearch_syntax(guest_client, pies):
+    in_name, in_text = pies
+    assert found(guest_client, 'шарлотка -корицей') == [in_text.id]
+    assert found(guest_client, '"шарлотка с корицей"') == [in_name.id]
+
+
+@postgresql
+def test_vector_follows_ingredient_rows(pies):
+    in_name, in_text = pies
+    vanilla = Ingredient.objects.create(name='ваниль', measurement_unit='г')
+    RecipeIngredient.objects.create(
+        recipe=in_name, ingredient=vanilla, amount=5)
+    assert matching('ваниль') == [in_name.id]
+    RecipeIngredient.objects.filter(ingredient=vanilla).delete()
+    assert matching('ваниль') == []
+    Ingredient.objects.filter(name='антоновка').update(name='ранет')
+    assert matching('антоновка') == []
+    assert sorted(matching('ранет')) == sorted((in_name.id, in_text.id))
+    RecipeIngredient.objects.filter(recipe=in_text).update(
+        ingredient=vanilla)
+    assert matching('ранет') == [in_name.id]
+    assert matching('ваниль') == [in_text.id]
@@ -0,0 +1,66 @@
+import pytest
+from django.core.management import CommandError, call_command
+from django.db import transaction
+
+from recipes import carts, counters
+from recipes.models import Favorite, Recipe, Subscribe, User
+
+pytestmark = pytest.mark.django_db
+
+OPTIONS = {'users': 30, 'recipes': 60, 'batch_size': 16}
+
+
+def snapshot():
+    return (
+        sorted(Recipe.objects.filter(
+            author__username__startswith='seed').values_list(
+                'author__username', 'name', 'cooking_time')),
+        sorted(Favorite.objects.filter(
+            user__username__startswith='seed').values_list(
+                'user__username', 'recipe__name')),
+        sorted(Subscribe.objects.filter(
+            subscriber__username__startswith='seed').values_list(
+                'subscriber__username', 'author__username')))
+
+
+def seed(**options):
+    with transaction.atomic():
+        call_command('seed_load_data', **OPTIONS, **options)
+        data = snapshot()
+        assert not carts.verify()
+        assert counters.reconcile(fix=False) == ([], [])
+        transaction.set_rollback(True)
+    return data
+
+
+def test_seed_is_reproducible():
+    recipes, favorites, subscriptions = seed(seed=3)
+    assert len(recipes) == OPTIONS['recipes']
+    assert favorites and subscriptions
+    assert all(user != author for user, author in subscriptions)
+    assert seed(seed=3) == (recipes, favorites, subscriptions)
+    assert seed(seed=4) != (recipes, favorites, subscriptions)
+
+
+def test_seed_refuses_existing_users():
+    User.objects.create_user(username='seed7_0', password='password')
+    with pytest.raises(CommandError):
+        call_command('seed_load_data', seed=7, **OPTIONS)
+
+
+def test_seeds_add_up():
+    call_command('seed_load_data', seed=5, **OPTIONS)
+    call_command('seed_load_data', seed=6, **OPTIONS)
+    assert Recipe.objects.filter(
+        author__username__startswith='seed').count() == 2 * OPTIONS['recipes']
+
+
+def test_failed_seed_leaves_nothing(monkeypatch):
+    def fail(*args, **kwargs):
+        raise RuntimeError
+
+    monkeypatch.setattr(counters, 'reconcile', fail)
+    with pytest.raises(RuntimeError):
+        call_command('seed_load_data', seed=8, **OPTIONS)
+    assert not User.objects.filter(username__startswith='seed8_').exists()
+    assert not Recipe.objects.filter(name__startswith='Рецепт 8-').exists()
@@ -0,0 +1,131 @@
+import pytest
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.db.models import F
+from django.test.utils import CaptureQueriesContext
+
+from recipes import carts
+from recipes.models import Recipe, Shopping, ShoppingIngredient, User
+
+pytestmark = pytest.mark.django_db
+
+
+def summary(client):
+    response = client.get('/api/recipes/shopping_cart_summary/')
+    assert response.status_code == 200
+    return {item['id']: item['amount'] for item in response.data}
+
+
+def test_summary_matches_carts(user_client):
+    assert summary(user_client)
+    assert not carts.verify()
+
+
+def test_toggle_updates_totals(user_client, reader):
+    recipe = Recipe.objects.exclude(shopping_recipe__user=reader).first()
+    before = summary(user_client)
+    user_client.post(f'/api/recipes/{recipe.id}/shopping_cart/')
+    after = summary(user_client)
+    for ingredient_id, amount in carts.recipe_amounts(recipe).items():
+        assert after[ingredient_id] == before.get(ingredient_id, 0) + amount
+    user_client.delete(f'/api/recipes/{recipe.id}/shopping_cart/')
+    assert summary(user_client) == before
+    assert not carts.verify()
+
+
+def test_recipe_edit_and_delete_update_totals(reader):
+    recipe = Recipe.objects.filter(shopping_recipe__user=reader).first()
+    old_amounts = carts.recipe_amounts(recipe)
+    row = recipe.recipe_ingredient_recipe.all()[0]
+    row.amount += 7
+    row.save()
+    assert carts.verify()
+    carts.recipe_changed(recipe, old_amounts, carts.recipe_amounts(recipe))
+    assert not carts.verify()
+    recipe.delete()
+    assert not carts.verify()
+
+
+def test_rebuild_command(reader):
+    ShoppingIngredient.objects.filter(user=reader).delete()
+    call_command('rebuild_shopping_carts', verify=True)
+    assert carts.verify()
+    call_command('rebuild_shopping_carts')
+    assert not carts.verify()
+
+
+def test_rebuild_for_user_sharing_recipes(reader):
+    recipe = Recipe.objects.filter(shopping_recipe__user=reader).first()
+    other = User.objects.create_user(
+        username='other', email='other@foodgram.ru', password='other')
+    Shopping.objects.create(user=other, recipe=recipe)
+    carts.add_recipe(other, recipe)
+    expected = carts.stored_totals([reader.id])
+    ShoppingIngredient.objects.filter(user=reader).delete()
+    assert carts.verify([reader.id])
+    call_command('rebuild_shopping_carts', users=[reader.id])
+    assert carts.stored_totals([reader.id]) == expected
+    assert not carts.verify([reader.id])
+    assert not carts.verify()
+
+
+def test_recipe_edit_updates_carts_in_batches(reader, monkeypatch):
+    monkeypatch.setattr(carts, 'BATCH_SIZE', 2)
+    recipe = Recipe.objects.filter(shopping_recipe__user=reader).first()
+    for idx in range(4):
+        user = User.objects.create_user(
+            username=f'holder{idx}', email=f'holder{idx}@foodgram.ru',
+            password='holder')
+        Shopping.objects.create(user=user, recipe=recipe)
+        carts.add_recipe(user, recipe)
+    old_amounts = carts.recipe_amounts(recipe)
+    recipe.recipe_ingredient_recipe.update(amount=F('amount') + 3)
+    with CaptureQueriesContext(connection) as context:
+        carts.recipe_changed(
+            recipe, old_amounts, carts.recipe_amounts(recipe))
+    # 5 cart holders are loaded 2 at a time.
+    assert len([
+        query for query in context.captured_queries
+        if query['sql'].startswith('SELECT')
+        and 'recipes_shoppingingredient' in query['sql']]) == 3
+    assert not carts.verify()
+
+
+def test_lost_insert_race_retried(reader, monkeypatch):
+    recipe = Recipe.objects.exclude(shopping_recipe__user=reader).first()
+    bulk_create = ShoppingIngredient.objects.bulk_create
+    calls = []
+
+    def racing_bulk_create(objs, **kwargs):
+        calls.append(len(objs))
+        if len(calls) == 1:
+            raise IntegrityError('duplicate key')
+        return bulk_create(objs, **kwargs)
+
+    monkeypatch.setattr(
+        ShoppingIngredient.objects, 'bulk_create', racing_bulk_create)
+    Shopping.objects.create(user=reader, recipe=recipe)
+    carts.add_recipe(reader, recipe)
+    assert len(calls) == 2
+    assert not carts.verify([reader.id])
+
+
+@pytest.mark.parametrize('method', ('post', 'delete'))
+def test_cart_change_locks_recipe(user_client, reader, monkeypatch, method):
+    recipe = Recipe.objects.exclude(shopping_recipe__user=reader).first()
+    if method == 'delete':
+        Shopping.objects.create(user=reader, recipe=recipe)
+    locked = []
+    lock_recipe = carts.lock_recipe
+
+    def spy(locked_recipe):
+        locked.append(locked_recipe.id)
+        return lock_recipe(locked_recipe)
+
+    monkeypatch.setattr(carts, 'lock_recipe', spy)
+    getattr(user_client, method)(f'/api/recipes/{recipe.id}/shopping_cart/')
+    assert locked == [recipe.id]
+    locked.clear()
+    recipe_id = recipe.id
+    recipe.delete()
+    assert locked == [recipe_id]
@@ -0,0 +1,75 @@
+import os
+
+import pytest
+from django.conf import settings as django_settings
+
+from api import shopping
+from recipes import carts
+from recipes.models import Recipe, Shopping
+
+pytestmark = pytest.mark.django_db
+
+URL = '/api/recipes/download_shopping_cart/'
+
+
+def download(client, file_format):
+    response = client.get(f'{URL}?type={file_format}')
+    assert response.status_code == 200
+    return b''.join(response.streaming_content)
+
+
+@pytest.mark.parametrize('file_format, content_type, start', (
+    ('txt', 'text/plain', 'Список покупок'.encode()),
+    ('csv', 'text/csv', '﻿#,Наименование'.encode()),
+    ('pdf', 'application/pdf', b'%PDF'),
+))
+def test_formats(user_client, file_format, content_type, start):
+    response = user_client.get(f'{URL}?type={file_format}')
+    assert response.status_code == 200
+    assert response['Content-Type'].startswith(content_type)
+    assert b''.join(response.streaming_content).startswith(start)
+
+
+def test_unknown_format(user_client):
+    assert user_client.get(f'{URL}?type=doc').status_code == 400
+
+
+def test_cached_until_cart_changes(
+        user_client, reader, django_assert_max_num_queries):
+    first = download(user_client, 'txt')
+    with django_assert_max_num_queries(2):
+        assert download(user_client, 'txt') == first
+    recipe = Recipe.objects.exclude(shopping_recipe__user=reader).first()
+    Shopping.objects.create(user=reader, recipe=recipe)
+    carts.add_recipe(reader, recipe)
+    assert download(user_client, 'txt') != first
+
+
+def test_x_accel_redirect(user_client, settings):
+    settings.SHOPPING_LIST_X_ACCEL_PREFIX = '/protected/shopping_lists/'
+    response = user_client.get(URL)
+    assert response['X-Accel-Redirect'].startswith(
+        '/protected/shopping_lists/')
+    assert not response.content
+
+
+def test_download_survives_file_removal(user_client, reader, monkeypatch):
+    first = download(user_client, 'txt')
+    _, file = shopping.open_shopping_list(reader, 'txt')
+    os.remove(file.name)
+    assert b''.join(shopping.read_chunks(file)) == first
+    # Nothing can be opened: the list is rendered in memory.
+    monkeypatch.setattr(shopping, 'render', lambda *args: None)
+    assert download(user_client, 'txt') == first
+
+
+def test_replaced_rendering_kept_for_downloads(user_client, reader):
+    download(user_client, 'txt')
+    name, file = shopping.open_shopping_list(reader, 'txt')
+    file.close()
+    recipe = Recipe.objects.exclude(shopping_recipe__user=reader).first()
+    Shopping.objects.create(user=reader, recipe=recipe)
+    carts.add_recipe(reader, recipe)
+    download(user_client, 'txt')
+    assert os.path.exists(
+        os.path.join(django_settings.SHOPPING_LIST_CACHE_DIR, name))
@@ -0,0 +1,26 @@
+import pytest
+
+from recipes.models import Recipe
+
+pytestmark = pytest.mark.django_db
+
+URL = '/api/users/subscriptions/'
+
+
+def test_recipes_limit_takes_newest_recipes(user_client):
+    response = user_client.get(f'{URL}?limit=20&recipes_limit=2')
+    assert response.status_code == 200
+    assert response.data['results']
+    for author in response.data['results']:
+        expected = list(Recipe.objects.filter(
+            author_id=author['id']).order_by('-id').values_list(
+                'id', flat=True)[:2])
+        assert [recipe['id'] for recipe in author['recipes']] == expected
+        assert author['is_subscribed'] is True
+
+
+@pytest.mark.parametrize('value', ('0', '-1', 'abc'))
+def test_invalid_recipes_limit(user_client, value):
+    response = user_client.get(f'{URL}?recipes_limit={value}')
+    assert response.status_code == 400
+    assert 'recipes_limit' in response.data
@@ -0,0 +1,39 @@
+import pytest
+
+from recipes.models import Recipe
+
+pytestmark = pytest.mark.django_db
+
+URL = '/api/recipes/?tags=breakfast&tags=lunch&limit=100'
+
+
+def ids(response):
+    assert response.status_code == 200
+    return [recipe['id'] for recipe in response.json()['results']]
+
+
+def test_any_of_tags_without_duplicates(guest_client):
+    response = guest_client.get(URL)
+    expected = set(Recipe.objects.filter(
+        tags__slug__in=['breakfast', 'lunch']).values_list('id', flat=True))
+    found = ids(response)
+    assert len(found) == len(set(found))
+    assert set(found) == expected
+    assert response.json()['count'] == len(expected)
+
+
+def test_all_of_tags(guest_client):
+    response = guest_client.get(URL + '&tags_mode=all')
+    expected = set(Recipe.objects.filter(
+        tags__slug='breakfast').filter(
+            tags__slug='lunch').values_list('id', flat=True))
+    assert expected
+    assert set(ids(response)) == expected
+    assert response.json()['count'] == len(expected)
+
+
+def test_tag_filter_validation(guest_client):
+    assert guest_client.get(
+        '/api/recipes/?tags=unknown').status_code == 400
+    assert guest_client.get(
+        URL + '&tags_mode=some').status_code == 400
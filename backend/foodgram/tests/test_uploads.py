@@ -0,0 +1,83 @@
+import io
+
+import pytest
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
+from PIL import Image
+
+from recipes.models import ImageUpload, Recipe
+
+pytestmark = pytest.mark.django_db
+
+URL = '/api/recipes/images/'
+
+
+def image_file(size=(640, 480), file_format='JPEG'):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, '#E26C2D').save(buffer, file_format)
+    return SimpleUploadedFile(
+        f'photo.{file_format.lower()}', buffer.getvalue(),
+        content_type=f'image/{file_format.lower()}')
+
+
+def upload(client, file):
+    return client.post(URL, {'image': file}, format='multipart')
+
+
+def test_upload_returns_token(user_client, reader):
+    response = upload(user_client, image_file())
+    assert response.status_code == 201, response.data
+    data = response.json()
+    assert (data['width'], data['height']) == (640, 480)
+    assert ImageUpload.objects.get(
+        token=data['image_token'], user=reader).image.name.endswith('.jpeg')
+
+
+def test_upload_requires_auth(guest_client):
+    assert upload(guest_client, image_file()).status_code == 401
+
+
+@override_settings(IMAGE_UPLOAD_MAX_SIZE=1024)
+def test_upload_size_limit(user_client):
+    response = upload(user_client, image_file(file_format='PNG'))
+    assert response.status_code == 413
+    assert not ImageUpload.objects.exists()
+
+
+@override_settings(IMAGE_UPLOAD_MAX_PIXELS=100 * 100)
+def test_upload_pixel_limit(user_client):
+    assert upload(user_client, image_file()).status_code == 400
+
+
+def test_upload_rejects_other_files(user_client):
+    response = upload(user_client, SimpleUploadedFile('photo.jpg', b'x' * 99))
+    assert response.status_code == 400
+    response = upload(user_client, image_file(file_format='GIF'))
+    assert response.status_code == 400
+
+
+def test_recipe_with_image_token(user_client, recipe_payload):
+    token = upload(user_client, image_file()).json()['image_token']
+    payload = recipe_payload(name='Рецепт с загрузкой')
+    del payload['image']
+    response = user_client.post(
+        '/api/recipes/', dict(payload, image_token=token), format='json')
+    assert response.status_code == 201, response.data
+    recipe = Recipe.objects.get(id=response.json()['id'])
+    assert recipe.image.name.endswith('.jpeg')
+    assert not ImageUpload.objects.filter(token=token).exists()
+    # A token is used once.
+    response = user_client.post(
+        '/api/recipes/',
+        dict(payload, name='Ещё рецепт', image_token=token),
+        format='json')
+    assert response.status_code == 400
+    assert 'image_token' in response.json()
+
+
+def test_recipe_needs_an_image(user_client, recipe_payload):
+    payload = recipe_payload()
+    del payload['image']
+    response = user_client.post('/api/recipes/', payload, format='json')
+    assert response.status_code == 400
+    assert 'image' in response.json()
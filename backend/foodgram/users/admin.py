@@ -4,8 +4,10 @@ from django.contrib.auth.admin import UserAdmin as DjangoUserAdmin
 from django.contrib.auth.models import Group
 
 User = get_user_model()
-from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                            RecipeTag, Shopping, Subscribe, Tag)
+from recipes import images
+from recipes.models import (Favorite, ImageUpload, Ingredient, Recipe,
+                            RecipeIngredient, RecipeTag, Shopping,
+                            ShoppingIngredient, Subscribe, Tag)
 from users.forms import TagForm
 
 admin.site.unregister(Group)
@@ -64,6 +66,18 @@ class ShoppingAdmin(admin.ModelAdmin):
     pass
 
 
+@admin.register(ImageUpload)
+class ImageUploadAdmin(admin.ModelAdmin):
+    list_display = ('token', 'user', 'width', 'height', 'created')
+    list_filter = ('user',)
+
+
+@admin.register(ShoppingIngredient)
+class ShoppingIngredientAdmin(admin.ModelAdmin):
+    list_display = ('user', 'ingredient', 'amount')
+    list_filter = ('user',)
+
+
 @admin.register(RecipeIngredient)
 class RecipeIngredientAdmin(admin.ModelAdmin):
     list_display = ('recipe', 'ingredient', 'amount')
@@ -84,8 +98,9 @@ class RecipeAdmin(admin.ModelAdmin):
         'text',
         'cooking_time',
         'image',
-        'cnt_favorite')
-    readonly_fields = ('cnt_favorite',)
+        'cnt_favorite',
+        'in_carts_count')
+    readonly_fields = ('cnt_favorite', 'in_carts_count')
     fieldsets = (
         (
             None, {
@@ -108,7 +123,13 @@ class RecipeAdmin(admin.ModelAdmin):
     list_filter = ('author',)
 
     def cnt_favorite(self, obj):
-        return Favorite.objects.filter(recipe=obj).count()
+        return obj.favorites_count
+    cnt_favorite.admin_order_field = 'favorites_count'
+
+    def save_model(self, request, obj, form, change):
+        super(RecipeAdmin, self).save_model(request, obj, form, change)
+        if 'image' in form.changed_data:
+            images.schedule(obj)
 
 
 @admin.register(Tag)